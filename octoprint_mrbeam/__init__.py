@@ -16,7 +16,7 @@ from subprocess import check_output
 
 import octoprint.plugin
 import requests
-from flask import request, jsonify, make_response, url_for
+from flask import request, jsonify, make_response, url_for, send_file
 from flask.ext.babel import gettext
 from octoprint.filemanager import ContentTypeDetector, ContentTypeMapping
 from octoprint.server import NO_CONTENT
@@ -34,6 +34,7 @@ from octoprint_mrbeam.iobeam.temperature_manager import temperatureManager
 from octoprint_mrbeam.iobeam.dust_manager import dustManager
 from octoprint_mrbeam.analytics.analytics_handler import analyticsHandler
 from octoprint_mrbeam.analytics.usage_handler import usageHandler
+from octoprint_mrbeam.conversion_queue import ConversionQueue, ConversionJob
 from octoprint_mrbeam.led_events import LedEventListener
 from octoprint_mrbeam.mrbeam_events import MrBeamEvents
 from octoprint_mrbeam.mrb_logger import init_mrb_logger, mrb_logger
@@ -86,6 +87,10 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 
 	BOOT_GRACE_PERIOD = 10.0
 
+	CONVERSION_START_TIMEOUT = 60
+	CONVERSION_JOB_TIMEOUT = 60 * 60
+	CONVERSION_PROFILES_KEPT = 20
+
 
 	def __init__(self):
 		self._slicing_commands = dict()
@@ -94,6 +99,10 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 		self._cancelled_jobs_mutex = threading.Lock()
 		self._CONVERSION_PARAMS_PATH = "/tmp/conversion_parameters.json"  # TODO add proper path there
 		self._cancel_job = False
+		self._conversion_cache = None
+		self._fragment_cache = None
+		self._image_store = None
+		self._conversion_queue = None
 		self.print_progress_last = -1
 		self.slicing_progress_last = -1
 		self._logger = mrb_logger("octoprint.plugins.mrbeam")
@@ -143,6 +152,7 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 		self._ioBeam = ioBeamHandler(self._event_bus, self._settings.get(["dev", "sockets", "iobeam"]))
 		self._temperatureManager = temperatureManager()
 		self._dustManager = dustManager()
+		self._conversion_queue = ConversionQueue()
 
 
 	def _do_initial_log(self):
@@ -215,6 +225,17 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 			terminal=False,
 			vorlon=False,
 			converter_min_required_disk_space=100 * 1024 * 1024, # 100MB, in theory 371MB is the maximum expected file size for full working area engraving at highest resolution.
+			converter_workers=1, # worker processes for raster conversion. 1 converts serially.
+			converter_two_opt=False, # refine the travel optimized path order with 2-opt. Slower conversion, shorter jobs.
+			converter_simplify_tolerance=0, # mm, merges vector segments deviating less than this. 0 disables simplification.
+			converter_cache_max_size=500 * 1024 * 1024, # bytes, repeated conversions of the same design and params are served from this cache. 0 disables it.
+			converter_fragment_cache_max_size=200 * 1024 * 1024, # bytes, gcode of unchanged elements is reused when an edited design is converted. 0 disables it.
+			converter_image_store_max_size=200 * 1024 * 1024, # bytes, raster images uploaded for conversion
+			converter_streaming_parse=False, # parse svgs incrementally and keep embedded image data on disk until rasterized. Lowers peak memory.
+			converter_profile=True, # write per stage timings of each conversion to analytics and to conversion_profiles/ in the plugin data folder
+			converter_while_lasering=False, # allow conversions while lasering. They run in a niced, throttled background process.
+			converter_background_nice=19, # niceness of the background conversion process
+			converter_background_cpu_budget=0.5, # share of one cpu the background conversion process may use. 0 disables throttling.
 			dev=dict(
 				debug=False, # deprected
 				terminalMaxLines = 2000,
@@ -311,6 +332,7 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 		self._lid_handler.shutdown()
 		self._temperatureManager.shutdown()
 		self._dustManager.shutdown()
+		self._conversion_queue.shutdown()
 		time.sleep(2)
 		self._logger.info("Mr Beam Plugin stopped.")
 
@@ -1103,10 +1125,17 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 
 		if command == "convert":
 			# TODO stripping non-ascii is a hack - svg contains lots of non-ascii in <text> tags. Fix this!
-			svg = ''.join(i for i in data['svg'] if ord(i) < 128)  # strip non-ascii chars like €
+			svg = data['svg'].encode('ascii', 'ignore')  # strip non-ascii chars like €
 			del data['svg']
 			filename = target + "/temp.svg"
 
+			try:
+				priority = int(data.pop('priority', 0) or 0)
+			except (TypeError, ValueError):
+				return make_response("Invalid priority, expected an integer", 400)
+			# a new design supersedes all pending conversions unless the client says otherwise
+			supersede = data.pop('supersede', True)
+
 			class Wrapper(object):
 				def __init__(self, filename, content):
 					self.filename = filename
@@ -1117,13 +1146,11 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 						d.write(self.content)
 						d.close()
 
-			fileObj = Wrapper(filename, svg)
-			self._file_manager.add_file(target, filename, fileObj, links=None, allow_overwrite=True)
-
 			slicer = "svgtogcode"
 			slicer_instance = self._slicing_manager.get_slicer(slicer)
 			if slicer_instance.get_slicer_properties()["same_device"] and (
-						self._printer.is_printing() or self._printer.is_paused()):
+						self._printer.is_printing() or self._printer.is_paused()) and \
+					not self._settings.get_boolean(['converter_while_lasering']):
 				# slicer runs on same device as OctoPrint, slicing while printing is hence disabled
 				msg = "Cannot convert while lasering due to performance reasons".format(**locals())
 				self._logger.error("gcodeConvertCommand: %s", msg)
@@ -1137,10 +1164,11 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 				name, _ = os.path.splitext(filename)
 				gcode_name = name + ".gco"
 
-			# append number if file exists
+			# append number if file exists or is the result of another queued conversion
 			name, ext = os.path.splitext(gcode_name)
+			pending_names = [job.name for job in self._conversion_queue.get_jobs() if not job.is_cancelled()]
 			i = 1
-			while self._file_manager.file_exists(target, gcode_name):
+			while self._file_manager.file_exists(target, gcode_name) or gcode_name in pending_names:
 				gcode_name = name + '.' + str(i) + ext
 				i += 1
 
@@ -1160,12 +1188,6 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 			overrides['vector'] = data['vector']
 			overrides['raster'] = data['raster']
 
-			with open(self._CONVERSION_PARAMS_PATH, 'w') as outfile:
-				json.dump(data, outfile)
-				self._logger.info('Wrote job parameters to %s', self._CONVERSION_PARAMS_PATH)
-
-			self._printer.set_colors(currentFilename, data['vector'])
-
 			# callback definition
 			def slicing_done(target, gcode_name, select_after_slicing, print_after_slicing, append_these_files):
 				# append additioal gcodes
@@ -1186,7 +1208,17 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 					filenameToSelect = self._file_manager.path_on_disk(target, gcode_name)
 					printer.select_file(filenameToSelect, sd, True)
 
-			try:
+			# runs in the worker thread of the conversion queue, do_slice() finishes the job
+			def run_conversion(job):
+				fileObj = Wrapper(filename, svg)
+				self._file_manager.add_file(target, filename, fileObj, links=None, allow_overwrite=True)
+
+				with open(self._CONVERSION_PARAMS_PATH, 'w') as outfile:
+					json.dump(dict(data, conversion_job_id=job.id, gcode_path=self._file_manager.path_on_disk(target, gcode_name)), outfile)
+					self._logger.info('Wrote job parameters to %s', self._CONVERSION_PARAMS_PATH)
+
+				self._printer.set_colors(currentFilename, data['vector'])
+
 				self._file_manager.slice(slicer, target, filename, target, gcode_name,
 										 profile=None,#profile,
 										 printer_profile_id=None, #printerProfile,
@@ -1195,15 +1227,24 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 										 callback=slicing_done,
 										 callback_args=[target, gcode_name, select_after_slicing, print_after_slicing,
 														appendGcodeFiles])
-			except octoprint.slicing.UnknownProfile:
-				msg = "Profile {profile} doesn't exist".format(**locals())
-				self._logger.error("gcodeConvertCommand: %s", msg)
-				return make_response(msg, 400)
+				# do_slice() runs in a thread of the slicing manager, it might fail before it gets to the job
+				if not job.wait_attached(self.CONVERSION_START_TIMEOUT):
+					raise Exception("Conversion job {} not started after {}s".format(job.id, self.CONVERSION_START_TIMEOUT))
+				if not job.wait(self.CONVERSION_JOB_TIMEOUT):
+					raise Exception("Conversion job {} not finished after {}s".format(job.id, self.CONVERSION_JOB_TIMEOUT))
+
+			# uploaded images must not be evicted before the conversion used them
+			image_store = self._get_image_store()
+			image_ids = image_store.get_image_ids(svg)
+			image_store.pin(image_ids)
+			job = self._conversion_queue.submit(run_conversion, priority=priority, name=gcode_name, supersede=supersede,
+			                                    on_done=lambda job: image_store.unpin(image_ids))
 
 			location = "test"  # url_for(".readGcodeFile", target=target, filename=gcode_name, _external=True)
 			result = {
 				"name": gcode_name,
 				"origin": "local",
+				"job": job.get_data(),
 				"refs": {
 					"resource": location,
 					"download": url_for("index", _external=True) + "downloads/files/" + target + "/" + gcode_name
@@ -1216,10 +1257,56 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 
 		return NO_CONTENT
 
+	@octoprint.plugin.BlueprintPlugin.route("/images", methods=["POST"])
+	@restricted_access
+	def uploadImage(self):
+		"""
+		Stores a raster image for conversion, either sent as multipart upload (field "file") or as binary request body.
+		The svg sent to /convert references it by the returned id in the mb:image_id attribute of an <image>.
+		"""
+		store = self._get_image_store()
+		upload_path = "file." + settings().get(["server", "uploads", "pathSuffix"])
+		if upload_path in request.values:
+			image_id = store.add_file(request.values[upload_path], move=True)
+		elif request.mimetype and request.mimetype.startswith("image/"):
+			image_id = store.add_data(request.get_data())
+		else:
+			return make_response("No image in request", 400)
+
+		if image_id is None:
+			return make_response("Not a readable image", 400)
+		return jsonify(dict(id=image_id, url=url_for(".serveImage", image_id=image_id)))
+
+	@octoprint.plugin.BlueprintPlugin.route("/images/<string:image_id>", methods=["GET"])
+	@restricted_access
+	def serveImage(self, image_id):
+		path = self._get_image_store().get_image_path(image_id)
+		if path is None:
+			return make_response("Unknown image", 404)
+		return send_file(path, mimetype=self._get_image_store().get_mimetype(path))
+
 	@octoprint.plugin.BlueprintPlugin.route("/cancel", methods=["POST"])
 	@restricted_access
 	def cancelSlicing(self):
-		self._cancel_job = True
+		job = self._conversion_queue.get_current_job()
+		if job is not None:
+			self._conversion_queue.cancel(job.id)
+		else:
+			self._cancel_job = True
+		return NO_CONTENT
+
+	@octoprint.plugin.BlueprintPlugin.route("/conversions", methods=["GET"])
+	@restricted_access
+	def getConversionJobs(self):
+		return jsonify(dict(jobs=[job.get_data() for job in self._conversion_queue.get_jobs()],
+		                    history=[job.get_data() for job in self._conversion_queue.get_history()],
+		                    stats=self._conversion_queue.get_stats()))
+
+	@octoprint.plugin.BlueprintPlugin.route("/conversions/<string:job_id>", methods=["DELETE"])
+	@restricted_access
+	def cancelConversionJob(self, job_id):
+		if not self._conversion_queue.cancel(job_id):
+			return make_response("Unknown or finished conversion job", 404)
 		return NO_CONTENT
 
 	##~~ SimpleApiPlugin mixin
@@ -1386,31 +1473,40 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 		#params = profile.convert_to_engine2()
 
 		def is_job_cancelled():
-			if self._cancel_job:
+			if self._cancel_job or (job is not None and job.is_cancelled()):
 				self._cancel_job = False
 				self._logger.info("Conversion canceled")
 				raise octoprint.slicing.SlicingCancelled
 
-		# READ PARAMS FROM JSON
-		params = dict()
-		with open(self._CONVERSION_PARAMS_PATH) as data_file:
-			params = json.load(data_file)
-			# self._logger.debug("Read multicolor params %s" % params)
-
-		dest_dir, dest_file = os.path.split(machinecode_path)
-		params['directory'] = dest_dir
-		params['file'] = dest_file
-		params['noheaders'] = "true"  # TODO... booleanify
-
-		if self._settings.get(["debug_logging"]):
-			log_path = homedir + "/.octoprint/logs/svgtogcode.log"
-			params['log_filename'] = log_path
-		else:
-			params['log_filename'] = ''
-
+		job = None
+		job_state = ConversionJob.STATE_FAILED
 		try:
 			from .gcodegenerator.converter import Converter
-			from .gcodegenerator.converter import OutOfSpaceException
+			from .gcodegenerator.converter import OutOfSpaceException, UnknownImageException
+
+			# READ PARAMS FROM JSON
+			params = dict()
+			with open(self._CONVERSION_PARAMS_PATH) as data_file:
+				params = json.load(data_file)
+				# self._logger.debug("Read multicolor params %s" % params)
+
+			# conversions started by /convert run in the conversion queue, which waits for us to take over the job
+			job = self._conversion_queue.get_job(params.pop('conversion_job_id', None))
+			if job is not None and not job.attach():
+				self._logger.warn("Conversion job %s already finished: %s", job.id, job.error)
+				raise octoprint.slicing.SlicingCancelled
+			gcode_path = params.pop('gcode_path', None)
+
+			dest_dir, dest_file = os.path.split(machinecode_path)
+			params['directory'] = dest_dir
+			params['file'] = dest_file
+			params['noheaders'] = "true"  # TODO... booleanify
+
+			if self._settings.get(["debug_logging"]):
+				log_path = homedir + "/.octoprint/logs/svgtogcode.log"
+				params['log_filename'] = log_path
+			else:
+				params['log_filename'] = ''
 
 			is_job_cancelled() #check before conversion started
 
@@ -1418,18 +1514,54 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 			maxWidth = profile['volume']['width']
 			maxHeight = profile['volume']['depth']
 
-			#TODO implement cancelled_Jobs, to check if this particular Job has been canceled
-			#TODO implement check "_cancel_job"-loop inside engine.convert(...), to stop during conversion, too
-			engine = Converter(params, model_path, workingAreaWidth = maxWidth, workingAreaHeight = maxHeight, min_required_disk_space=self._settings.get(['converter_min_required_disk_space']))
+			# everything besides the svg and the profile that changes the gcode
+			converter_params = dict(two_opt=self._settings.get_boolean(['converter_two_opt']),
+			                        simplify_tolerance=self._settings.get_float(['converter_simplify_tolerance']))
+
+			cache = self._get_conversion_cache()
+			cache_key = None
+			if cache is not None:
+				cache_key = cache.get_key(model_path, dict(params, converter=converter_params), version=self._plugin_version, profile=profile)
+				if cache.get(cache_key, machinecode_path):
+					self._logger.info("Conversion served from cache: %s. %s", cache_key, cache.pp())
+					self._report_slicing_progress(on_progress, on_progress_args, on_progress_kwargs, 1.0)
+					job_state = ConversionJob.STATE_DONE
+					return True, None
+
+			# while lasering the conversion must not slow down sending gcode to grbl
+			background = self._settings.get_boolean(['converter_while_lasering']) and (self._printer.is_printing() or self._printer.is_paused())
+
+			engine = Converter(params, model_path, workingAreaWidth = maxWidth, workingAreaHeight = maxHeight,
+			                   min_required_disk_space=self._settings.get(['converter_min_required_disk_space']),
+			                   workers=1 if background else self._settings.get_int(['converter_workers']),
+			                   travel_speed=profile['axes']['x']['speed'],
+			                   streaming=self._settings.get_boolean(['converter_streaming_parse']),
+			                   fragment_cache=self._get_fragment_cache(),
+			                   image_store=self._get_image_store(),
+			                   **converter_params)
+			if background:
+				from .gcodegenerator.background_conversion import BackgroundConversion
+				engine = BackgroundConversion(engine,
+				                              nice=self._settings.get_int(['converter_background_nice']),
+				                              cpu_budget=self._settings.get_float(['converter_background_cpu_budget']))
 			engine.convert(is_job_cancelled, on_progress, on_progress_args, on_progress_kwargs)
 
 			is_job_cancelled() #check if canceled during conversion
 
+			if self._settings.get_boolean(['converter_profile']):
+				self._save_conversion_profile(engine.get_profile(), gcode_path)
+
+			if cache is not None:
+				cache.put(cache_key, machinecode_path)
+				self._logger.info("Conversion added to cache: %s. %s", cache_key, cache.pp())
+
+			job_state = ConversionJob.STATE_DONE
 			return True, None  # TODO add analysis about out of working area, ignored elements, invisible elements, text elements
 		except octoprint.slicing.SlicingCancelled as e:
 			self._logger.info("Conversion cancelled")
+			job_state = ConversionJob.STATE_CANCELLED
 			raise e
-		except OutOfSpaceException as e:
+		except (OutOfSpaceException, UnknownImageException) as e:
 			msg = "{}: {}".format(type(e).__name__, e)
 			self._logger.exception("Conversion failed: {0}".format(msg))
 			return False, msg
@@ -1440,6 +1572,8 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 			return False, "Unknown error, please consult the log file"
 
 		finally:
+			if job is not None:
+				job.finish(job_state)
 			with self._cancelled_jobs_mutex:
 				if machinecode_path in self._cancelled_jobs:
 					self._cancelled_jobs.remove(machinecode_path)
@@ -1449,6 +1583,70 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 
 			self._logger.info("-" * 40)
 
+	def _get_conversion_cache(self):
+		max_size = self._settings.get_int(['converter_cache_max_size'])
+		if not max_size:
+			return None
+		if self._conversion_cache is None:
+			try:
+				from .gcodegenerator.conversion_cache import ConversionCache
+				self._conversion_cache = ConversionCache(os.path.join(self.get_plugin_data_folder(), "conversion_cache"))
+			except Exception:
+				self._logger.exception("Unable to initialize conversion cache")
+				return None
+		# settings might have changed in the meantime
+		self._conversion_cache.max_size = max_size
+		self._conversion_cache.min_free_space = self._settings.get(['converter_min_required_disk_space'])
+		return self._conversion_cache
+
+	def _get_fragment_cache(self):
+		max_size = self._settings.get_int(['converter_fragment_cache_max_size'])
+		if not max_size:
+			return None
+		if self._fragment_cache is None:
+			try:
+				from .gcodegenerator.fragment_cache import FragmentCache
+				self._fragment_cache = FragmentCache(os.path.join(self.get_plugin_data_folder(), "fragment_cache"), namespace=self._plugin_version)
+			except Exception:
+				self._logger.exception("Unable to initialize fragment cache")
+				return None
+		self._fragment_cache.max_size = max_size
+		self._fragment_cache.min_free_space = self._settings.get(['converter_min_required_disk_space'])
+		return self._fragment_cache
+
+	def _get_image_store(self):
+		if self._image_store is None:
+			from .gcodegenerator.image_store import ImageStore
+			self._image_store = ImageStore(os.path.join(self.get_plugin_data_folder(), "images"))
+		self._image_store.max_size = self._settings.get_int(['converter_image_store_max_size'])
+		self._image_store.min_free_space = self._settings.get(['converter_min_required_disk_space'])
+		return self._image_store
+
+	def _save_conversion_profile(self, profile, gcode_path):
+		# profiles of the last CONVERSION_PROFILES_KEPT conversions are kept in the plugin data folder, not next to the gcode
+		if profile is None:
+			return
+		self._analytics_handler.store_conversion_profile(profile)
+		if gcode_path is not None:
+			directory = os.path.join(self.get_plugin_data_folder(), "conversion_profiles")
+			try:
+				if not os.path.isdir(directory):
+					os.makedirs(directory)
+				with open(os.path.join(directory, os.path.basename(gcode_path) + ".profile.json"), 'w') as fh:
+					json.dump(profile, fh, indent=1)
+				paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+				paths.sort(key=os.path.getmtime)
+				for path in paths[:-self.CONVERSION_PROFILES_KEPT]:
+					os.remove(path)
+			except (IOError, OSError) as e:
+				self._logger.warn("Unable to write conversion profile: %s", e)
+
+	def _report_slicing_progress(self, on_progress, on_progress_args, on_progress_kwargs, progress):
+		if on_progress is not None:
+			on_progress_kwargs = dict(on_progress_kwargs or dict())
+			on_progress_kwargs["_progress"] = progress
+			on_progress(*(on_progress_args or ()), **on_progress_kwargs)
+
 	def cancel_slicing(self, machinecode_path):
 		self._logger.info("Canceling Routine: {}".format(machinecode_path))
 		with self._slicing_commands_mutex:
@@ -1597,7 +1795,8 @@ class MrBeamPlugin(octoprint.plugin.SettingsPlugin,
 		)
 
 	def bodysize_hook(self, current_max_body_sizes, *args, **kwargs):
-		return [("POST", r"/convert", 10 * 1024 * 1024)]
+		return [("POST", r"/convert", 10 * 1024 * 1024),
+		        ("POST", r"/images", 30 * 1024 * 1024)]
 
 	def notify_frontend(self, title, text, type=None, sticky=False, replay_when_new_client_connects=False):
 		"""
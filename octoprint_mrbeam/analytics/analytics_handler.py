@@ -274,6 +274,13 @@ class AnalyticsHandler(object):
 		except Exception as e:
 			self._logger.error('Error during store_conversion_details: {}'.format(e.message))
 
+	def store_conversion_profile(self, profile):
+		try:
+			if self._analyticsOn:
+				self._store_conversion_details(ak.CONV_PROFILE, payload=profile)
+		except Exception as e:
+			self._logger.error('Error during store_conversion_profile: {}'.format(e.message))
+
 	def _store_conversion_details(self,eventname,payload=None):
 		data = {
 			ak.SERIALNUMBER: self._getSerialNumber(),
@@ -44,6 +44,7 @@ class AnalyticsKeys(object):
 	COOLING_DONE = 'cooling_done'
 	CONV_ENGRAVE = 'conv_eng'
 	CONV_CUT = 'conv_cut'
+	CONV_PROFILE = 'conv_profile'
 	PRINT_EVENTS = [
 						PRINT_STARTED,
 						PRINT_PROGRESS,
@@ -53,7 +54,8 @@ class AnalyticsKeys(object):
 						PRINT_RESUMED,
 						PRINT_FAILED,
 						CONV_CUT,
-						CONV_ENGRAVE
+						CONV_ENGRAVE,
+						CONV_PROFILE
 					]
 	FAILED_PRINT_EVENTS = [PRINT_CANCELLED,PRINT_FAILED]
 	JOB_DURATION = 'dur'
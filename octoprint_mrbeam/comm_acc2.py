@@ -13,6 +13,11 @@ import datetime
 import serial
 import re
 import Queue
+import collections
+import array
+import bisect
+import io
+import tempfile
 
 from yaml import load as yamlload
 from yaml import dump as yamldump
@@ -85,6 +90,8 @@ class MachineCom(object):
 	COMMAND_FLUSH    = 'FLUSH'
 	COMMAND_SYNC     = 'SYNC' # experimental
 
+	COMMAND_PHASES = ("queuing", "queued", "sending", "sent")
+
 	STATUS_POLL_FREQUENCY_OPERATIONAL = 2.0
 	STATUS_POLL_FREQUENCY_PRINTING = 5.0 # set back top 1.0 if it's not causing gcode24
 	STATUS_POLL_FREQUENCY_PAUSED = 0.2
@@ -98,6 +105,8 @@ class MachineCom(object):
 	pattern_grbl_status = re.compile("<(?P<status>\w+),.*MPos:(?P<mpos_x>[0-9.\-]+),(?P<mpos_y>[0-9.\-]+),.*WPos:(?P<pos_x>[0-9.\-]+),(?P<pos_y>[0-9.\-]+),.*RX:(?P<rx>\d+),.*limits:(?P<limit_x>[x]?)(?P<limit_y>[y]?)z?,.*laser (?P<laser_state>\w+):(?P<laser_intensity>\d+).*>")
 	pattern_grbl_version = re.compile("Grbl (?P<version>\S+)\s.*")
 	pattern_grbl_setting = re.compile("\$(?P<id>\d+)=(?P<value>\S+)\s\((?P<comment>.*)\)")
+	pattern_gcode_command = re.compile("\s*\$?([GM]\d+|[THFSX])")
+	pattern_command_handler = re.compile("_gcode_(?P<gcode>.+)_(?P<phase>queuing|queued|sending|sent)$")
 
 
 	ALARM_CODE_COMMAND_TOO_LONG = "ALARM_CODE_COMMAND_TOO_LONG"
@@ -140,7 +149,7 @@ class MachineCom(object):
 		self._status_polling_timer = None
 		self._status_polling_next_ts = 0
 		self._status_polling_interval = self.STATUS_POLL_FREQUENCY_DEFAULT
-		self._acc_line_buffer = []
+		self._acc_line_buffer = AccLineBuffer(self.WORKING_RX_BUFFER_SIZE)
 		self._last_acknowledged_command = None
 		self._last_wx = -1
 		self._last_wy = -1
@@ -177,10 +186,13 @@ class MachineCom(object):
 		self.grbl_feat_report_rx_buffer_state = False
 
 		# regular expressions
-		self._regex_command = re.compile("^\s*\$?([GM]\d+|[THFSX])")
+		self._regex_eeprom_command = re.compile("\$[0-9]+=.+$")
 		self._regex_feedrate = re.compile("F\d+", re.IGNORECASE)
 		self._regex_intensity = re.compile("S\d+", re.IGNORECASE)
 
+		# command handlers by phase and gcode, e.g. self._command_handlers['sending']['G1']
+		self._command_handlers = self._get_command_handlers()
+
 		self._real_time_commands={'poll_status':False,
 								'feed_hold':False,
 								'cycle_start':False,
@@ -292,17 +304,18 @@ class MachineCom(object):
 				if self.isPrinting() and self._commandQueue.empty():
 					cmd = self._getNext()
 					if cmd is not None:
-						self.sendCommand(cmd)
+						self.sendCommand(cmd, processed=True)
 						self._callback.on_comm_progress()
 					else:
 						if self._finished_passes >= self._passes:
 							if len(self._acc_line_buffer) == 0:
 								self._set_print_finished()
-						self._currentFile.resetToBeginning()
-						cmd = self._getNext()
-						if cmd is not None:
-							self.sendCommand(cmd)
-							self._callback.on_comm_progress()
+						else:
+							self._currentFile.resetToBeginning()
+							cmd = self._getNext()
+							if cmd is not None:
+								self.sendCommand(cmd, processed=True)
+								self._callback.on_comm_progress()
 
 				self._sendCommand()
 				self._send_event.wait(1)
@@ -330,7 +343,7 @@ class MachineCom(object):
 				if self._sync_command_ts <=0:
 					self._sync_command_ts = time.time()
 					self._log("FLUSHing (grbl_state: {}, acc_line_buffer: {}, grbl_rx: {})".format(
-					                  self._grbl_state, sum([len(x) for x in self._acc_line_buffer]), self._grbl_rx_status))
+					                  self._grbl_state, self._acc_line_buffer.get_char_count(), self._grbl_rx_status))
 				if len(self._acc_line_buffer) <= 0:
 					self._cmd = None
 					self._log("FLUSHed ({}ms)".format(int(1000*(time.time() - self._sync_command_ts))))
@@ -345,7 +358,7 @@ class MachineCom(object):
 				if self._sync_command_ts <=0:
 					self._sync_command_ts = time.time()
 					self._log("SYNCing (grbl_state: {}, acc_line_buffer: {}, grbl_rx: {})".format(
-					                  self._grbl_state, sum([len(x) for x in self._acc_line_buffer]), self._grbl_rx_status))
+					                  self._grbl_state, self._acc_line_buffer.get_char_count(), self._grbl_rx_status))
 				if len(self._acc_line_buffer) <= 0 and not self._grbl_state in self.GRBL_SYNC_COMMAND_WAIT_STATES:
 					# Successfully synced, let's move on
 					self._cmd = None
@@ -365,13 +378,13 @@ class MachineCom(object):
 					self._handle_alarm_message("Command too long to send to GRBL.", code=self.ALARM_CODE_COMMAND_TOO_LONG)
 					self._cmd = None
 					return
-				if sum([len(x) for x in self._acc_line_buffer]) + len(my_cmd) +1 < self.WORKING_RX_BUFFER_SIZE:
-					my_cmd, _, _  = self._process_command_phase("sending", my_cmd)
+				if self._acc_line_buffer.fits(len(my_cmd) +1):
+					my_cmd, _, gcode  = self._process_command_phase("sending", my_cmd)
 					self._log("Send: %s" % my_cmd)
 					self._acc_line_buffer.append(my_cmd + '\n')
 					try:
 						self._serial.write(my_cmd + '\n')
-						self._process_command_phase("sent", my_cmd)
+						self._process_command_phase("sent", my_cmd, gcode=gcode)
 						self._cmd = None
 						self._send_event.set()
 					except serial.SerialException:
@@ -379,12 +392,12 @@ class MachineCom(object):
 						self._errorValue = get_exception_string()
 						self.close(True)
 		else:
-			cmd, _, _  = self._process_command_phase("sending", cmd)
+			cmd, _, gcode  = self._process_command_phase("sending", cmd)
 			self._log("Send: %s" % cmd)
 			try:
 
 				self._serial.write(cmd)
-				self._process_command_phase("sent", cmd)
+				self._process_command_phase("sent", cmd, gcode=gcode)
 			except serial.SerialException:
 				self._logger.info("Unexpected error while writing serial port: %s" % (get_exception_string()), terminal_as_comm=True)
 				self._errorValue = get_exception_string()
@@ -463,9 +476,9 @@ class MachineCom(object):
 			ret = self._serial.readline()
 			self._send_event.set()
 			if('ok' in ret or 'error' in ret):
-				if(len(self._acc_line_buffer) > 0):
-					self._last_acknowledged_command = self._acc_line_buffer[0]
-					del self._acc_line_buffer[0]  # Delete the commands character count corresponding to the last 'ok'
+				acknowledged = self._acc_line_buffer.acknowledge()  # the command corresponding to the last 'ok'
+				if acknowledged is not None:
+					self._last_acknowledged_command = acknowledged
 				else:
 					self._logger.error("Received OK but internal _acc_line_buffer counter is empty.")
 		except serial.SerialException:
@@ -671,7 +684,7 @@ class MachineCom(object):
 
 		with self._commandQueue.mutex:
 			self._commandQueue.queue.clear()
-		self._acc_line_buffer = []
+		self._acc_line_buffer.reset()
 		self._send_event.clear(completely=True)
 		self._changeState(self.STATE_LOCKED)
 
@@ -689,7 +702,7 @@ class MachineCom(object):
 			if self.isOperational():
 				errorMsg = "Machine reset."
 				self._cmd = None
-				self._acc_line_buffer = []
+				self._acc_line_buffer.reset()
 				self._pauseWaitStartTime = None
 				self._pauseWaitTimeLost = 0.0
 				self._send_event.clear(completely=True)
@@ -889,19 +902,31 @@ class MachineCom(object):
 				self._logger.info(msg + " - " + log)
 				self._log(msg)
 
+	def _get_command_handlers(self):
+		"""
+		Collects the command handlers _gcode_<gcode>_<phase> of this instance.
+		:return: dict phase -> dict gcode -> bound handler method
+		"""
+		handlers = dict((phase, dict()) for phase in self.COMMAND_PHASES)
+		for name in dir(self):
+			match = self.pattern_command_handler.match(name)
+			if match:
+				handlers[match.group('phase')][match.group('gcode')] = getattr(self, name)
+		return handlers
+
 	def _process_command_phase(self, phase, command, command_type=None, gcode=None):
-		if phase not in ("queuing", "queued", "sending", "sent"):
+		handlers = self._command_handlers.get(phase)
+		if handlers is None:
 			return command, command_type, gcode
 
 		if gcode is None:
 			gcode = self._gcode_command_for_cmd(command)
 
 		# if it's a gcode command send it through the specific handler if it exists
-		if gcode is not None:
-			gcodeHandler = "_gcode_" + gcode + "_" + phase
-			if hasattr(self, gcodeHandler):
-				handler_result = getattr(self, gcodeHandler)(command, cmd_type=command_type)
-				command, command_type, gcode = self._handle_command_handler_result(command, command_type, gcode, handler_result)
+		handler = handlers.get(gcode)
+		if handler is not None:
+			handler_result = handler(command, cmd_type=command_type)
+			command, command_type, gcode = self._handle_command_handler_result(command, command_type, gcode, handler_result)
 
 		# finally return whatever we resulted on
 		return command, command_type, gcode
@@ -926,7 +951,11 @@ class MachineCom(object):
 		if cmd == self.COMMAND_HOLD: return 'Hold'
 		if cmd == self.COMMAND_RESUME: return 'Resume'
 
-		gcode = self._regex_command.search(cmd)
+		# shortcut for the common case of a processed G or M command with a single digit, e.g. G1X10.5S200
+		if cmd[0] in 'GM' and cmd[1:2].isdigit() and not cmd[2:3].isdigit():
+			return cmd[:2]
+
+		gcode = self.pattern_gcode_command.match(cmd)
 		if not gcode:
 			return None
 
@@ -1231,7 +1260,8 @@ class MachineCom(object):
 			# handler returned a tuple of an unexpected length
 			return original_tuple
 
-		gcode = self._gcode_command_for_cmd(command)
+		if command != original_tuple[0]:
+			gcode = self._gcode_command_for_cmd(command)
 		return command, command_type, gcode
 
 	def _set_feedrate_override(self, value):
@@ -1437,7 +1467,7 @@ class MachineCom(object):
 				if not cmd:
 					return
 
-			eepromCmd = re.search("^\$[0-9]+=.+$", cmd)
+			eepromCmd = cmd.startswith('$') and self._regex_eeprom_command.match(cmd)
 			if(eepromCmd and self.isPrinting()):
 				self._log("Warning: Configuration changes during print are not allowed!")
 
@@ -1448,6 +1478,7 @@ class MachineCom(object):
 		if self.isBusy():
 			return
 
+		self._release_current_file()
 		self._currentFile = PrintingGcodeFileInformation(filename)
 		eventManager().fire(OctoPrintEvents.FILE_SELECTED, {
 			"file": self._currentFile.getFilename(),
@@ -1460,12 +1491,20 @@ class MachineCom(object):
 		if self.isBusy():
 			return
 
+		self._release_current_file()
 		self._currentFile = None
 		eventManager().fire(OctoPrintEvents.FILE_DESELECTED)
 		self._callback.on_comm_file_selected(None, None, False)
 
+	def _release_current_file(self):
+		# stops the compilation of the previously selected file and frees its compiled job
+		if self._currentFile is not None:
+			self._currentFile.release()
+
 	def startPrint(self, *args, **kwargs):
-		# TODO implement pos kw argument for resuming prints
+		"""
+		:param pos: (optional) file position to resume the job from
+		"""
 		if not self.isOperational():
 			return
 
@@ -1489,6 +1528,12 @@ class MachineCom(object):
 
 			self._currentFile.start()
 			self._finished_currentFile = False
+			pos = kwargs.get('pos')
+			if pos:
+				resume_commands = self._currentFile.seek(pos)
+				self._logger.info("Resuming job at file position %s: %s", pos, resume_commands)
+				for cmd in resume_commands:
+					self.sendCommand(cmd)
 
 			payload = {
 				"file": self._currentFile.getFilename(),
@@ -1519,7 +1564,7 @@ class MachineCom(object):
 		self._cmd = None
 
 		self._sendCommand(self.COMMAND_RESET)
-		self._acc_line_buffer = []
+		self._acc_line_buffer.reset()
 		self._send_event.clear(completely=True)
 		self._changeState(self.STATE_LOCKED)
 
@@ -1727,6 +1772,7 @@ class MachineCom(object):
 					"mrb_state": _mrbeam_plugin_implementation.get_mrb_state()
 				}
 			eventManager().fire(OctoPrintEvents.PRINT_FAILED, payload)
+		self._release_current_file()
 		eventManager().fire(OctoPrintEvents.DISCONNECTED)
 
 ### MachineCom callback ################################################################################################
@@ -1833,14 +1879,14 @@ class PrintingFileInformation(object):
 
 class PrintingGcodeFileInformation(PrintingFileInformation):
 	"""
-	Encapsulates information regarding an ongoing direct print. Takes care of the needed file handle and ensures
-	that the file is closed in case of an error.
+	Encapsulates information regarding an ongoing direct print. The file is compiled into a CompiledGcodeJob when
+	it gets selected, all passes read from it. A GcodePrefetcher reads the commands of the job ahead.
 	"""
 
 	def __init__(self, filename, offsets_callback=None, current_tool_callback=None):
 		PrintingFileInformation.__init__(self, filename)
 
-		self._handle = None
+		self._reader = None
 
 		self._first_line = None
 
@@ -1853,53 +1899,65 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 		self._size = os.stat(self._filename).st_size
 		self._pos = 0
 		self._comment_size = 0
+		self._job = CompiledGcodeJob(self._filename)
 
 	def start(self):
 		"""
-		Opens the file for reading and determines the file size.
+		Starts reading the job from the beginning.
 		"""
 		PrintingFileInformation.start(self)
-		self._handle = open(self._filename, "r")
+		self.resetToBeginning()
 
 	def close(self):
 		"""
-		Closes the file if it's still open.
+		Stops reading the job.
 		"""
 		PrintingFileInformation.close(self)
-		if self._handle is not None:
-			try:
-				self._handle.close()
-			except:
-				pass
-		self._handle = None
+		if self._reader is not None:
+			self._reader.stop()
+		self._reader = None
+
+	def release(self):
+		"""
+		Stops reading and compiling the job and frees its storage. The file can't be printed afterwards.
+		"""
+		self.close()
+		self._job.release()
 
 	def resetToBeginning(self):
 		"""
-		resets the file handle so you can read from the beginning again.
+		Starts reading the job from the beginning again, e.g. for the next pass.
+		"""
+		self._read_from(0)
+
+	def seek(self, pos):
+		"""
+		Continues reading the job with the command at the given file position.
+		:param pos: file position as reported by getFilepos()
+		:return: list of commands to send before, they restore the state of the machine before this command
 		"""
-		self._handle = open(self._filename, "r")
+		index = self._job.find_index(pos)
+		self._read_from(index)
+		return self._job.get_resume_commands(index)
+
+	def _read_from(self, index):
+		self.close()
+		self._pos = 0
+		self._comment_size = 0
+		self._reader = GcodePrefetcher(self._job, index)
 
 	def getNext(self):
 		"""
 		Retrieves the next line for printing.
 		"""
-		if self._handle is None:
+		reader = self._reader
+		if reader is None:
 			raise ValueError("File %s is not open for reading" % self._filename)
 
 		try:
-			processed = None
-			while processed is None:
-				if self._handle is None:
-					# file got closed just now
-					return None
-				line = self._handle.readline()
-				if not line:
-					self.close()
-				processed = process_gcode_line(line)
-				if processed is None:
-					self._comment_size += len(line)
-			self._pos = self._handle.tell()
-
+			processed, self._pos, self._comment_size = reader.get()
+			if processed is None:
+				self.close()
 			return processed
 		except Exception as e:
 			self.close()
@@ -1907,6 +1965,391 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 			raise e
 
 
+class GcodePrefetcher(object):
+	"""
+	Reads the commands of a CompiledGcodeJob ahead in its own thread, so the sending thread never waits for the
+	compilation or the job's storage. The sending thread gets the commands in chunks from a bounded queue, each
+	command together with the file position after it and the size of the comment and empty lines before it.
+	"""
+
+	CHUNK_SIZE_MIN = 16  # the first chunks are small so sending starts right away
+	CHUNK_SIZE_MAX = 512
+	QUEUE_SIZE = 16  # chunks
+
+	def __init__(self, job, index=0):
+		self._logger = mrb_logger("octoprint.plugins.mrbeam.comm_acc2")
+		self._job = job
+		self._queue = Queue.Queue(maxsize=self.QUEUE_SIZE)
+		self._stopped = threading.Event()
+		self._chunk = []
+		self._index = 0
+		self._thread = threading.Thread(target=self._read, args=(index,), name="comm._prefetching_thread")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def get(self):
+		"""
+		Blocks until the next command is read.
+		:return: tuple (command, pos, skipped), command is None after the last command
+		"""
+		if self._index >= len(self._chunk):
+			chunk = self._queue.get()
+			if isinstance(chunk, Exception):
+				raise chunk
+			self._chunk = chunk
+			self._index = 0
+		item = self._chunk[self._index]
+		self._index += 1
+		return item
+
+	def stop(self):
+		self._stopped.set()
+
+	def _read(self, index):
+		try:
+			chunk_size = self.CHUNK_SIZE_MIN
+			while True:
+				chunk = self._job.get_chunk(index, chunk_size)
+				if not self._put(chunk):
+					return
+				if chunk[-1][0] is None:
+					return
+				index += len(chunk)
+				chunk_size = min(chunk_size * 2, self.CHUNK_SIZE_MAX)
+		except Exception as e:
+			if self._stopped.is_set():
+				return  # the job got released
+			self._logger.exception("Exception while reading the compiled job")
+			self._put(e)
+
+	def _put(self, chunk):
+		while not self._stopped.is_set():
+			try:
+				self._queue.put(chunk, timeout=0.1)
+				return True
+			except Queue.Full:
+				pass
+		return False
+
+
+class CompiledGcodeJob(object):
+	"""
+	Pre-processed representation of a gcode file, compiled once in its own thread when the file gets selected.
+	The processed commands are spooled to an unlinked temporary file next to the gcode file, one line per command
+	with the file position after it and the size of the comment and empty lines up to it (for the progress).
+	Only every CHUNK_SIZE-th command is kept in memory as checkpoint: its offset in the spool file, the file position
+	before it and the machine state before it (position, feedrate, intensity, laser on/off) to resume a job.
+	Commands can be read while the compilation is still running, this blocks until the command is compiled.
+	"""
+
+	CHUNK_SIZE = 1024
+
+	pattern_motion = re.compile("^G0?[0-3](?!\d)")
+	pattern_laser = re.compile("M0?([35])(?!\d)")
+	pattern_distance_mode = re.compile("G9([01])(?!\d)")
+	pattern_x = re.compile("X([-+]?[0-9.]+)")
+	pattern_y = re.compile("Y([-+]?[0-9.]+)")
+	pattern_feedrate = re.compile("F([0-9.]+)")
+	pattern_intensity = re.compile("S([0-9.]+)")
+	STATE_PATTERNS = (pattern_x, pattern_y, pattern_feedrate, pattern_intensity, pattern_laser)
+
+	# the state is kept as the last commands which set x, y, feedrate, intensity and laser on/off, they are only
+	# parsed when resuming. Relative moves (G91) are added up to the absolute position while compiling.
+	STATE_INITIAL = (None, None, None, None, None, False)  # ..., relative distance mode
+
+	def __init__(self, filename):
+		self._logger = mrb_logger("octoprint.plugins.mrbeam.comm_acc2")
+		self._filename = filename
+		fd, spool_path = tempfile.mkstemp(prefix=".compiled_", suffix=".tmp", dir=os.path.dirname(os.path.abspath(filename)))
+		self._spool_writer = os.fdopen(fd, 'wb')
+		self._spool_reader = io.open(spool_path, 'rb')
+		os.remove(spool_path)  # the open handles keep the data, nothing is left behind if the process dies
+		self._checkpoint_offsets = array.array('L')  # in the spool file
+		self._checkpoint_positions = array.array('L')  # file position before the command without comment lines
+		self._checkpoint_states = []
+		self._count = 0
+		self._last_pos = 0  # file position after the last compiled command without comment lines
+		self._end = (0, 0)  # file size and size of all comment and empty lines
+		self._cursor = 0  # index of the command the spool reader is at
+		self._done = False
+		self._released = False
+		self._error = None
+		self._condition = threading.Condition()
+		self._read_lock = threading.Lock()
+		self._thread = threading.Thread(target=self._compile, name="comm._compiling_thread")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def get(self, index):
+		"""
+		Blocks until the command is compiled.
+		:return: tuple (command, pos, skipped): command is None after the last command
+		"""
+		return self.get_chunk(index, 1)[0]
+
+	def get_chunk(self, index, count):
+		"""
+		Blocks until the command at index is compiled.
+		:return: list of up to count tuples (command, pos, skipped), the last one has command None after the last command
+		"""
+		self._wait_for(index)
+		with self._read_lock:
+			end = min(index + count, self._count)
+			if index >= end:
+				return [(None,) + self._end]
+			self._seek(index)
+			readline = self._spool_reader.readline
+			chunk = []
+			for _ in xrange(end - index):
+				command, pos, skipped = readline().rsplit(' ', 2)
+				chunk.append((command, int(pos), int(skipped)))
+			self._cursor = end
+			return chunk
+
+	def get_count(self):
+		return self._count
+
+	def is_done(self):
+		return self._done
+
+	def release(self):
+		"""
+		Stops the compilation and frees the spool file. The job can't be read afterwards.
+		"""
+		self._released = True
+		self._thread.join()
+		with self._read_lock:
+			self._spool_reader.close()
+
+	def find_index(self, pos):
+		"""
+		:param pos: file position without the comment and empty lines, as reported by getFilepos()
+		:return: index of the command at this position
+		"""
+		while not self._done and self._last_pos <= pos:
+			self._wait_for(self._count)
+		c = bisect.bisect_right(self._checkpoint_positions, pos) - 1
+		if c < 0:
+			return 0
+		index = c * self.CHUNK_SIZE
+		with self._read_lock:
+			self._seek(index)
+			while index < self._count:
+				_, command_pos, skipped = self._spool_reader.readline().rsplit(' ', 2)
+				self._cursor += 1
+				if int(command_pos) - int(skipped) > pos:
+					break
+				index += 1
+		return index
+
+	def get_resume_commands(self, index):
+		"""
+		Commands which restore the position, distance mode, feedrate, intensity and laser state the machine had
+		before the command at index.
+		"""
+		self._wait_for(index)
+		index = min(index, self._count)
+		c = min(index // self.CHUNK_SIZE, len(self._checkpoint_states) - 1)
+		if c < 0:
+			return ["M5"]
+		state = list(self._checkpoint_states[c])
+		with self._read_lock:
+			self._seek(c * self.CHUNK_SIZE)
+			for _ in xrange(index - c * self.CHUNK_SIZE):
+				self._update_state(state, self._spool_reader.readline().rsplit(' ', 2)[0].upper())
+				self._cursor += 1
+		x, y, feedrate, intensity, laser = [self._search(pattern, command) for pattern, command in
+		                                    zip(self.STATE_PATTERNS, state)]
+		relative = state[5]
+
+		commands = ["M5"]
+		if x is not None or y is not None:
+			commands.append("G90")
+			commands.append("G0" + ("X" + x if x is not None else "") + ("Y" + y if y is not None else ""))
+		if relative:
+			commands.append("G91")
+		if feedrate is not None:
+			commands.append("F" + feedrate)
+		if laser == '3':
+			commands.append("M3S" + (intensity or "0"))
+		elif intensity is not None:
+			commands.append("S" + intensity)
+		return commands
+
+	def _update_state(self, state, command):
+		# command in upper case, state is the list of the last commands setting x, y, feedrate, intensity, laser
+		# and the distance mode
+		if command[0] == 'G':
+			if 'G9' in command:
+				match = self.pattern_distance_mode.search(command)
+				if match:
+					state[5] = match.group(1) == '1'
+			if self.pattern_motion.match(command):
+				if state[5]:
+					self._move_relative(state, command)
+				else:
+					if 'X' in command:
+						state[0] = command
+					if 'Y' in command:
+						state[1] = command
+		if 'F' in command:
+			state[2] = command
+		if 'S' in command:
+			state[3] = command
+		if 'M' in command and self.pattern_laser.search(command):
+			state[4] = command
+
+	def _move_relative(self, state, command):
+		# an unknown position stays unknown
+		for i, axis, pattern in ((0, 'X', self.pattern_x), (1, 'Y', self.pattern_y)):
+			delta = self._search(pattern, command)
+			position = self._search(pattern, state[i])
+			if delta is not None and position is not None:
+				position = ("%.4f" % (float(position) + float(delta))).rstrip('0').rstrip('.')
+				state[i] = axis + position
+
+	def _search(self, pattern, command):
+		if command is None:
+			return None
+		match = pattern.search(command)
+		return match.group(1) if match else None
+
+	def _seek(self, index):
+		# caller holds self._read_lock, index has to be compiled
+		if self._spool_reader.closed:
+			raise ValueError("Compiled job of %s is released" % self._filename)
+		if index == self._cursor:
+			return
+		c = index // self.CHUNK_SIZE
+		self._spool_reader.seek(self._checkpoint_offsets[c])
+		for _ in xrange(index - c * self.CHUNK_SIZE):
+			self._spool_reader.readline()
+		self._cursor = index
+
+	def _wait_for(self, index):
+		with self._condition:
+			while index >= self._count and not self._done:
+				self._condition.wait()
+		if self._released:
+			raise ValueError("Compiled job of %s is released" % self._filename)
+		if self._error is not None:
+			raise self._error
+
+	def _compile(self):
+		start = time.time()
+		try:
+			pos = 0
+			skipped = 0
+			index = 0
+			offset = 0
+			state = list(self.STATE_INITIAL)
+			chunk_size = self.CHUNK_SIZE
+			update_state = self._update_state
+			with open(self._filename, "r") as handle:
+				while not self._released:
+					lines = handle.readlines(self.CHUNK_SIZE * 32)
+					if not lines:
+						break
+					records = []
+					checkpoints = []
+					for line in lines:
+						processed = process_gcode_line(line)
+						if processed is None:
+							pos += len(line)
+							skipped += len(line)
+							continue
+
+						if index % chunk_size == 0:
+							checkpoints.append((offset, pos - skipped, tuple(state)))
+						update_state(state, processed.upper())
+						pos += len(line)
+						record = "%s %d %d\n" % (processed, pos, skipped)
+						records.append(record)
+						offset += len(record)
+						index += 1
+					self._add(records, checkpoints, pos - skipped)
+			if self._released:
+				self._logger.info("Compilation of %s stopped", os.path.basename(self._filename))
+				return
+			self._end = (pos, skipped)
+			self._logger.info("Compiled %s: %s commands, %s bytes in %.2fs",
+			                  os.path.basename(self._filename), self._count, offset, time.time() - start)
+		except Exception as e:
+			self._logger.exception("Exception while compiling %s", self._filename)
+			self._error = e
+		finally:
+			self._spool_writer.close()
+			with self._condition:
+				self._done = True
+				self._condition.notify_all()
+
+	def _add(self, records, checkpoints, pos):
+		self._spool_writer.write("".join(records))
+		self._spool_writer.flush()
+		for offset, checkpoint_pos, state in checkpoints:
+			self._checkpoint_offsets.append(offset)
+			self._checkpoint_positions.append(checkpoint_pos)
+			self._checkpoint_states.append(state)
+		with self._condition:
+			self._count += len(records)
+			self._last_pos = pos
+			self._condition.notify_all()
+
+
+class AccLineBuffer(object):
+	"""
+	Lines sent to grbl which are not yet acknowledged by an 'ok' or 'error', i.e. the content of grbl's RX buffer
+	in the character counting protocol. Keeps a running character count so checking the send window is O(1).
+	Lines are appended by the sending thread and acknowledged by the monitoring thread.
+	"""
+
+	def __init__(self, size):
+		"""
+		:param size: send window in characters, lines are only sent while their characters stay below it
+		"""
+		self.size = size
+		self._lines = collections.deque()
+		self._char_count = 0
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._lines)
+
+	def get_char_count(self):
+		return self._char_count
+
+	def get_free(self):
+		return self.size - self._char_count
+
+	def fits(self, length):
+		"""
+		:param length: characters of the line to send including the newline
+		"""
+		return self._char_count + length < self.size
+
+	def append(self, line):
+		with self._lock:
+			self._lines.append(line)
+			self._char_count += len(line)
+
+	def acknowledge(self):
+		"""
+		Removes the oldest line.
+		:returns: the removed line or None if there is no unacknowledged line
+		"""
+		with self._lock:
+			if not self._lines:
+				return None
+			line = self._lines.popleft()
+			self._char_count -= len(line)
+			return line
+
+	def reset(self):
+		with self._lock:
+			self._lines.clear()
+			self._char_count = 0
+
+
 class RxBufferStats(object):
 
 	def __init__(self):
@@ -2015,25 +2458,24 @@ def convert_pause_triggers(configured_triggers):
 
 
 def process_gcode_line(line):
-	line = strip_comment(line).strip()
-	line = line.replace(" ", "")
-	if not len(line):
+	if ";" in line:
+		line = strip_comment(line)
+	line = line.strip().replace(" ", "")
+	if not line:
 		return None
 	return line
 
+_regex_uncommented = re.compile(r"(?:[^;\\]|\\.?)*", re.DOTALL)
+
 def strip_comment(line):
-	if not ";" in line:
+	index = line.find(";")
+	if index < 0:
 		# shortcut
 		return line
-
-	escaped = False
-	result = []
-	for c in line:
-		if c == ";" and not escaped:
-			break
-		result += c
-		escaped = (c == "\\") and not escaped
-	return "".join(result)
+	if line.find("\\", 0, index) < 0:
+		# shortcut, the first ; is not escaped
+		return line[:index]
+	return _regex_uncommented.match(line).group(0)
 
 def get_new_timeout(t):
 	now = time.time()
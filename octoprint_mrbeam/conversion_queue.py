@@ -0,0 +1,295 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+from octoprint_mrbeam.mrb_logger import mrb_logger
+
+
+class CancellationToken(object):
+	"""
+	Shared between the queue and a running conversion, which checks it inside its path and image row loops.
+	"""
+
+	def __init__(self):
+		self._cancelled = threading.Event()
+
+	def cancel(self):
+		self._cancelled.set()
+
+	def is_cancelled(self):
+		return self._cancelled.is_set()
+
+
+class ConversionJob(object):
+
+	STATE_QUEUED = 'queued'
+	STATE_RUNNING = 'running'
+	STATE_DONE = 'done'
+	STATE_FAILED = 'failed'
+	STATE_CANCELLED = 'cancelled'
+
+	def __init__(self, run, priority=0, name=None, on_done=None):
+		"""
+		:param run: callable run(job), does the conversion and returns once it is finished
+		:param priority: jobs with higher priority run first, jobs of equal priority in order of submission
+		:param name: e.g. the name of the resulting gcode file
+		:param on_done: callable on_done(job), called once the job left the queue, also if it was cancelled before it ran
+		"""
+		self.id = uuid.uuid4().hex
+		self.run = run
+		self.on_done = on_done
+		self.priority = priority
+		self.name = name
+		self.token = CancellationToken()
+		self.state = self.STATE_QUEUED
+		self.error = None
+		self.submitted = time.time()
+		self.started = None
+		self.finished = None
+		self._finished_event = threading.Event()
+		self._attached_event = threading.Event()
+		self._lock = threading.Lock()
+
+	def cancel(self):
+		self.token.cancel()
+
+	def is_cancelled(self):
+		return self.token.is_cancelled()
+
+	def is_active(self):
+		return self.state in (self.STATE_QUEUED, self.STATE_RUNNING)
+
+	def finish(self, state, error=None):
+		"""
+		Marks the job as finished. Only the first call counts.
+		"""
+		with self._lock:
+			self._finish(state, error)
+
+	def _finish(self, state, error):
+		# caller holds self._lock
+		if self._finished_event.is_set():
+			return
+		self.state = state
+		self.error = error
+		self.finished = time.time()
+		self._finished_event.set()
+
+	def attach(self):
+		"""
+		Called by the code doing the actual conversion (e.g. in another thread) once it took over the job.
+		:returns: False if the job is already finished, e.g. because nobody attached in time
+		"""
+		with self._lock:
+			if self._finished_event.is_set():
+				return False
+			self._attached_event.set()
+			return True
+
+	def wait_attached(self, timeout):
+		"""
+		Waits until attach() was called, otherwise fails the job after timeout seconds.
+		:returns: True if the job is attached
+		"""
+		self._attached_event.wait(timeout)
+		with self._lock:
+			if self._attached_event.is_set():
+				return True
+			self._finish(self.STATE_FAILED, "Conversion not started after {}s".format(timeout))
+			return False
+
+	def wait(self, timeout=None):
+		"""
+		:returns: True if the job is finished
+		"""
+		self._finished_event.wait(timeout)
+		return self._finished_event.is_set()
+
+	def get_wait_time(self):
+		if self.started is None:
+			return None
+		return self.started - self.submitted
+
+	def get_run_time(self):
+		if self.started is None or self.finished is None:
+			return None
+		return self.finished - self.started
+
+	def get_data(self):
+		return dict(id=self.id,
+		            name=self.name,
+		            priority=self.priority,
+		            state=self.state,
+		            error=self.error,
+		            submitted=self.submitted,
+		            wait_time=self.get_wait_time(),
+		            run_time=self.get_run_time())
+
+
+class ConversionQueue(object):
+	"""
+	Runs conversion jobs one after another in a worker thread, the job with the highest priority first.
+	Cancelled jobs are skipped if still queued, a running job is expected to check job.token and stop.
+	"""
+
+	HISTORY_LENGTH = 20
+
+	def __init__(self):
+		self._logger = mrb_logger("octoprint.plugins.mrbeam.conversion_queue")
+		self._queue = []
+		self._counter = itertools.count()
+		self._jobs = dict()
+		self._history = []
+		self._current_job = None
+		self._condition = threading.Condition()
+		self._shutdown = False
+		self._stats = dict(submitted=0, done=0, failed=0, cancelled=0, max_depth=0,
+		                   wait_time_total=0.0, wait_time_max=0.0, run_time_total=0.0, run_time_max=0.0)
+
+		self._worker = threading.Thread(target=self._work, name="ConversionQueue")
+		self._worker.daemon = True
+		self._worker.start()
+
+	def submit(self, run, priority=0, name=None, supersede=False, on_done=None):
+		"""
+		Adds a job to the queue.
+		:param supersede: cancels all queued and running jobs, e.g. when the user sent a corrected design
+		:param on_done: see ConversionJob
+		:returns: the new ConversionJob
+		"""
+		job = ConversionJob(run, priority=priority, name=name, on_done=on_done)
+		with self._condition:
+			if supersede:
+				for other in self._jobs.values():
+					self._cancel(other)
+			self._jobs[job.id] = job
+			heapq.heappush(self._queue, (-priority, next(self._counter), job))
+			self._stats['submitted'] += 1
+			self._stats['max_depth'] = max(self._stats['max_depth'], len(self._queue))
+			self._condition.notify()
+		self._logger.info("Conversion job %s (%s) queued with priority %s. %s", job.id, name, priority, self.pp())
+		return job
+
+	def cancel(self, job_id):
+		"""
+		:returns: False if there is no queued or running job with this id
+		"""
+		with self._condition:
+			job = self._jobs.get(job_id)
+			if job is None:
+				return False
+			self._cancel(job)
+			return True
+
+	def cancel_all(self):
+		with self._condition:
+			for job in self._jobs.values():
+				self._cancel(job)
+
+	def get_job(self, job_id):
+		with self._condition:
+			job = self._jobs.get(job_id)
+			if job is None:
+				job = next((j for j in self._history if j.id == job_id), None)
+			return job
+
+	def get_current_job(self):
+		return self._current_job
+
+	def get_jobs(self):
+		"""
+		:returns: all queued and running jobs in the order they will be processed
+		"""
+		with self._condition:
+			jobs = [job for _, _, job in sorted(self._queue)]
+			if self._current_job is not None:
+				jobs.insert(0, self._current_job)
+			return jobs
+
+	def get_history(self):
+		with self._condition:
+			return list(self._history)
+
+	def get_depth(self):
+		with self._condition:
+			return len(self._queue)
+
+	def get_stats(self):
+		with self._condition:
+			stats = dict(self._stats)
+			stats['depth'] = len(self._queue)
+			stats['running'] = self._current_job is not None
+		started = stats['done'] + stats['failed'] + stats['cancelled']
+		stats['wait_time_avg'] = stats['wait_time_total'] / started if started else 0.0
+		finished = stats['done'] + stats['failed']
+		stats['run_time_avg'] = stats['run_time_total'] / finished if finished else 0.0
+		return stats
+
+	def pp(self):
+		return "ConversionQueue: depth {depth} (max {max_depth}), {submitted} submitted, {done} done, {failed} failed, {cancelled} cancelled, " \
+		       "wait avg {wait_time_avg:.2f}s max {wait_time_max:.2f}s, run avg {run_time_avg:.2f}s max {run_time_max:.2f}s".format(**self.get_stats())
+
+	def shutdown(self):
+		with self._condition:
+			self._shutdown = True
+			for job in self._jobs.values():
+				self._cancel(job)
+			self._condition.notify()
+
+	def _cancel(self, job):
+		# caller holds self._condition
+		if job.is_active() and not job.is_cancelled():
+			job.cancel()
+			self._logger.info("Conversion job %s (%s) cancelled while %s", job.id, job.name, job.state)
+
+	def _next_job(self):
+		with self._condition:
+			while not self._queue and not self._shutdown:
+				self._condition.wait()
+			if self._shutdown:
+				return None
+			_, _, job = heapq.heappop(self._queue)
+			self._current_job = job
+			job.started = time.time()
+			return job
+
+	def _work(self):
+		while True:
+			job = self._next_job()
+			if job is None:
+				return
+			if job.is_cancelled():
+				job.finish(ConversionJob.STATE_CANCELLED)
+			else:
+				job.state = ConversionJob.STATE_RUNNING
+				try:
+					job.run(job)
+					job.finish(ConversionJob.STATE_CANCELLED if job.is_cancelled() else ConversionJob.STATE_DONE)
+				except Exception as e:
+					self._logger.exception("Conversion job %s (%s) failed: %s", job.id, job.name, e)
+					job.finish(ConversionJob.STATE_FAILED, error=str(e))
+			self._done(job)
+
+	def _done(self, job):
+		with self._condition:
+			self._current_job = None
+			del self._jobs[job.id]
+			self._history.append(job)
+			del self._history[:-self.HISTORY_LENGTH]
+			self._stats[job.state] += 1
+			wait_time = job.get_wait_time()
+			self._stats['wait_time_total'] += wait_time
+			self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+			if job.state != ConversionJob.STATE_CANCELLED:
+				run_time = job.get_run_time()
+				self._stats['run_time_total'] += run_time
+				self._stats['run_time_max'] = max(self._stats['run_time_max'], run_time)
+		self._logger.info("Conversion job %s (%s) %s, waited %.2fs, ran %.2fs. %s",
+		                  job.id, job.name, job.state, job.get_wait_time(), job.get_run_time(), self.pp())
+		if job.on_done is not None:
+			try:
+				job.on_done(job)
+			except Exception as e:
+				self._logger.exception("on_done of conversion job %s (%s) failed: %s", job.id, job.name, e)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+background_conversion.py
+runs a Converter in a separate low priority process
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Used to convert while lasering: the conversion must neither take the GIL nor CPU time or IO bandwidth
+from the thread feeding gcode to grbl. The child process is niced, put into the idle IO scheduling class
+and throttled to a CPU budget by stopping and continuing it, like the CFS quota of a cgroup does.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+from converter import OutOfSpaceException
+
+
+class BackgroundConversion():
+
+	PERIOD = 0.2 # seconds, the cpu budget applies per period
+	POLL_INTERVAL = 0.01
+
+	def __init__(self, converter, nice=19, ionice=True, cpu_budget=0.5):
+		"""
+		:param converter: Converter to run. Should use a single worker, the child's worker processes are not throttled.
+		:param nice: niceness increment of the child process
+		:param ionice: put the child process into the idle IO scheduling class
+		:param cpu_budget: share of one cpu the child may use, 0 or >= 1 disables throttling
+		"""
+		self._log = logging.getLogger("octoprint.plugins.mrbeam.background_conversion")
+		self.converter = converter
+		self.nice = nice
+		self.ionice = ionice
+		self.cpu_budget = cpu_budget
+		self.stats = dict(duration=0.0, cpu_time=0.0, throttled=0.0, periods_throttled=0)
+		self._profile = None
+
+	def convert(self, is_job_cancelled, on_progress=None, on_progress_args=None, on_progress_kwargs=None):
+		"""
+		Same interface as Converter.convert(), blocks until the child process is done.
+		A cancelled conversion (is_job_cancelled() raises) terminates the child process.
+		"""
+		start = time.time()
+		reader, writer = multiprocessing.Pipe(duplex=False)
+		process = multiprocessing.Process(target=self._run_child, args=(writer,), name="BackgroundConversion")
+		process.start()
+		writer.close()
+		self._log.info("Background conversion started in process %s (nice %s, idle io: %s, cpu budget %s)",
+		               process.pid, self.nice, self.ionice, self.cpu_budget)
+		try:
+			self._supervise(process, reader, is_job_cancelled, on_progress, on_progress_args, on_progress_kwargs)
+		finally:
+			if process.is_alive():
+				self._continue(process)
+				process.terminate()
+			process.join()
+			reader.close()
+			self.stats['duration'] = time.time() - start
+			self._log.info(self.pp())
+
+	def get_profile(self):
+		"""
+		:returns: the profile of the conversion in the child process (see Converter.get_profile()) with the throttling stats
+		"""
+		if self._profile is None:
+			return None
+		return dict(self._profile, background=self.stats)
+
+	def pp(self):
+		return "BackgroundConversion: {duration:.2f}s, {cpu_time:.2f}s cpu, throttled {throttled:.2f}s in {periods_throttled} periods".format(**self.stats)
+
+	def _run_child(self, writer):
+		try:
+			os.nice(self.nice)
+			if self.ionice:
+				self._set_idle_io_priority()
+
+			def on_progress(_progress=None):
+				writer.send(('progress', _progress))
+
+			self.converter.convert(None, on_progress)
+			writer.send(('done', self.converter.get_profile()))
+		except Exception as e:
+			self._log.exception("Background conversion failed: %s", e)
+			writer.send(('error', (type(e).__name__, str(e))))
+		finally:
+			writer.close()
+
+	def _set_idle_io_priority(self):
+		try:
+			subprocess.call(['ionice', '-c', '3', '-p', str(os.getpid())])
+		except OSError as e:
+			self._log.warn("Unable to set idle io priority: %s", e)
+
+	def _supervise(self, process, reader, is_job_cancelled, on_progress, on_progress_args, on_progress_kwargs):
+		throttle = 0 < self.cpu_budget < 1
+		quota = self.cpu_budget * self.PERIOD
+		period_start = time.time()
+		cpu_start = cpu_time = self._get_cpu_time(process.pid) or 0.0
+		stopped_at = None
+
+		while True:
+			if reader.poll(self.POLL_INTERVAL):
+				try:
+					msg, value = reader.recv()
+				except EOFError:
+					process.join()
+					raise Exception("Background conversion process exited with code {}".format(process.exitcode))
+				if msg == 'progress':
+					if on_progress is not None:
+						kwargs = dict(on_progress_kwargs or dict())
+						kwargs['_progress'] = value
+						on_progress(*(on_progress_args or ()), **kwargs)
+				elif msg == 'done':
+					self.stats['cpu_time'] = self._get_cpu_time(process.pid) or cpu_time
+					self._profile = value
+					return
+				elif msg == 'error':
+					error_type, error = value
+					if error_type == OutOfSpaceException.__name__:
+						raise OutOfSpaceException(error)
+					raise Exception("{}: {}".format(error_type, error))
+
+			if is_job_cancelled is not None:
+				is_job_cancelled()
+
+			cpu_time = self._get_cpu_time(process.pid) or cpu_time
+			self.stats['cpu_time'] = cpu_time
+			if throttle:
+				now = time.time()
+				if now - period_start >= self.PERIOD:
+					if stopped_at is not None:
+						self.stats['throttled'] += now - stopped_at
+						self._continue(process)
+						stopped_at = None
+					period_start = now
+					cpu_start = cpu_time
+				elif stopped_at is None and cpu_time - cpu_start >= quota:
+					os.kill(process.pid, signal.SIGSTOP)
+					stopped_at = now
+					self.stats['periods_throttled'] += 1
+
+	def _continue(self, process):
+		try:
+			os.kill(process.pid, signal.SIGCONT)
+		except OSError:
+			pass
+
+	def _get_cpu_time(self, pid):
+		"""
+		:returns: user + system cpu time of the process in seconds or None if it is gone
+		"""
+		try:
+			with open('/proc/{}/stat'.format(pid), 'r') as stat:
+				# the process name might contain spaces, the fields after it don't
+				fields = stat.read().rsplit(')', 1)[1].split()
+			return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+		except (IOError, IndexError, ValueError):
+			return None
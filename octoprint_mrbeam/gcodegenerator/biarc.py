@@ -1,4 +1,5 @@
 import math
+import numpy
 import bezmisc
 from point import Point
 
@@ -222,3 +223,192 @@ def cspseglength(sp1,sp2, tolerance = 0.001):
 
 def between(c,x,y):
 	return (x-straight_tolerance<=c<=y+straight_tolerance) or (y-straight_tolerance<=c<=x+straight_tolerance)
+
+
+################################################################################
+###
+###		Batched biarc approximation
+###
+###		Same geometry as biarc() for arrays of segments with numpy.
+###		Segments are split until the biarc deviates less than tolerance
+###		from the bezier curve (or BIARC_MAX_SPLIT_DEPTH is reached).
+###
+################################################################################
+BIARC_TOLERANCE = 1.0 # max distance between bezier curve and biarc, same unit as the coordinates
+BIARC_MAX_SPLIT_DEPTH = 10
+
+def biarc_segments(segments, tolerance=BIARC_TOLERANCE, max_depth=BIARC_MAX_SPLIT_DEPTH):
+	"""
+	Approximates cubic bezier segments with biarcs or lines.
+	:param segments: list of cubic super path node pairs (sp1, sp2), or a numpy array of shape (n, 4, 2)
+	                 with the bezier points start, control 1, control 2, end
+	:returns: list with a list of curve entries (like biarc() with z = 0) for each segment
+	"""
+	if isinstance(segments, numpy.ndarray):
+		bez = segments.astype(float)
+	else:
+		bez = numpy.array([[sp1[1][:2], sp1[2][:2], sp2[0][:2], sp2[1][:2]] for sp1, sp2 in segments], dtype=float).reshape(-1, 4, 2)
+	return _biarc_batch(bez, tolerance, max_depth, 0)
+
+def _biarc_batch(bez, tolerance, max_depth, depth):
+	n = len(bez)
+	if n == 0:
+		return []
+	res = [None] * n
+	P0, C1, C2, P4 = bez[:, 0], bez[:, 1], bez[:, 2], bez[:, 3]
+	TS = C1 - P0
+	TE = P4 - C2
+	v = P0 - P4
+	tsa, tea = numpy.arctan2(TS[:, 1], TS[:, 0]), numpy.arctan2(TE[:, 1], TE[:, 0])
+	ts_mag, te_mag, v_mag = _mag(TS), _mag(TE), _mag(v)
+
+	line = (te_mag < straight_distance_tolerance) & (ts_mag < straight_distance_tolerance)
+	split = numpy.zeros(n, dtype=bool)
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		te_small = ~line & (te_mag < straight_distance_tolerance)
+		ts_small = ~line & ~te_small & (ts_mag < straight_distance_tolerance)
+		r = ts_mag / te_mag
+		TE = numpy.where(te_small[:, None], -_unit(TS + v), TE)
+		r = numpy.where(te_small, ts_mag / v_mag * 2, r)
+		TS = numpy.where(ts_small[:, None], -_unit(TE + v), TS)
+		r = numpy.where(ts_small, 1 / (te_mag / v_mag * 2), r)
+		# a zero v with one zero tangent fails in biarc() with a ZeroDivisionError
+		split |= (te_small | ts_small) & (v_mag == 0)
+		TS, TE = _unit(TS), _unit(TE)
+		ts_mag, te_mag = _mag(TS), _mag(TE)
+
+		diff = numpy.mod(tsa - tea, math.pi)
+		parallel = (diff < straight_tolerance) | (math.pi - diff < straight_tolerance)
+		collinear = 1 - numpy.abs(_dot(TS, v) / (ts_mag * v_mag)) < straight_tolerance
+		line |= parallel & ((v_mag < straight_distance_tolerance) | (te_mag < straight_distance_tolerance) | (ts_mag < straight_distance_tolerance) | collinear)
+		line &= ~split
+
+		c = _dot(v, v)
+		b = 2 * _dot(v, r[:, None] * TS + TE)
+		a = 2 * r * (_dot(TS, TE) - 1)
+		split |= ~line & (v_mag == 0)
+		asmall, bsmall, csmall = numpy.abs(a) < 10**-10, numpy.abs(b) < 10**-10, numpy.abs(c) < 10**-10
+		case_b = asmall & (b != 0)
+		case_a = ~case_b & csmall & (a != 0)
+		case_q = ~case_b & ~case_a & ~asmall
+		discr = b * b - 4 * a * c
+		disq = numpy.sqrt(numpy.where(discr < 0, 0, discr))
+		beta1 = (-b - disq) / 2 / a
+		beta2 = (-b + disq) / 2 / a
+		beta = numpy.where(case_b, -c / b, numpy.where(case_a, -b / a, numpy.maximum(beta1, beta2)))
+		# biarc() raises a ValueError for these, split instead
+		invalid = case_q & ((discr < 0) | (beta1 * beta2 > 0))
+		split |= ~line & ((asmall & ~case_b & ~case_a) | invalid)
+
+		alpha = beta * r
+		ab = alpha + beta
+		P1 = P0 + alpha[:, None] * TS
+		P3 = P4 - beta[:, None] * TE
+		P2 = (beta / ab)[:, None] * P1 + (alpha / ab)[:, None] * P3
+
+		R1, a1, ok1 = _arc_params(P0, P1, P2)
+		R2, a2, ok2 = _arc_params(P2, P3, P4)
+		todo = ~line & ~split
+		line |= todo & (~ok1 | ~ok2 | (_mag(R1 - P0) < straight_tolerance) | (_mag(R2 - P2) < straight_tolerance))
+		todo &= ~line
+
+	idx = numpy.flatnonzero(todo)
+	if len(idx) > 0 and depth < max_depth:
+		d = _csp_to_arc_distance(bez[idx], (P0[idx], P2[idx], R1[idx], a1[idx]), (P2[idx], P4[idx], R2[idx], a2[idx]))
+		split[idx[d > tolerance]] = True
+
+	if depth >= max_depth:
+		# like biarc_split() at max depth
+		line |= split
+		split[:] = False
+
+	for i in numpy.flatnonzero(line):
+		res[i] = [[[bez[i, 0, 0], bez[i, 0, 1]], 'line', 0, 0, [bez[i, 3, 0], bez[i, 3, 1]], [0, 0]]]
+	for i in numpy.flatnonzero(~line & ~split):
+		p2 = [P2[i, 0], P2[i, 1]]
+		res[i] = [[[bez[i, 0, 0], bez[i, 0, 1]], 'arc', [R1[i, 0], R1[i, 1]], a1[i], p2, [0, 0]],
+		          [p2, 'arc', [R2[i, 0], R2[i, 1]], a2[i], [bez[i, 3, 0], bez[i, 3, 1]], [0, 0]]]
+
+	split_idx = numpy.flatnonzero(split)
+	if len(split_idx) > 0:
+		halves = _split_batch(bez[split_idx])
+		children = _biarc_batch(halves, tolerance, max_depth, depth + 1)
+		for j, i in enumerate(split_idx):
+			res[i] = children[2 * j] + children[2 * j + 1]
+	return res
+
+def _mag(p):
+	return numpy.hypot(p[..., 0], p[..., 1])
+
+def _dot(p1, p2):
+	return p1[..., 0] * p2[..., 0] + p1[..., 1] * p2[..., 1]
+
+def _unit(p):
+	h = _mag(p)
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		return numpy.where((h != 0)[..., None], p / h[..., None], 0.0)
+
+def _angle(p):
+	return numpy.arctan2(p[..., 1], p[..., 0])
+
+def _arc_params(P0, P1, P2):
+	# like calculate_arc_params() in biarc()
+	D = (P0 + P2) / 2
+	dp1 = _mag(D - P1)
+	ok = dp1 != 0
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		R = D - (_mag(D - P0)**2 / dp1)[:, None] * _unit(P1 - D)
+	p0a, p1a, p2a = numpy.mod(_angle(P0 - R), math.pi2), numpy.mod(_angle(P1 - R), math.pi2), numpy.mod(_angle(P2 - R), math.pi2)
+	alpha = numpy.mod(p2a - p0a, math.pi2)
+	alpha = numpy.where(((p0a < p2a) & ((p1a < p0a) | (p2a < p1a))) | ((p2a < p1a) & (p1a < p0a)), -2 * math.pi + alpha, alpha)
+	ok &= (numpy.abs(R[:, 0]) <= 1000000) & (numpy.abs(R[:, 1]) <= 1000000)
+	return R, alpha, ok
+
+def _split_batch(bez, t=.5):
+	# like csp_split(): returns the two halves of every segment, in order
+	p1, p2, p3, p4 = bez[:, 0], bez[:, 1], bez[:, 2], bez[:, 3]
+	p12 = p1 + (p2 - p1) * t
+	p23 = p2 + (p3 - p2) * t
+	p34 = p3 + (p4 - p3) * t
+	p1223 = p12 + (p23 - p12) * t
+	p2334 = p23 + (p34 - p23) * t
+	p = p1223 + (p2334 - p1223) * t
+	halves = numpy.empty((2 * len(bez), 4, 2))
+	halves[0::2] = numpy.stack([p1, p12, p1223, p], axis=1)
+	halves[1::2] = numpy.stack([p, p2334, p34, p4], axis=1)
+	return halves
+
+def _point_to_arc_distance(p, P0, P2, c, a):
+	# like point_to_arc_distance() for points p of shape (n, k, 2) and arcs of shape (n, ...)
+	r = _mag(P0 - c)[:, None]
+	i = c[:, None] + _unit(p - c[:, None]) * r[..., None]
+	alpha = _angle(i - c[:, None]) - _angle(P0 - c)[:, None]
+	a = a[:, None]
+	alpha = numpy.where(a * alpha < 0, numpy.where(alpha > 0, alpha - math.pi2, math.pi2 + alpha), alpha)
+	on_arc = ((0 - straight_tolerance <= alpha) & (alpha <= a + straight_tolerance)) | \
+	         ((a - straight_tolerance <= alpha) & (alpha <= 0 + straight_tolerance)) | \
+	         (numpy.minimum(numpy.abs(alpha), numpy.abs(alpha - a)) < straight_tolerance)
+	d_end = numpy.minimum(_mag(p - P0[:, None]), _mag(p - P2[:, None]))
+	return numpy.where(on_arc, _mag(p - i), d_end)
+
+def _csp_to_arc_distance(bez, arc1, arc2, tolerance=0.01):
+	# like csp_to_arc_distance(): max distance of sampled bezier points to the nearest of both arcs
+	d = numpy.zeros(len(bez))
+	active = numpy.ones(len(bez), dtype=bool)
+	for n in (10, 20, 40, 80):
+		t = numpy.linspace(0, 1, n + 1)[None, :, None]
+		sel = numpy.flatnonzero(active)
+		b = bez[sel][:, None]
+		# same as the repeated linear interpolation of csp_at_t()
+		p12, p23, p34 = b[:, :, 0] + (b[:, :, 1] - b[:, :, 0]) * t, b[:, :, 1] + (b[:, :, 2] - b[:, :, 1]) * t, b[:, :, 2] + (b[:, :, 3] - b[:, :, 2]) * t
+		p4, p5 = p12 + (p23 - p12) * t, p23 + (p34 - p23) * t
+		p = p4 + (p5 - p4) * t
+		d1 = _point_to_arc_distance(p, *[x[sel] for x in arc1])
+		d2 = _point_to_arc_distance(p, *[x[sel] for x in arc2])
+		d_new = numpy.maximum(d[sel], numpy.minimum(d1, d2).max(axis=1))
+		changed = numpy.abs(d_new - d[sel]) > tolerance
+		d[sel] = d_new
+		active[sel[~changed]] = False
+		if not active.any():
+			break
+	return d
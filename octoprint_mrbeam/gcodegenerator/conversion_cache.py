@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+conversion_cache.py
+disk cache for converted gcode files
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Entries are addressed by a hash of the svg content, the conversion parameters and the plugin and profile version,
+so a changed design, changed laser settings or a software update never hit an old entry.
+Least recently used entries are evicted when the cache grows beyond max_size
+or the free disk space drops below min_free_space.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+
+class ConversionCache():
+
+	SUFFIX = ".gco"
+	# params that only name the output file and don't change the gcode
+	IGNORED_PARAMS = ('directory', 'file', 'log_filename')
+
+	def __init__(self, directory, max_size=0, min_free_space=0):
+		self._log = logging.getLogger("octoprint.plugins.mrbeam.conversion_cache")
+		self.directory = directory
+		self.max_size = max_size
+		self.min_free_space = min_free_space
+		self.hits = 0
+		self.misses = 0
+		self.stores = 0
+		self.evictions = 0
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+	def get_key(self, svg_path, params, version=None, profile=None):
+		h = hashlib.sha256()
+		with open(svg_path, 'rb') as fh:
+			for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+				h.update(chunk)
+		relevant_params = dict([(k, v) for k, v in params.items() if k not in self.IGNORED_PARAMS])
+		h.update(json.dumps(relevant_params, sort_keys=True, default=str))
+		h.update(json.dumps(version))
+		h.update(json.dumps(profile, sort_keys=True, default=str))
+		return h.hexdigest()
+
+	def get(self, key, destination):
+		"""
+		Copies the cached gcode of key to destination.
+		:returns: True on a cache hit, False otherwise
+		"""
+		path = self._get_path(key)
+		try:
+			shutil.copyfile(path, destination)
+			os.utime(path, None) # mtime is the last use for LRU eviction
+		except (IOError, OSError):
+			self.misses += 1
+			return False
+		self.hits += 1
+		return True
+
+	def put(self, key, source):
+		"""
+		Stores a copy of the gcode file source under key and evicts old entries if necessary.
+		"""
+		self._store(key, lambda tmp: shutil.copyfile(source, tmp))
+		self.evict()
+
+	def _store(self, key, write):
+		# write(path) fills a temporary file which is renamed to the entry afterwards, so readers never see partial entries
+		tmp = None
+		try:
+			fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=self.directory)
+			os.close(fd)
+			write(tmp)
+			os.rename(tmp, self._get_path(key))
+			self.stores += 1
+			return True
+		except (IOError, OSError) as e:
+			self._log.warn("Unable to add %s to %s: %s", key, self.__class__.__name__, e)
+			if tmp is not None and os.path.exists(tmp):
+				os.remove(tmp)
+			return False
+
+	def evict(self):
+		entries = self._get_entries()
+		size = sum([e[1] for e in entries])
+		while entries and ((self.max_size > 0 and size > self.max_size) or self._get_free_space() < self.min_free_space):
+			path, entry_size, mtime = entries.pop(0)
+			if self._is_pinned(path):
+				continue
+			try:
+				os.remove(path)
+			except OSError as e:
+				self._log.warn("Unable to evict %s from conversion cache: %s", path, e)
+				continue
+			size -= entry_size
+			self.evictions += 1
+			self._log.info("Evicted %s from conversion cache", os.path.basename(path))
+
+	def _is_pinned(self, path):
+		# entries in use, evict() skips them
+		return False
+
+	def clear(self):
+		for path, size, mtime in self._get_entries():
+			os.remove(path)
+
+	def get_size(self):
+		return sum([e[1] for e in self._get_entries()])
+
+	def _get_entries(self):
+		# (path, size, mtime) of all entries, least recently used first
+		entries = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(self.SUFFIX):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			entries.append((path, stat.st_size, stat.st_mtime))
+		entries.sort(key=lambda e: e[2])
+		return entries
+
+	def _get_path(self, key):
+		return os.path.join(self.directory, key + self.SUFFIX)
+
+	def _get_free_space(self):
+		disk = os.statvfs(self.directory)
+		return disk.f_bsize * disk.f_bavail
+
+	def get_stats(self):
+		lookups = self.hits + self.misses
+		return dict(hits=self.hits, misses=self.misses, stores=self.stores, evictions=self.evictions,
+		            hit_rate=self.hits / float(lookups) if lookups > 0 else 0.0,
+		            entries=len(self._get_entries()), size=self.get_size())
+
+	def pp(self):
+		return self.__class__.__name__ + ": {hits} hits, {misses} misses ({hit_rate:.0%}), {stores} stored, {evictions} evicted, " \
+		       "{entries} entries, {size} bytes".format(**self.get_stats())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+conversion_profiler.py
+per stage timings and memory high-water marks of a conversion
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Stages like biarc or path_emission are entered once per path or image, their times add up.
+Stages of the whole job are prefixed with job_.
+Stages of conversions in worker processes are merged with merge().
+"""
+
+import collections
+import json
+import time
+from contextlib import contextmanager
+
+
+class ConversionProfiler():
+
+	def __init__(self):
+		self.start = time.time()
+		self.stages = collections.OrderedDict()
+		self.memory = dict(peak=0, peak_stage=None)
+		self.info = dict()
+		self._current_stage = None
+
+	@contextmanager
+	def stage(self, name):
+		outer = self._current_stage
+		self._current_stage = name
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.add(name, time.time() - start)
+			self._current_stage = outer
+
+	def add(self, name, duration, count=1):
+		if name not in self.stages:
+			self.stages[name] = dict(time=0.0, count=0)
+		self.stages[name]['time'] += duration
+		self.stages[name]['count'] += count
+
+	def merge(self, stages):
+		"""
+		Adds the stages of another profiler, e.g. get_data()['stages'] of a worker process.
+		"""
+		for name, s in stages.items():
+			self.add(name, s['time'], s['count'])
+
+	def track_memory(self, usage):
+		"""
+		:param usage: current memory usage in bytes
+		"""
+		if usage > self.memory['peak']:
+			self.memory['peak'] = usage
+			self.memory['peak_stage'] = self._current_stage
+
+	def get_data(self):
+		return dict(total=time.time() - self.start,
+		            stages=self.stages,
+		            memory=self.memory,
+		            info=self.info)
+
+	def write(self, path):
+		with open(path, 'w') as fh:
+			json.dump(self.get_data(), fh, indent=1)
+
+	def pp(self):
+		data = self.get_data()
+		stages = ", ".join("{}: {:.3f}s".format(name, s['time']) for name, s in data['stages'].items())
+		return "ConversionProfiler: {:.2f}s total, {}. Peak memory {:.1f}MB during {}".format(
+			data['total'], stages, data['memory']['peak'] / 1024.0 / 1024, data['memory']['peak_stage'])
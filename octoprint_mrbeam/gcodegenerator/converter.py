@@ -1,19 +1,29 @@
+import hashlib
 import logging
 import re
 import shutil
 import os
 import time
+import tempfile
+import multiprocessing
+import resource
 import machine_settings
 
-from biarc import biarc
-from point import Point
+from biarc import biarc, biarc_segments
 import numpy
+from math import hypot
 
 import simplestyle
 import simpletransform
 import cubicsuperpath
 
-from img2gcode import ImageProcessor
+from img2gcode import ImageProcessor, imap_cancellable
+from gcode_writer import GcodeWriter
+from svg_style import StyleResolver
+import path_ordering
+from job_planner import JobPlanner
+from curve_simplification import simplify_curve
+from conversion_profiler import ConversionProfiler
 from svg_util import get_path_d, _add_ns, unittouu
 
 from lxml import etree
@@ -23,6 +33,9 @@ class Converter():
 	PLACEHOLDER_LASER_ON  = ";_laseron_"
 	PLACEHOLDER_LASER_OFF = ";_laseroff_"
 
+	_REGEX_X = re.compile(r"X\s*(-?[0-9]*\.?[0-9]+)")
+	_REGEX_Y = re.compile(r"Y\s*(-?[0-9]*\.?[0-9]+)")
+
 	defaults = {
 		"directory": None,
 		"file": None,
@@ -45,7 +58,7 @@ class Converter():
 
 	_tempfile = "/tmp/_converter_output.tmp"
 
-	def __init__(self, params, model_path, workingAreaWidth = None, workingAreaHeight = None, min_required_disk_space=0):
+	def __init__(self, params, model_path, workingAreaWidth = None, workingAreaHeight = None, min_required_disk_space=0, workers=1, two_opt=False, travel_speed=JobPlanner.DEFAULT_TRAVEL_SPEED, simplify_tolerance=0, streaming=False, fragment_cache=None, image_store=None):
 		self._log = logging.getLogger("octoprint.plugins.mrbeam.converter")
 		self.workingAreaWidth = workingAreaWidth
 		self.workingAreaHeight = workingAreaHeight
@@ -61,7 +74,22 @@ class Converter():
 		self.setoptions(params)
 		self.svg_file = model_path
 		self.document=None
+		self._transforms = {} # element -> (own transform, transform composed with all ancestors)
+		self._styles = None
 		self._min_required_disk_space = min_required_disk_space
+		self._workers = workers
+		self._two_opt = two_opt
+		self._travel_speed = travel_speed
+		self._travel_stats = dict(subpaths=0, before=0.0, after=0.0)
+		self._simplify_tolerance = simplify_tolerance
+		self._simplify_stats = dict(segments_before=0, segments_after=0, time_before=0.0, time_after=0.0)
+		self._streaming = streaming
+		self._image_data = {} # image element -> SpooledDataUrl, only filled by the streaming parser
+		self._peak_memory = 0
+		self._fragments = fragment_cache # FragmentCache or None
+		self._fragment_stats = dict(paths=0, paths_reused=0, images=0, images_reused=0)
+		self._image_store = image_store # ImageStore of uploaded images referenced by mb:image_id
+		self.profiler = ConversionProfiler()
 		self._log.info('Converter Initialized: %s' % self.options)
 		# todo need material,bounding_box_area here
 		_mrbeam_plugin_implementation._analytics_handler.store_conversion_details(self.options)
@@ -115,18 +143,35 @@ class Converter():
 		return str
 
 	def convert(self, is_job_cancelled, on_progress=None, on_progress_args=None, on_progress_kwargs=None):
-
-		#TODO check if job cancelled by calling is_job_cancelled()
+		"""
+		:param is_job_cancelled: called before every path and image row, raises to abort the conversion
+		"""
+		self._is_job_cancelled = is_job_cancelled or (lambda: None)
 		self.init_output_file()
 		self.check_free_space() # has to be after init_output_file (which removes old temp files occasionally)
 		
-		self.parse()
+		try:
+			self._convert(is_job_cancelled, on_progress, on_progress_args, on_progress_kwargs)
+		finally:
+			for data in self._image_data.values():
+				data.remove()
+			self._image_data = {}
+			if(self._fragments is not None):
+				self._fragments.evict()
+
+	def _convert(self, is_job_cancelled, on_progress, on_progress_args, on_progress_kwargs):
+		with self.profiler.stage('parse'):
+			self.parse()
+			self._track_memory()
+		self._is_job_cancelled()
 		options = self.options
 		options['doc_root'] = self.document.getroot()
 
 		# Get all Gcodetools data from the scene.
-		self.calculate_conversion_matrix()
-		self.collect_paths()
+		with self.profiler.stage('collect_paths'):
+			self.calculate_conversion_matrix()
+			self.collect_paths()
+			self._track_memory()
 
 		for p in self.paths :
 			#print "path", etree.tostring(p)
@@ -159,7 +204,8 @@ class Converter():
 		processedItemCount = 0
 		report_progress(on_progress, on_progress_args, on_progress_kwargs, processedItemCount, itemAmount)
 
-		with open(self._tempfile, 'a') as fh:
+		with open(self._tempfile, 'a') as tmp_fh:
+			fh = GcodeWriter(tmp_fh)
 			# write comments to gcode
 			gc_options_str = "; gc_nexgen gc_options: {}\n".format(self.gc_options)
 			fh.write(gc_options_str)
@@ -171,6 +217,7 @@ class Converter():
 
 			# images
 			self._log.info( 'Raster conversion: %s' % self.options['engrave'])
+			image_jobs = []
 			for layer in self.layers :
 				if layer in self.images and self.options['engrave']:
 					for imgNode in self.images[layer] :
@@ -208,47 +255,62 @@ class Converter():
 						# intensity_black = 1000, intensity_white = 0, speed_black = 30, speed_white = 500,
 						# dithering = True, pierce_time = 500, separation = True, material = "default"
 						rasterParams = self.options['raster']
-						ip = ImageProcessor(output_filehandle = fh,
-											workingAreaWidth = self.workingAreaWidth,
-											workingAreaHeight = self.workingAreaHeight,
-						                    contrast = rasterParams['contrast'],
-						                    sharpening = rasterParams['sharpening'],
-						                    beam_diameter = rasterParams['beam_diameter'],
-											intensity_black = rasterParams['intensity_black'],
-											intensity_white = rasterParams['intensity_white'],
-											intensity_black_user = rasterParams['intensity_black_user'],
-											intensity_white_user = rasterParams['intensity_white_user'],
-											speed_black = rasterParams['speed_black'],
-											speed_white = rasterParams['speed_white'],
-											dithering = rasterParams['dithering'],
-											pierce_time = rasterParams['pierce_time'],
-											engraving_mode = rasterParams['engraving_mode'],
-											material = rasterParams['material'] if 'material' in rasterParams else None)
-						data = imgNode.get('href')
-						if(data is None):
-							data = imgNode.get(_add_ns('href', 'xlink'))
-
-						if(data.startswith("data:")):
-							ip.dataUrl_to_gcode(data, w, h, upperLeft[0], lowerRight[1], file_id)
-						elif(data.startswith("http://")):
-							ip.imgurl_to_gcode(data, w, h, upperLeft[0], lowerRight[1], file_id)
+						ip_params = dict(workingAreaWidth = self.workingAreaWidth,
+										workingAreaHeight = self.workingAreaHeight,
+										contrast = rasterParams['contrast'],
+										sharpening = rasterParams['sharpening'],
+										beam_diameter = rasterParams['beam_diameter'],
+										intensity_black = rasterParams['intensity_black'],
+										intensity_white = rasterParams['intensity_white'],
+										intensity_black_user = rasterParams['intensity_black_user'],
+										intensity_white_user = rasterParams['intensity_white_user'],
+										speed_black = rasterParams['speed_black'],
+										speed_white = rasterParams['speed_white'],
+										dithering = rasterParams['dithering'],
+										pierce_time = rasterParams['pierce_time'],
+										engraving_mode = rasterParams['engraving_mode'],
+										material = rasterParams['material'] if 'material' in rasterParams else None,
+										raster_engine = rasterParams.get('raster_engine', None))
+						href = imgNode.get('href')
+						if(href is None):
+							href = imgNode.get(_add_ns('href', 'xlink'))
+						image_id = imgNode.get(_add_ns('image_id', 'mb'))
+						path = None
+						data = None
+						if(image_id is not None):
+							# uploaded image, read from its file
+							path = self._image_store.get_image_path(image_id) if self._image_store is not None else None
+							if(path is None):
+								raise UnknownImageException("Unknown image id {}".format(image_id))
+							file_id = file_id or href or ''
 						else:
-							self._log.error("Unable to parse img data", data)
+							data = self._image_data.get(imgNode)
+							if(data is None):
+								data = href
 
-						processedItemCount += 1
-						report_progress(on_progress, on_progress_args, on_progress_kwargs, processedItemCount, itemAmount)
+							if(not data.startswith("data:") and not data.startswith("http://")):
+								self._log.error("Unable to parse img data", data)
+								data = None
+
+						image_jobs.append(dict(params=ip_params, data=data, path=path, image_id=image_id, w=w, h=h, x=upperLeft[0], y=lowerRight[1], file_id=file_id))
 					else:
 						self._log.info("postponing non-image layer %s" % ( layer.get('id') ))
 
+			for _ in self._convert_images(image_jobs, fh):
+				self._track_memory()
+				processedItemCount += 1
+				report_progress(on_progress, on_progress_args, on_progress_kwargs, processedItemCount, itemAmount)
+
 
 			# paths
 			self._log.info( 'Vector conversion: %s paths' % len(self.paths))
+			planner = JobPlanner(two_opt=self._two_opt, travel_speed=self._travel_speed)
 
 			for layer in self.layers :
 				if layer in self.paths :
 					paths_by_color = dict()
 					for path in self.paths[layer] :
-						self._log.info("path %s, %s, stroke: %s, fill: %s, mb:gc: %s" % ( layer.get('id'), path.get('id'), path.get('stroke'), path.get('class'), path.get(_add_ns('gc', 'mb'))[:100] ))
+						self._log.info("path %s, %s, stroke: %s, fill: %s, mb:gc: %s" % ( layer.get('id'), path.get('id'), path.get('stroke'), path.get('class'), (path.get(_add_ns('gc', 'mb')) or '')[:100] ))
 
 #						if path.get('stroke') is not None: #todo catch None stroke/fill earlier
 #							stroke = path.get('stroke')
@@ -286,7 +348,6 @@ class Converter():
 
 					#pierce_time = self.options['pierce_time']
 					layerId = layer.get('id') or '?'
-					pathId = path.get('id') or '?'
 
 					#for each color generate GCode
 					#for colorKey in curvesD.keys():
@@ -300,34 +361,169 @@ class Converter():
 							continue
 
 						for path in paths_by_color[colorKey]:
-							#print('p', path)
-							curveGCode = ""
-							mbgc = path.get(_add_ns('gc', 'mb'), None)
-							if(mbgc != None):
-								curveGCode = self._use_embedded_gcode(mbgc, colorKey, settings)
-							else:
-								d = path.get('d')
-								csp = cubicsuperpath.parsePath(d)
-								csp = self._apply_transforms(path, csp)
-								curve = self._parse_curve(csp, layer)
-								curveGCode = self._generate_gcode(curve, settings, colorKey)
-
-
-							fh.write("; Layer:" + layerId + ", outline of:" + pathId + ", stroke:" + colorKey +', '+str(settings)+"\n")
-							for p in range(0, int(settings['passes'])):
-								fh.write("; pass:%i/%s\n" % (p+1, settings['passes']))
-								fh.write(curveGCode)
-
-			fh.write(self._get_gcode_footer())
-
-		self.export_gcode()
-
+							self._is_job_cancelled()
+							pathId = path.get('id') or '?'
+							curveGCode, start, end, bbox = self._get_path_gcode(path, layer, colorKey, settings)
+							comment = "; Layer:" + layerId + ", outline of:" + pathId + ", stroke:" + colorKey +', '+str(settings)+"\n"
+							planner.add(curveGCode, start, end, bbox, passes=int(settings['passes']), engrave=self._is_vector_engraving(settings), comment=comment)
+							if(self._streaming):
+								path.clear() # not needed anymore, frees the path data
+
+			with self.profiler.stage('job_planning'):
+				units = planner.plan()
+			with self.profiler.stage('job_output'):
+				for unit in units:
+					fh.write(unit['comment'])
+					for p in range(0, unit['passes']):
+						fh.write("; pass:%i/%s\n" % (p+1, unit['passes']))
+						fh.write(unit['gcode'])
+				self._track_memory()
+				self._log.info(planner.pp())
+
+				fh.write(self._get_gcode_footer())
+				fh.close()
+			self.profiler.info.update(fh.get_stats())
+			self.profiler.info.update(paths=sum(len(p) for p in self.paths.values()), images=len(image_jobs), workers=self._workers,
+			                          streaming=self._streaming, fragments=self._fragment_stats if self._fragments is not None else None)
+			self._log.info("Conversion output: %s", fh.pp())
+			self._log.info("Subpath ordering: %s subpaths, travel %.1fmm -> %.1fmm, saved %.1fmm",
+			               self._travel_stats['subpaths'], self._travel_stats['before'], self._travel_stats['after'],
+			               self._travel_stats['before'] - self._travel_stats['after'])
+			if(self._simplify_tolerance > 0):
+				self._log.info("Curve simplification (tolerance %smm): {segments_before} -> {segments_after} segments, "
+				               "estimated cutting time {time_before:.1f}s -> {time_after:.1f}s".format(**self._simplify_stats), self._simplify_tolerance)
+			self._log.info("Peak memory: %s during conversion, %s process high-water mark, %s worker processes (streaming parse: %s)",
+			               self._get_human_readable_bytes(self._peak_memory),
+			               self._get_human_readable_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+			               self._get_human_readable_bytes(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024),
+			               self._streaming)
+			if(self._fragments is not None):
+				self._log.info("Fragments reused: {paths_reused}/{paths} paths, {images_reused}/{images} images. ".format(**self._fragment_stats) + self._fragments.pp())
+
+		with self.profiler.stage('export'):
+			self.export_gcode()
+		self._log.info(self.profiler.pp())
+
+	def get_profile(self):
+		"""
+		:returns: per stage timings and memory high-water marks of the last conversion, see ConversionProfiler
+		"""
+		data = self.profiler.get_data()
+		data['memory'].update(maxrss_self=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+		                      maxrss_children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+		return data
+
+
+	def _convert_images(self, image_jobs, fh):
+		"""
+		Converts the collected images to gcode and writes it to fh in document order.
+		With more than one worker the images are converted concurrently into temporary chunk files
+		which are appended to fh once all images are done.
+		Yields once for every finished image (for progress reporting).
+		"""
+		if(self._fragments is not None):
+			for _ in self._convert_images_cached(image_jobs, fh):
+				yield
+			return
+
+		if(self._workers <= 1 or len(image_jobs) < 2):
+			for job in image_jobs:
+				_image_to_gcode(job, fh, workers=self._workers, is_job_cancelled=self._is_job_cancelled, profiler=self.profiler)
+				yield
+			return
+
+		start = time.time()
+		workers = min(self._workers, len(image_jobs))
+		self._log.info("Converting %s images with %s worker processes", len(image_jobs), workers)
+		chunk_dir = os.path.dirname(self._tempfile)
+		chunks = [None] * len(image_jobs)
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			tasks = [(i, job, chunk_dir) for i, job in enumerate(image_jobs)]
+			for i, path, stages in imap_cancellable(pool, _image_to_gcode_chunk, tasks, self._is_job_cancelled, ordered=False):
+				chunks[i] = path
+				self.profiler.merge(stages)
+				yield
+			pool.close()
+
+			for path in chunks:
+				with open(path, 'r') as chunk_fh:
+					fh.copy_from(chunk_fh)
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+			for path in chunks:
+				if(path is not None and os.path.exists(path)):
+					os.remove(path)
+		self._log.info("Parallel image conversion took %.2f seconds", time.time() - start)
+
+	def _convert_images_cached(self, image_jobs, fh):
+		"""
+		Like _convert_images(), but images with a cached fragment are not rasterized again.
+		All other images are converted into chunk files which are added to the fragment cache.
+		"""
+		chunk_dir = os.path.dirname(self._tempfile)
+		fragments = [None] * len(image_jobs)
+		chunks = [None] * len(image_jobs)
+		keys = []
+		for i, job in enumerate(image_jobs):
+			key = self._get_image_fragment_key(job)
+			keys.append(key)
+			fragments[i] = self._fragments.get_file(key)
+			if(fragments[i] is not None):
+				yield
+		misses = [i for i in range(len(image_jobs)) if fragments[i] is None]
+		self._fragment_stats['images'] += len(image_jobs)
+		self._fragment_stats['images_reused'] += len(image_jobs) - len(misses)
+
+		pool = None
+		try:
+			if(self._workers > 1 and len(misses) > 1):
+				pool = multiprocessing.Pool(processes=min(self._workers, len(misses)))
+				done = imap_cancellable(pool, _image_to_gcode_chunk, [(i, image_jobs[i], chunk_dir) for i in misses], self._is_job_cancelled, ordered=False)
+			else:
+				done = (_image_to_gcode_chunk((i, image_jobs[i], chunk_dir), workers=self._workers, is_job_cancelled=self._is_job_cancelled) for i in misses)
+			for i, path, stages in done:
+				chunks[i] = path
+				self.profiler.merge(stages)
+				self._fragments.put_file(keys[i], path)
+				yield
+			if(pool is not None):
+				pool.close()
+
+			for i in range(len(image_jobs)):
+				with open(fragments[i] or chunks[i], 'r') as chunk_fh:
+					fh.copy_from(chunk_fh)
+		except:
+			if(pool is not None):
+				pool.terminate()
+			raise
+		finally:
+			if(pool is not None):
+				pool.join()
+			for path in chunks:
+				if(path is not None and os.path.exists(path)):
+					os.remove(path)
+
+	def _get_image_fragment_key(self, job):
+		data = job['data']
+		if(job.get('image_id') is not None):
+			data_hash = job['image_id'] # the id is the hash of the image file
+		elif(isinstance(data, SpooledDataUrl)):
+			data_hash = data.get_hash()
+		else:
+			data_hash = hashlib.sha256(data or '').hexdigest()
+		return self._fragments.get_fragment_key('image', data_hash, job['params'], job['w'], job['h'], job['x'], job['y'], job['file_id'])
 
 	def collect_paths(self):
 		self._log.info( "collect_paths")
 		self.paths = {}
 		self.images = {}
 		self.layers = [self.document.getroot()]
+		self._transforms = {self.document.getroot(): (None, [[1,0,0],[0,1,0]])}
+		self._styles = StyleResolver(self.document.getroot())
 
 		self.gc_options = self.document.getroot().get(_add_ns('gc_options', 'mb'))
 		self._log.info("gc_nexgen gc_options data in svg: %s", self.gc_options)
@@ -339,6 +535,7 @@ class Converter():
 				self._log.debug("recursive search: %i - %s"  %(len(items), g.get("id")))
 
 			for i in items:
+				self._cache_transforms(i)
 				# TODO layer support
 				if i.tag == _add_ns("g",'svg') and i.get(_add_ns('groupmode','inkscape')) == 'layer':
 					styles = simplestyle.parseStyle(i.get("style", ''))
@@ -390,9 +587,12 @@ class Converter():
 		recursive_search(self.document.getroot(), self.document.getroot())
 		self._log.info("self.layers: %i" % len(self.layers))
 		self._log.info("self.paths: %i" % len(self.paths))
+		self._log.info(self._styles.pp())
 
 
 	def parse(self,file=None):
+		if(self._streaming):
+			return self._parse_streaming()
 		try:
 			stream = open(self.svg_file,'r')
 			p = etree.XMLParser(huge_tree=True)
@@ -402,104 +602,66 @@ class Converter():
 		except Exception as e:
 			self._log.error("unable to parse %s: %s" % (self.svg_file, e.message))
 
+	def _parse_streaming(self):
+		"""
+		Parses the svg incrementally. Embedded image data is moved into temporary files right after
+		each image element is parsed and only read again when the image is rasterized.
+		Elements without any relevance for the conversion are emptied.
+		"""
+		image_tag = _add_ns('image', 'svg')
+		discard_tags = (_add_ns('metadata', 'svg'), _add_ns('title', 'svg'), _add_ns('namedview', 'sodipodi'))
+		spool_dir = os.path.dirname(self._tempfile)
+		self._image_data = {}
+		try:
+			context = etree.iterparse(self.svg_file, events=('end',), huge_tree=True)
+			for event, elem in context:
+				if elem.tag == image_tag:
+					for attr in ('href', _add_ns('href', 'xlink')):
+						data = elem.get(attr)
+						if(data is not None and data.startswith("data:")):
+							self._image_data[elem] = SpooledDataUrl(data, spool_dir)
+							del elem.attrib[attr]
+							break
+				elif elem.tag in discard_tags:
+					elem.clear()
+			self.document = context.root.getroottree()
+			self._log.info("parsed %s (streaming, %i embedded images spooled)" % (self.svg_file, len(self._image_data)))
+		except Exception as e:
+			self._log.error("unable to parse %s: %s" % (self.svg_file, e.message))
+
+	def _track_memory(self):
+		usage = _get_memory_usage()
+		self._peak_memory = max(self._peak_memory, usage)
+		self.profiler.track_memory(usage)
+
 	def _handle_image(self, imgNode, layer):
 		self.images[layer] = self.images[layer] + [imgNode] if layer in self.images else [imgNode]
 
 	def _handle_node(self, node, layer):
-		stroke = self._get_stroke(node)
-		fill = self._get_fill(node)
+		style = self._get_style(node)
+		stroke = style.stroke
+		fill = style.fill
 
-		has_classes = node.get('class', None) is not None # TODO parse styles instead of assuming that the style applies visibility
-		visible = has_classes or stroke['visible'] or fill['visible'] or (stroke['color'] == 'unset' and fill['color'] == 'unset')
+		# classes without css rules in the document are assumed to apply visibility
+		visible = style.unresolved_classes or stroke['visible'] or fill['visible'] or (stroke['color'] == 'unset' and fill['color'] == 'unset')
 		processColor = self._process_color(stroke['color'])
 		if(visible and processColor):
-			simpletransform.fuseTransform(node)
+			own, trans = self._transforms.get(node, (None, None))
+			simpletransform.fuseTransform(node, own)
+			if(own is not None):
+				self._transforms[node] = (None, self._get_transforms(node.getparent()))
 			self.paths[layer] = self.paths[layer] + [node] if layer in self.paths else [node]
 
+	def _get_style(self, node):
+		if self._styles is None:
+			self._styles = StyleResolver(self.document.getroot())
+		return self._styles.resolve(node)
+
 	def _get_stroke(self, node):
-		stroke = {}
-		stroke['width'] = 1
-		stroke['width_unit'] = "px"
-		stroke['color'] = 'unset'
-		stroke['opacity'] = 1
-		stroke['visible'] = True
-
-		#"stroke", "stroke-width", "stroke-opacity", "opacity"
-		styles = simplestyle.parseStyle(node.get("style"))
-		color = node.get('stroke', None)
-		if(color is None):
-			if("stroke" in styles):
-				color = styles["stroke"]
-
-		if(color != None and color != 'none' and color != ''):
-			stroke['color'] = color
-
-		width = node.get('stroke-width', '')
-		if(width is ''):
-			if("stroke-width" in styles):
-				width = styles["stroke-width"]
-		if(width != 'none' and width != ''):
-			try:
-				strokeWidth = float(re.sub(r'[^\d.]+', '', width))
-				stroke['width'] = strokeWidth
-				# todo: unit
-			except ValueError:
-				pass
-
-		stroke_opacity = node.get('stroke-opacity', 1)
-		if(stroke_opacity is 1):
-			if ("stroke-opacity" in styles):
-				try:
-					stroke_opacity = float(styles["stroke-opacity"])
-				except ValueError:
-					pass
-
-		opacity = node.get('opacity', 1)
-		if(opacity is 1):
-			if ("opacity" in styles):
-				try:
-					opacity = float(styles["opacity"])
-				except ValueError:
-					pass
-
-		stroke['opacity'] = min(opacity, stroke_opacity)
-		stroke['visible'] = stroke['color'] is not None and stroke['opacity'] > 0 and stroke['width'] > 0
-		return stroke
+		return self._get_style(node).stroke
 
 	def _get_fill(self, node):
-		fill = {}
-		fill['color'] = 'unset'
-		fill['opacity'] = 1
-		fill['visible'] = True
-
-		#"fill", "fill-opacity", "opacity"
-		styles = simplestyle.parseStyle(node.get("style"))
-		color = node.get('fill', None)
-		if(color is None):
-			if("fill" in styles):
-				color = styles["fill"]
-		if(color != None and color != 'none' and color != ''):
-			fill['color'] = color
-
-		fill_opacity = node.get('fill-opacity', 1)
-		if(fill_opacity is 1):
-			if ("fill-opacity" in styles):
-				try:
-					fill_opacity = float(styles["fill-opacity"])
-				except ValueError:
-					pass
-
-		opacity = node.get('opacity', 1)
-		if(opacity is 1):
-			if ("opacity" in styles):
-				try:
-					opacity = float(styles["opacity"])
-				except ValueError:
-					pass
-
-		fill['opacity'] = min(opacity, fill_opacity)
-		fill['visible'] = fill['color'] is not None and fill['opacity'] > 0
-		return fill
+		return self._get_style(node).fill
 
 	def _process_color(self, color):
 		if(color in self.colorParams.keys()):
@@ -522,13 +684,35 @@ class Converter():
 			return False
 
 	def _apply_transforms(self,g,csp):
-		trans = self._get_transforms(g)
-		if trans != [[1,0,0],[0,1,0]]: #todo can trans be [] anyways?
-			self._log.warn("still transforms in the SVG %s" % trans)
+		trans = self._get_svg_transforms(g)
+		if trans is not None:
 			simpletransform.applyTransformToPath(trans, csp)
 		return csp
 
+	def _get_svg_transforms(self, g):
+		# None if there are no svg transforms left
+		trans = self._get_transforms(g)
+		if trans == [[1,0,0],[0,1,0]]: #todo can trans be [] anyways?
+			return None
+		self._log.warn("still transforms in the SVG %s" % trans)
+		return trans
+
+	def _cache_transforms(self, node):
+		"""
+		Stores the parsed transform of node and the transform composed with all its ancestors.
+		Has to be called top-down, so the parent is always cached already.
+		"""
+		parent_trans = self._get_transforms(node.getparent())
+		t = node.get('transform')
+		if(t is None):
+			self._transforms[node] = (None, parent_trans)
+		else:
+			own = simpletransform.parseTransform(t)
+			self._transforms[node] = (own, simpletransform.composeTransform(parent_trans, own))
+
 	def _get_transforms(self,g):
+		if g in self._transforms:
+			return self._transforms[g][1]
 		root = self.document.getroot()
 		trans = [[1,0,0],[0,1,0]]
 		while (g != root):
@@ -540,48 +724,139 @@ class Converter():
 			g = g.getparent()
 		return trans
 
-	def _parse_curve(self, p, layer, w = None, f = None):
+	def _get_path_gcode(self, path, layer, color, settings):
+		"""
+		Returns gcode, start and end point and bounding box (in mm) of a path.
+		Reuses the fragment of an earlier conversion if the path, its transforms and its settings are unchanged.
+		"""
+		if(self._fragments is None):
+			return self._generate_path_gcode(path, layer, color, settings)
+
+		self._fragment_stats['paths'] += 1
+		# everything _generate_path_gcode() depends on has to be part of the key
+		key = self._fragments.get_fragment_key('path', ' '.join((path.get('d') or '').split()), path.get(_add_ns('gc', 'mb')),
+		                                       self._get_transforms(path), self._get_layer_matrix(layer), color, settings,
+		                                       self._simplify_tolerance, self._two_opt)
+		fragment = self._fragments.load(key)
+		if(fragment is None):
+			travel_before, simplify_before = dict(self._travel_stats), dict(self._simplify_stats)
+			result = self._generate_path_gcode(path, layer, color, settings)
+			# stats of the fragment, added again whenever it is reused
+			travel = dict([(k, self._travel_stats[k] - v) for k, v in travel_before.items()])
+			simplify = dict([(k, self._simplify_stats[k] - v) for k, v in simplify_before.items()])
+			self._fragments.store(key, dict(result=result, travel_stats=travel, simplify_stats=simplify))
+			return result
+
+		self._fragment_stats['paths_reused'] += 1
+		for k, v in fragment['travel_stats'].items():
+			self._travel_stats[k] += v
+		for k, v in fragment['simplify_stats'].items():
+			self._simplify_stats[k] += v
+		return fragment['result']
+
+	def _generate_path_gcode(self, path, layer, color, settings):
+		# paths with embedded gcode are measured by the coordinates in their gcode
+		mbgc = path.get(_add_ns('gc', 'mb'), None)
+		if(mbgc != None):
+			gcode = self._use_embedded_gcode(mbgc, color, settings)
+			if "G91" in mbgc:
+				return gcode, None, None, None
+			xs = [float(x) for x in self._REGEX_X.findall(mbgc)]
+			ys = [float(y) for y in self._REGEX_Y.findall(mbgc)]
+			if(len(xs) == 0 or len(ys) == 0):
+				return gcode, None, None, None
+			return gcode, [xs[0], ys[0]], [xs[-1], ys[-1]], (min(xs), min(ys), max(xs), max(ys))
+		else:
+			d = path.get('d')
+			with self.profiler.stage('path_parse'):
+				csp = cubicsuperpath.parsePath(d)
+			curve = self._parse_curve(csp, layer, transform=self._get_svg_transforms(path))
+			if(self._simplify_tolerance > 0):
+				with self.profiler.stage('simplify'):
+					curve = self._simplify_curve(curve, settings)
+			with self.profiler.stage('path_emission'):
+				gcode = self._generate_gcode(curve, settings, color)
+			if(len(curve) == 0):
+				return gcode, None, None, None
+			xs = [pt[0][0] for pt in curve]
+			ys = [pt[0][1] for pt in curve]
+			return gcode, curve[0][0], curve[-1][0], (min(xs), min(ys), max(xs), max(ys))
+
+	def _simplify_curve(self, curve, settings):
+		curve, stats = simplify_curve(curve, self._simplify_tolerance)
+		passes = int(settings['passes'])
+		feedrate = float(settings['feedrate'])
+		self._simplify_stats['segments_before'] += stats['segments_before'] * passes
+		self._simplify_stats['segments_after'] += stats['segments_after'] * passes
+		self._simplify_stats['time_before'] += stats['length_before'] / feedrate * 60 * passes
+		self._simplify_stats['time_after'] += stats['length_after'] / feedrate * 60 * passes
+		return curve
+
+	def _is_vector_engraving(self, settings):
+		# line engravings get job ids like vector_engrave_0 in the frontend
+		return str(settings.get('job', '')).startswith('vector_engrave')
+
+	def _add_subpath_travel_stats(self, stats):
+		self._travel_stats['subpaths'] += stats['count']
+		self._travel_stats['before'] += stats['before']
+		self._travel_stats['after'] += stats['after']
+
+	def _parse_curve(self, p, layer, w = None, f = None, transform = None):
 			c = []
 			if len(p)==0 :
 				return []
-			p = self._transform_csp(p, layer)
+			with self.profiler.stage('transform'):
+				p = self._transform_csp(p, layer, transform=transform)
 
 			### Sort to reduce Rapid distance
-			k = range(1,len(p))
-			keys = [0]
-			while len(k)>0:
-				end = p[keys[-1]][-1][1]
-				dist = None
-				for i in range(len(k)):
-					start = p[k[i]][0][1]
-					dist = max(   ( -( ( end[0]-start[0])**2+(end[1]-start[1])**2 ) ,i)	,   dist )
-				keys += [k[dist[1]]]
-				del k[dist[1]]
+			with self.profiler.stage('subpath_ordering'):
+				keys, stats = path_ordering.order_paths([(sp[0][1], sp[-1][1]) for sp in p], start=p[0][0][1], two_opt=self._two_opt)
+				self._add_subpath_travel_stats(stats)
 
 			#keys = range(1,len(p)) # debug unsorted.
-			for k in keys:
-				subpath = p[k]
-				c += [ [	[subpath[0][1][0],subpath[0][1][1]]   , 'move', 0, 0] ]
-				for i in range(1,len(subpath)):
-					sp1 = [  [subpath[i-1][j][0], subpath[i-1][j][1]] for j in range(3)]
-					sp2 = [  [subpath[i  ][j][0], subpath[i  ][j][1]] for j in range(3)]
-					c += biarc(sp1,sp2,0,0) if w==None else biarc(sp1,sp2,-f(w[k][i-1]),-f(w[k][i]))
-				c += [ [ [subpath[-1][1][0],subpath[-1][1][1]]  ,'end',0,0] ]
+			with self.profiler.stage('biarc'):
+				if w == None:
+					# all segments of all subpaths in one batch
+					biarcs = iter(biarc_segments([(p[k][i-1], p[k][i]) for k in keys for i in range(1,len(p[k]))]))
+				for k in keys:
+					subpath = p[k]
+					c += [ [	[subpath[0][1][0],subpath[0][1][1]]   , 'move', 0, 0] ]
+					for i in range(1,len(subpath)):
+						if w == None:
+							c += next(biarcs)
+						else:
+							sp1 = [  [subpath[i-1][j][0], subpath[i-1][j][1]] for j in range(3)]
+							sp2 = [  [subpath[i  ][j][0], subpath[i  ][j][1]] for j in range(3)]
+							c += biarc(sp1,sp2,-f(w[k][i-1]),-f(w[k][i]))
+					c += [ [ [subpath[-1][1][0],subpath[-1][1][1]]  ,'end',0,0] ]
 
 			#self._log.debug("Curve: " + str(c))
 			return c
 
-	def _transform_csp(self, csp_, layer, reverse = False):
-		self._log.debug("_transform_csp %s , %s, %s" % (csp_, layer, reverse))
-		csp = [  [ [csp_[i][j][0][:],csp_[i][j][1][:],csp_[i][j][2][:]]  for j in range(len(csp_[i])) ]   for i in range(len(csp_)) ]
-		for i in xrange(len(csp)):
-			for j in xrange(len(csp[i])):
-				for k in xrange(len(csp[i][j])):
-					csp[i][j][k] = self._transform(csp[i][j][k],layer, reverse)
+	def _transform_csp(self, csp_, layer, reverse = False, transform = None):
+		"""
+		Transforms all points of a cubic super path to mm in one matrix multiplication.
+		:param transform: optional svg transform [[a,c,e],[b,d,f]] applied before the layer transformation
+		"""
+		t = numpy.array(self._get_layer_matrix(layer, reverse), dtype=float)
+		if transform is not None:
+			t = t.dot(numpy.array(transform + [[0, 0, 1]], dtype=float))
+		lengths = [len(subpath) for subpath in csp_]
+		points = numpy.array([pt[:2] for subpath in csp_ for node in subpath for pt in node], dtype=float).reshape(-1, 2)
+		points = (points.dot(t[:2, :2].T) + t[:2, 2]).reshape(-1, 3, 2).tolist()
+		csp = []
+		i = 0
+		for l in lengths:
+			csp.append(points[i:i+l])
+			i += l
 		return csp
 
 	def _transform(self, source_point, layer, reverse=False):
-		self._log.debug('_transform %s,%s,%s ' % (source_point, layer, reverse))
+		x,y = source_point[0], source_point[1]
+		t = self._get_layer_matrix(layer, reverse)
+		return [t[0][0]*x+t[0][1]*y+t[0][2], t[1][0]*x+t[1][1]*y+t[1][2]]
+
+	def _get_layer_matrix(self, layer, reverse=False):
 		if layer == None :
 			layer = self.document.getroot()
 		if layer not in self.transform_matrix:
@@ -631,12 +906,10 @@ class Converter():
 			self.transform_matrix_reverse[layer] = numpy.linalg.inv(self.transform_matrix[layer]).tolist()
 
 
-		x,y = source_point[0], source_point[1]
 		if not reverse :
-			t = self.transform_matrix[layer]
+			return self.transform_matrix[layer]
 		else :
-			t = self.transform_matrix_reverse[layer]
-		return [t[0][0]*x+t[0][1]*y+t[0][2], t[1][0]*x+t[1][1]*y+t[1][2]]
+			return self.transform_matrix_reverse[layer]
 
 ################################################################################
 ###
@@ -647,62 +920,61 @@ class Converter():
 ###
 ################################################################################
 	def _generate_gcode(self, curve, settings, color='#000000'):
-		self._log.info( "_generate_gcode()")
+		"""
+		Returns the gcode for curve. It is kept as a string because the JobPlanner
+		reorders the paths and the fragment cache stores it.
+		"""
+		return ''.join(self._iter_gcode(curve, settings, color))
 
-		def c(c):
-			# returns gcode for coordinates/parameters
-			c = [c[i] if i < len(c) else None for i in range(6)]  # fills missing coordinates/parameters with none
-			if c[5] == 0: c[5] = None
-			s = [" X", " Y", " Z", " I", " J", " K"]
-			r = ''
-			for i in range(6):
-				if c[i] != None:
-					r += s[i] + ("%.4f" % (round(c[i], 4)))  # truncating leads to invalid GCODE ID33
-			return r
+	def _iter_gcode(self, curve, settings, color='#000000'):
+		# yields the gcode lines (including \n) of a curve
+		if len(curve) == 0: return
 
-		if len(curve) == 0: return ""
-
-		self._log.debug("Curve: " + str(curve))
-		g = ""
+		move_tpl = "G0 X%.4f Y%.4f\n" + machine_settings.gcode_before_path_color(color, settings['intensity']) + "\n"
+		pt = int(settings['pierce_time'])
+		if pt > 0:
+			move_tpl += "G4P%.3f\n" % (round(pt / 1000.0, 4))
+		end_line = machine_settings.gcode_after_path() + "\n"
+		f = "F%s;%s" % (settings['feedrate'], color)
+		line_feed = "G01 " + f + "\n"
+		arc_feed = "G01" + f + "\n"
+		line_tpl = "G01  X%.4f Y%.4f\n"
+		arc_line_tpls = {True: "G01 X%.4f Y%.4f" + f + "\n", False: "G01 X%.4f Y%.4f\n"}
+		arc_tpls = {True: "G02 X%.4f Y%.4f I%.4f J%.4f\n", False: "G03 X%.4f Y%.4f I%.4f J%.4f\n"}
+		arc_r_tpls = {True: "G02 X%.4f Y%.4f R%f\n", False: "G03 X%.4f Y%.4f R%f\n"}
 
 		lg = 'G00'
-		f = "F%s;%s" % (settings['feedrate'], color)
-		for i in range(1, len(curve)):
+		for i in xrange(1, len(curve)):
 			#	Creating Gcode for curve between s=curve[i-1] and si=curve[i] start at s[0] end at s[4]=si[0]
 			s = curve[i - 1]
 			si = curve[i]
-			feed = f if lg not in ['G01', 'G02', 'G03'] else ''
-			if s[1] == 'move':
-				g += "G0" + c(si[0]) + "\n" + machine_settings.gcode_before_path_color(color, settings['intensity']) + "\n"
-				pt = int(settings['pierce_time'])
-				if pt > 0:
-					g += "G4P%.3f\n" % (round(pt / 1000.0, 4))
+			t = s[1]
+			if t == 'move':
+				yield move_tpl % (round(si[0][0], 4), round(si[0][1], 4))
 				lg = 'G00'
-			elif s[1] == 'end':
-				g += machine_settings.gcode_after_path() + "\n"
+			elif t == 'end':
+				yield end_line
 				lg = 'G00'
-			elif s[1] == 'line':
-				if lg == "G00": g += "G01 " + feed + "\n"
-				g += "G01 " + c(si[0]) + "\n"
+			elif t == 'line':
+				if lg == 'G00': yield line_feed
+				yield line_tpl % (round(si[0][0], 4), round(si[0][1], 4))
 				lg = 'G01'
-			elif s[1] == 'arc':
-				r = [(s[2][0] - s[0][0]), (s[2][1] - s[0][1])]
-				if lg == "G00": g += "G01" + feed + "\n"
-				if (r[0] ** 2 + r[1] ** 2) > .1:
-					r1, r2 = (Point(s[0]) - Point(s[2])), (Point(si[0]) - Point(s[2]))
-					if abs(r1.mag() - r2.mag()) < 0.001:
-						g += ("G02" if s[3] < 0 else "G03") + c(
-							si[0] + [None, (s[2][0] - s[0][0]), (s[2][1] - s[0][1])]) + "\n"
+			elif t == 'arc':
+				rx, ry = (s[2][0] - s[0][0]), (s[2][1] - s[0][1])
+				if lg == 'G00': yield arc_feed
+				if (rx ** 2 + ry ** 2) > .1:
+					r1 = hypot(s[0][0] - s[2][0], s[0][1] - s[2][1])
+					r2 = hypot(si[0][0] - s[2][0], si[0][1] - s[2][1])
+					if abs(r1 - r2) < 0.001:
+						yield arc_tpls[s[3] < 0] % (round(si[0][0], 4), round(si[0][1], 4), round(rx, 4), round(ry, 4))
 					else:
-						r = (r1.mag() + r2.mag()) / 2
-						g += ("G02" if s[3] < 0 else "G03") + c(si[0]) + " R%f" % (r) + "\n"
+						yield arc_r_tpls[s[3] < 0] % (round(si[0][0], 4), round(si[0][1], 4), (r1 + r2) / 2)
 					lg = 'G02'
 				else:
-					g += "G01" + c(si[0]) + feed + "\n"
+					yield arc_line_tpls[lg == 'G00'] % (round(si[0][0], 4), round(si[0][1], 4))
 					lg = 'G01'
 		if si[1] == 'end':
-			g += machine_settings.gcode_after_path() + "\n"
-		return g
+			yield end_line
 
 	def _use_embedded_gcode(self, gcode, color, settings) :
 		self._log.debug( "_use_embedded_gcode() %s", gcode[:100])
@@ -853,7 +1125,85 @@ class Converter():
 
 		return [[1,0,0],[0,1,0], [0,0,1]]
 
+def _image_to_gcode(job, output_filehandle, workers=1, is_job_cancelled=None, profiler=None):
+	if(job.get('path') is not None):
+		ip = ImageProcessor(output_filehandle = output_filehandle, workers = workers, is_job_cancelled = is_job_cancelled, profiler = profiler, **job['params'])
+		ip.img_to_gcode(job['path'], job['w'], job['h'], job['x'], job['y'], job['file_id'])
+		return
+	data = job['data']
+	if(data is None):
+		return
+	if(isinstance(data, SpooledDataUrl)):
+		data = data.read()
+	ip = ImageProcessor(output_filehandle = output_filehandle, workers = workers, is_job_cancelled = is_job_cancelled, profiler = profiler, **job['params'])
+	if(data.startswith("data:")):
+		ip.dataUrl_to_gcode(data, job['w'], job['h'], job['x'], job['y'], job['file_id'])
+	else:
+		ip.imgurl_to_gcode(data, job['w'], job['h'], job['x'], job['y'], job['file_id'])
+
+
+def _image_to_gcode_chunk(task, workers=1, is_job_cancelled=None):
+	# runs in a worker process, see Converter._convert_images()
+	index, job, chunk_dir = task
+	profiler = ConversionProfiler()
+	fd, path = tempfile.mkstemp(prefix="_converter_image_{}_".format(index), suffix=".gco", dir=chunk_dir)
+	try:
+		with os.fdopen(fd, 'w') as chunk_fh:
+			writer = GcodeWriter(chunk_fh)
+			_image_to_gcode(job, writer, workers=workers, is_job_cancelled=is_job_cancelled, profiler=profiler)
+			writer.close()
+	except:
+		os.remove(path)
+		raise
+	return index, path, profiler.stages
+
+
+def _get_memory_usage():
+	# current resident set size in bytes
+	try:
+		with open('/proc/self/statm', 'r') as statm:
+			return int(statm.read().split()[1]) * resource.getpagesize()
+	except (IOError, IndexError, ValueError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SpooledDataUrl():
+	"""
+	An image data url kept in a temporary file until the image gets rasterized.
+	Can be handed to worker processes, only the file path is pickled.
+	"""
+
+	def __init__(self, data, directory=None):
+		self.prefix = data[:data.find(',') + 1]
+		self.length = len(data)
+		fd, self.path = tempfile.mkstemp(prefix="_converter_image_data_", dir=directory)
+		with os.fdopen(fd, 'w') as fh:
+			fh.write(data)
+
+	def startswith(self, prefix):
+		return self.prefix.startswith(prefix)
+
+	def read(self):
+		with open(self.path, 'r') as fh:
+			return fh.read()
+
+	def get_hash(self):
+		h = hashlib.sha256()
+		with open(self.path, 'r') as fh:
+			for chunk in iter(lambda: fh.read(1024 * 1024), ''):
+				h.update(chunk)
+		return h.hexdigest()
+
+	def remove(self):
+		if(os.path.exists(self.path)):
+			os.remove(self.path)
+
+
 class OutOfSpaceException(Exception):
 	pass
 
 
+class UnknownImageException(Exception):
+	pass
+
+
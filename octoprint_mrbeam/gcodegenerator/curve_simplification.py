@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+curve_simplification.py
+reduces the number of segments of a biarc curve
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Curve definition see Converter._parse_curve(): [start point, type = {'arc','line','move','end'}, arc center, arc angle, ...]
+Every segment ends at the start point of the next entry.
+ - runs of lines (and arcs too small to be written as arcs) are simplified with Douglas-Peucker
+ - consecutive arcs on the same circle in the same direction are merged
+"""
+
+import math
+
+import numpy
+
+# arcs with a squared radius below this are written as G01 by Converter._generate_gcode()
+MIN_ARC_RADIUS_SQUARED = .1
+# start and end radius have to match this close for I/J arcs in Converter._generate_gcode()
+ARC_RADIUS_TOLERANCE = 0.001
+
+
+def simplify_curve(curve, tolerance):
+	"""
+	:param curve: biarc curve as returned by Converter._parse_curve()
+	:param tolerance: max deviation from the original curve in mm
+	:returns: (simplified curve, stats) - stats is a dict with segments and length before and after
+	"""
+	result = []
+	run = []
+	for i, entry in enumerate(curve):
+		if _is_line(entry):
+			run.append(entry)
+			continue
+		if run:
+			result += _simplify_lines(run, entry[0], tolerance)
+			run = []
+		if entry[1] == 'arc' and result and result[-1][1] == 'arc' and _can_merge(result[-1], entry, _get_end(curve, i), tolerance):
+			prev = result[-1]
+			result[-1] = [prev[0], 'arc', prev[2], prev[3] + entry[3]] + entry[4:]
+		else:
+			result.append(entry)
+	result += run
+
+	stats = dict(segments_before=count_segments(curve), segments_after=count_segments(result),
+	             length_before=curve_length(curve), length_after=curve_length(result))
+	return result, stats
+
+
+def count_segments(curve):
+	return sum(1 for e in curve if e[1] in ('line', 'arc'))
+
+
+def curve_length(curve):
+	length = 0.0
+	for i in range(len(curve) - 1):
+		e = curve[i]
+		if e[1] == 'arc' and not _is_line(e):
+			length += abs(math.hypot(e[0][0] - e[2][0], e[0][1] - e[2][1]) * e[3])
+		elif e[1] in ('line', 'arc'):
+			end = curve[i + 1][0]
+			length += math.hypot(end[0] - e[0][0], end[1] - e[0][1])
+	return length
+
+
+def douglas_peucker(points, tolerance):
+	"""
+	:param points: numpy array of shape (n, 2)
+	:returns: sorted list of indices of the points to keep
+	"""
+	n = len(points)
+	if n < 3:
+		return range(n)
+	keep = numpy.zeros(n, dtype=bool)
+	keep[0] = keep[-1] = True
+	stack = [(0, n - 1)]
+	while stack:
+		first, last = stack.pop()
+		if last - first < 2:
+			continue
+		inner = points[first + 1:last]
+		a, b = points[first], points[last]
+		ab = b - a
+		l = math.hypot(ab[0], ab[1])
+		if l == 0:
+			d = numpy.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+		else:
+			d = numpy.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / l
+		i = int(numpy.argmax(d))
+		if d[i] > tolerance:
+			k = first + 1 + i
+			keep[k] = True
+			stack.append((first, k))
+			stack.append((k, last))
+	return numpy.flatnonzero(keep).tolist()
+
+
+def _is_line(entry):
+	if entry[1] == 'line':
+		return True
+	if entry[1] == 'arc':
+		return (entry[2][0] - entry[0][0]) ** 2 + (entry[2][1] - entry[0][1]) ** 2 <= MIN_ARC_RADIUS_SQUARED
+	return False
+
+
+def _get_end(curve, i):
+	return curve[i + 1][0] if i + 1 < len(curve) else curve[i][0]
+
+
+def _simplify_lines(run, end, tolerance):
+	points = numpy.array([e[0] for e in run] + [end], dtype=float)
+	keep = douglas_peucker(points, tolerance)
+	result = []
+	for j in range(len(keep) - 1):
+		result.append([points[keep[j]].tolist(), 'line', 0, 0, points[keep[j + 1]].tolist(), [0, 0]])
+	return result
+
+
+def _can_merge(arc1, arc2, end, tolerance):
+	# same circle, same direction, still written as I/J arc
+	if arc1[3] * arc2[3] <= 0 or abs(arc1[3] + arc2[3]) >= 2 * math.pi - 1e-6:
+		return False
+	c1, c2 = arc1[2], arc2[2]
+	if math.hypot(c1[0] - c2[0], c1[1] - c2[1]) > tolerance:
+		return False
+	r_start = math.hypot(arc1[0][0] - c1[0], arc1[0][1] - c1[1])
+	r_end = math.hypot(end[0] - c1[0], end[1] - c1[1])
+	return abs(r_start - r_end) < ARC_RADIUS_TOLERANCE
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+fragment_cache.py
+disk cache for the gcode of single svg elements
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+When an edited design is converted again, only elements whose content, effective transform
+or laser settings changed have to be vectorized or rasterized again.
+Vector fragments are pickled dicts, raster fragments are plain gcode files.
+Eviction works like in ConversionCache, but only runs when evict() is called,
+so entries looked up during a conversion stay available until it is done.
+"""
+
+import cPickle as pickle
+import hashlib
+import json
+import os
+import shutil
+
+from conversion_cache import ConversionCache
+
+
+class FragmentCache(ConversionCache):
+
+	SUFFIX = ".frag"
+
+	def __init__(self, directory, max_size=0, min_free_space=0, namespace=None):
+		"""
+		:param namespace: part of every key, e.g. the plugin version, so fragments of older converters are never used
+		"""
+		ConversionCache.__init__(self, directory, max_size=max_size, min_free_space=min_free_space)
+		self.namespace = namespace
+
+	def get_fragment_key(self, *parts):
+		h = hashlib.sha256()
+		h.update(json.dumps(self.namespace))
+		for part in parts:
+			h.update(json.dumps(part, sort_keys=True, default=str))
+		return h.hexdigest()
+
+	def get_file(self, key):
+		"""
+		:returns: path of the cached raster fragment or None
+		"""
+		path = self._get_path(key)
+		try:
+			os.utime(path, None)
+		except OSError:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return path
+
+	def put_file(self, key, source):
+		return self._store(key, lambda tmp: shutil.copyfile(source, tmp))
+
+	def load(self, key):
+		"""
+		:returns: the cached vector fragment or None
+		"""
+		path = self.get_file(key)
+		if path is None:
+			return None
+		try:
+			with open(path, 'rb') as fh:
+				return pickle.load(fh)
+		except Exception as e:
+			self._log.warn("Unable to load fragment %s: %s", key, e)
+			self.hits -= 1
+			self.misses += 1
+			return None
+
+	def store(self, key, fragment):
+		def write(tmp):
+			with open(tmp, 'wb') as fh:
+				pickle.dump(fragment, fh, pickle.HIGHEST_PROTOCOL)
+		return self._store(key, write)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+gcode_writer.py
+buffered sink for generated gcode
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+"""
+
+
+class GcodeWriter():
+	"""
+	Collects gcode in a list and writes it in large blocks to the output file handle.
+	Without a file handle the blocks are kept in memory and can be fetched with getvalue().
+	Counts bytes written and lines emitted.
+	"""
+
+	DEFAULT_BUFFER_SIZE = 1024 * 1024 # 1MB
+
+	def __init__(self, output_filehandle=None, buffer_size=DEFAULT_BUFFER_SIZE):
+		self.output_filehandle = output_filehandle
+		self.buffer_size = buffer_size
+		self.bytes_written = 0
+		self.lines_emitted = 0
+		self.flushes = 0
+		self._buffer = []
+		self._buffered_bytes = 0
+		self._chunks = []
+
+	def write(self, data):
+		"""
+		Buffers data as it is (file handle compatible).
+		"""
+		self._buffer.append(data)
+		self._buffered_bytes += len(data)
+		if(self._buffered_bytes >= self.buffer_size):
+			self.flush()
+
+	def write_line(self, line):
+		"""
+		Buffers one line of gcode and appends a \n.
+		"""
+		self._buffer.append(line)
+		self._buffer.append("\n")
+		self._buffered_bytes += len(line) + 1
+		if(self._buffered_bytes >= self.buffer_size):
+			self.flush()
+
+	def flush(self):
+		if(len(self._buffer) == 0):
+			return
+		data = ''.join(self._buffer)
+		self._buffer = []
+		self._buffered_bytes = 0
+		self.bytes_written += len(data)
+		self.lines_emitted += data.count("\n")
+		self.flushes += 1
+		if(self.output_filehandle is not None):
+			self.output_filehandle.write(data)
+		else:
+			self._chunks.append(data)
+
+	def copy_from(self, filehandle, block_size=DEFAULT_BUFFER_SIZE):
+		"""
+		Appends the content of another file in blocks, e.g. gcode chunks generated in worker processes.
+		"""
+		self.flush()
+		while True:
+			data = filehandle.read(block_size)
+			if(not data):
+				break
+			self._buffer.append(data)
+			self._buffered_bytes += len(data)
+			self.flush()
+
+	def close(self):
+		"""
+		Writes remaining data. Does not close the underlying file handle.
+		"""
+		self.flush()
+		if(self.output_filehandle is not None and hasattr(self.output_filehandle, 'flush')):
+			self.output_filehandle.flush()
+
+	def getvalue(self):
+		"""
+		Returns all gcode written so far if there is no output file handle, otherwise an empty string.
+		"""
+		self.flush()
+		if(len(self._chunks) > 1):
+			self._chunks = [''.join(self._chunks)]
+		return self._chunks[0] if self._chunks else ""
+
+	def get_stats(self):
+		return dict(bytes=self.bytes_written + self._buffered_bytes,
+		            lines=self.lines_emitted + ''.join(self._buffer).count("\n"),
+		            flushes=self.flushes)
+
+	def pp(self):
+		stats = self.get_stats()
+		return "GcodeWriter: {lines} lines, {bytes} bytes in {flushes} block writes".format(**stats)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+image_store.py
+raster images uploaded for conversion
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Images are stored once as binary files and referenced by the sha256 of their content,
+the svg sent to /convert only carries the id in the mb:image_id attribute of the <image> element.
+Old images are evicted like entries of the ConversionCache, except for images pinned by queued or running conversions.
+"""
+
+import collections
+import hashlib
+import re
+import os
+import shutil
+import threading
+
+from PIL import Image
+
+from conversion_cache import ConversionCache
+
+
+class ImageStore(ConversionCache):
+
+	SUFFIX = ".img"
+
+	_REGEX_ID = re.compile(r"^[0-9a-f]{64}$")
+	_REGEX_IMAGE_ID_ATTR = re.compile(r"""image_id\s*=\s*["']([0-9a-f]{64})["']""")
+
+	def __init__(self, directory, max_size=0, min_free_space=0):
+		ConversionCache.__init__(self, directory, max_size=max_size, min_free_space=min_free_space)
+		self._pinned = collections.Counter()
+		self._pinned_lock = threading.Lock()
+
+	def add_file(self, source, move=False):
+		"""
+		Adds the image file source to the store.
+		:param move: moves source into the store instead of copying it, e.g. for temporary upload files
+		:returns: the image id or None if source is not a readable image
+		"""
+		h = hashlib.sha256()
+		with open(source, 'rb') as fh:
+			for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+				h.update(chunk)
+		image_id = h.hexdigest()
+
+		def write(tmp):
+			self._verify(source)
+			if move:
+				shutil.move(source, tmp)
+			else:
+				shutil.copyfile(source, tmp)
+
+		return self._add(image_id, write)
+
+	def add_data(self, data):
+		"""
+		Adds an image given as string of bytes.
+		:returns: the image id or None if data is not a readable image
+		"""
+		image_id = hashlib.sha256(data).hexdigest()
+
+		def write(tmp):
+			with open(tmp, 'wb') as fh:
+				fh.write(data)
+			self._verify(tmp)
+
+		return self._add(image_id, write)
+
+	def get_image_path(self, image_id):
+		"""
+		:returns: path of the image file or None if there is no image with this id
+		"""
+		if image_id is None or not self._REGEX_ID.match(image_id):
+			return None
+		path = self._get_path(image_id)
+		try:
+			os.utime(path, None)
+		except OSError:
+			return None
+		return path
+
+	def get_image_ids(self, svg):
+		"""
+		:returns: set of the ids of all images referenced in the svg string by mb:image_id
+		"""
+		return set(self._REGEX_IMAGE_ID_ATTR.findall(svg))
+
+	def pin(self, image_ids):
+		"""
+		Protects images from eviction until they are unpinned again, e.g. while a conversion using them is queued or running.
+		Pins are counted, every pin() needs a matching unpin().
+		"""
+		with self._pinned_lock:
+			for image_id in image_ids:
+				self._pinned[image_id] += 1
+
+	def unpin(self, image_ids):
+		with self._pinned_lock:
+			for image_id in image_ids:
+				self._pinned[image_id] -= 1
+				if self._pinned[image_id] <= 0:
+					del self._pinned[image_id]
+
+	def get_mimetype(self, path):
+		try:
+			return Image.MIME.get(Image.open(path).format, 'application/octet-stream')
+		except IOError:
+			return 'application/octet-stream'
+
+	def _is_pinned(self, path):
+		with self._pinned_lock:
+			return os.path.basename(path)[:-len(self.SUFFIX)] in self._pinned
+
+	def _verify(self, path):
+		try:
+			Image.open(path).verify()
+		except Exception as e:
+			raise IOError("not a readable image: {}".format(e))
+
+	def _add(self, image_id, write):
+		if self.get_image_path(image_id) is None:
+			if not self._store(image_id, write):
+				return None
+			self.evict()
+		return image_id
@@ -26,13 +26,17 @@ import optparse
 import logging
 from PIL import Image
 from PIL import ImageEnhance
+from conversion_profiler import ConversionProfiler
 import base64
 import cStringIO
 import os.path
 import time
 import sys
 import re
+import multiprocessing
+import numpy
 from img_separator import ImageSeparator
+from gcode_writer import GcodeWriter
 
 class ImageProcessor():
 
@@ -42,6 +46,10 @@ class ImageProcessor():
 
 	ENGRAVING_MODE_DEFAULT      = ENGRAVING_MODE_PRECISE
 
+	RASTER_ENGINE_PIXEL         = 'pixel'  # walks every pixel through the PIL pixel access object
+	RASTER_ENGINE_NUMPY         = 'numpy'  # converts every part into a numpy array once, finds runs with array operations
+
+	RASTER_ENGINE_DEFAULT       = RASTER_ENGINE_NUMPY
 
 	def __init__( self,
 	              output_filehandle = None,
@@ -60,7 +68,13 @@ class ImageProcessor():
 	              engraving_mode = None,
 	              pierce_time = 0,
 	              overshoot_distance = 0, # disabled for now. TODO: enable (1) when switch on delay is HW fixed.
-	              material = None):
+	              material = None,
+	              raster_engine = None,
+	              skip_redundant_words = True,
+	              workers = 1,
+	              parallel_min_pixels = 250000,
+	              is_job_cancelled = None,
+	              profiler = None):
 
 		self.log = logging.getLogger("octoprint.plugins.mrbeam.img2gcode")
 
@@ -85,6 +99,10 @@ class ImageProcessor():
 			self.log.setLevel(logging.DEBUG)
 
 		self.output_filehandle = output_filehandle
+		if(isinstance(output_filehandle, GcodeWriter)):
+			self._gcode_writer = output_filehandle # shared with the caller, who is responsible for closing it
+		else:
+			self._gcode_writer = GcodeWriter(output_filehandle)
 		self.beam = float(beam_diameter) if beam_diameter else 0.25
 		self.pierce_time = float(pierce_time)/1000.0 if pierce_time else 0.0
 		self.pierce_intensity = 1000 # TODO parametrize
@@ -105,6 +123,17 @@ class ImageProcessor():
 		self.engraving_mode = engraving_mode or self.ENGRAVING_MODE_DEFAULT
 		self.separation = (self.engraving_mode == self.ENGRAVING_MODE_FAST)
 		self.line_by_line = (self.engraving_mode == self.ENGRAVING_MODE_BASIC)
+		# raster engine switch. Both engines produce identical gcode.
+		self.raster_engine = raster_engine or self.RASTER_ENGINE_DEFAULT
+		# omit S and F words in G1 commands if the values are already set
+		self.skip_redundant_words = skip_redundant_words
+		# convert image parts in a pool of worker processes. Small images are converted serially.
+		self.workers = int(workers) if workers else 1
+		self.parallel_min_pixels = parallel_min_pixels
+		# called once per image row, raises to abort a cancelled conversion
+		self.is_job_cancelled = is_job_cancelled
+		# collects the timings of the preparation stages and the gcode generation
+		self.profiler = profiler or ConversionProfiler()
 
 		# overshoot settings
 		# given an acceleration of 700mm/s², these are the ways neccessary to reach target speed of
@@ -126,7 +155,7 @@ class ImageProcessor():
 
 		self._lookup_intensity = {}
 		self._lookup_feedrate = {}
-		self._output_gcode = ""
+		self._precompiled_words = None
 		self.gc_ctx = GC_Context()
 
 	def get_settings_as_comment(self, x,y,w,h, file_id = ''):
@@ -190,7 +219,7 @@ class ImageProcessor():
 			img = orig_img
 			self.log.info("scaling - nothing to do, image remains {}x{}".format(orig_w, orig_h))
 
-		self.log.debug("scaling took {} seconds".format(time.time()-start))
+		self._profile("raster_resize", start)
 		if(self.debugPreprocessing):
 			img.save("/tmp/img2gcode_1_resized.png")
 
@@ -218,7 +247,7 @@ class ImageProcessor():
 			whitebg = Image.new('RGBA', (bb_w, bb_h), "white")
 			img = Image.alpha_composite(whitebg, img)
 
-			self.log.debug("transparency removal took {} seconds".format(time.time()-start))
+			self._profile("raster_transparency", start)
 			if(self.debugPreprocessing):
 				img.save("/tmp/img2gcode_2_whitebg.png")
 
@@ -228,7 +257,7 @@ class ImageProcessor():
 		if(self.contrastFactor > 1.0):
 			contrast = ImageEnhance.Contrast(img)
 			img = contrast.enhance(self.contrastFactor) # 1.0 returns original
-			self.log.debug("contrast enhancement took {} seconds".format(time.time()-start))
+			self._profile("raster_contrast", start)
 			if(self.debugPreprocessing):
 				img.save("/tmp/img2gcode_3_contrast.png")
 
@@ -236,7 +265,7 @@ class ImageProcessor():
 		# 4. greyscale
 		start = time.time()
 		img = img.convert('L')
-		self.log.debug("grayscale conversion took {} seconds".format(time.time()-start))
+		self._profile("raster_greyscale", start)
 		if(self.debugPreprocessing):
 			img.save("/tmp/img2gcode_4_greyscale.png")
 
@@ -251,7 +280,7 @@ class ImageProcessor():
 		if(self.sharpeningFactor > 1.0):
 			sharpness = ImageEnhance.Sharpness(img)
 			img = sharpness.enhance(self.sharpeningFactor)
-			self.log.debug("sharpening took {} seconds".format(time.time()-start))
+			self._profile("raster_sharpen", start)
 			if(self.debugPreprocessing):
 				img.save("/tmp/img2gcode_5_sharpened.png")
 
@@ -259,7 +288,7 @@ class ImageProcessor():
 		if(self.dithering == True):
 			start = time.time()
 			img = img.convert('1')
-			self.log.debug("dithering took {} seconds".format(time.time()-start))
+			self._profile("raster_dither", start)
 			if(self.debugPreprocessing):
 				img.save("/tmp/img2gcode_6_dithered.png")
 
@@ -276,17 +305,17 @@ class ImageProcessor():
 			self.log.debug("contour separation starting...")
 			start = time.time()
 			contour_parts = separator.separate_contours(img, x=left, y=upper, threshold=self.ignore_brighter_than+1)
-			self.log.debug("contour separation took {} seconds".format(time.time()-start))
+			self._profile("raster_separation", start)
 			self.log.debug("separated into {} contours".format(len(contour_parts)))
 
 		parts = []
-		start = time.time()
 		if(self.debugPreprocessing):
 			for i,p in enumerate(contour_parts):
 				img_data = p['i']
 				img_data.save("/tmp/img2gcode_7_contourpart_{:0>3}_@{},{}.png".format(i, p['x'], p['y']))
 
 		if(self.separation == True):
+			start = time.time()
 			for cp in contour_parts:
 
 				# 7.2. split contour by left-pixels-first method
@@ -298,8 +327,8 @@ class ImageProcessor():
 				for p in tmp:
 					parts.append({'i': p['i'], 'x': off_x + p['x'], 'y': off_y + p['y'], 'id': p['id']})
 
-				self.log.debug("left-pixels-first separation took {} seconds".format(time.time()-start))
-				self.log.debug("separated into {} parts".format(len(parts)))
+			self._profile("raster_separation", start)
+			self.log.debug("separated into {} parts".format(len(parts)))
 		else:
 			parts.extend(contour_parts)
 
@@ -310,6 +339,10 @@ class ImageProcessor():
 
 		return parts
 
+	def _profile(self, stage, start):
+		duration = time.time() - start
+		self.profiler.add(stage, duration)
+		self.log.debug("%s took %s seconds", stage, duration)
 
 	def generate_gcode(self, imgArray, xMM,yMM,wMM,hMM, file_id):
 		"""
@@ -330,6 +363,7 @@ class ImageProcessor():
         :rtype: string
 		"""
 
+		start = time.time()
 		# write all parameters used for generating the gcode into the file
 		settings_comment = self.get_settings_as_comment(xMM, yMM, wMM, hMM, "")
 		self.log.info("img2gcode conversion started:\n%s" % settings_comment)
@@ -349,55 +383,206 @@ class ImageProcessor():
 
 
 		# iterate through the image parts
-		for img_data in imgArray:
-			# img_data = {'i': px_data, 'x': offset_px_x, 'y':offset_px_y, 'id': id_str}
-			# note: offset_px_x and offset_px_y are offsets from top left of the unseparated original pixel image
-			img = img_data['i']
-			size = img.size # size of the img fraction in pixels
-			height_px = size[1]
+		part_positions = [self._get_part_position_mm(img_data, xMM, yMM, hMM) for img_data in imgArray]
+		if(self._use_worker_pool(imgArray)):
+			direction_positive = self._write_gcode_for_parts_parallel(imgArray, part_positions, direction_positive)
+		else:
+			for img_data, img_pos_mm in zip(imgArray, part_positions):
+				direction_positive = self._write_gcode_for_part(img_data, img_pos_mm, direction_positive)
+
+		self._append_gcode(";EndImage\nM5") # important for gcode preview!
+		self.gc_ctx.laser_active = False
+		if(self._gcode_writer is not self.output_filehandle):
+			self._gcode_writer.close()
+		self._profile("raster_emission", start)
+		self.log.info("img2gcode conversion done. %s", self._gcode_writer.pp())
+		return self._gcode_writer.getvalue()
+
+
+	def _get_part_position_mm(self, img_data, xMM, yMM, hMM):
+		# img_data = {'i': px_data, 'x': offset_px_x, 'y':offset_px_y, 'id': id_str}
+		# note: offset_px_x and offset_px_y are offsets from top left of the unseparated original pixel image
+		# image part has its own pixel offset. Calc general absolute offset in MM
+		x_off = img_data['x']*self.beam + xMM # mm here, img_data['x'] is in pixels
+		y_off = hMM - img_data['y']*self.beam + yMM # mm here, but inverted for the y axis
+		return (x_off, y_off) # lower left corner of partial image in mm
+
+	def _write_gcode_for_part(self, img_data, img_pos_mm, direction_positive):
+		"""
+		Writes GCode for one image part including its begin and end comments.
+		The part does not rely on a feedrate set by previous parts, so it can be generated independently.
+		:returns: direction of the first line of the next part
+		"""
+		img = img_data['i']
+		size = img.size # size of the img fraction in pixels
+		self.gc_ctx.f = None
+
+		self._append_gcode("; Begin part {} @ pixel ({},{}) with dimensions {}x{}".format(img_data['id'], img_data['x'],img_data['y'], size[0], size[1]))
+		if(self.raster_engine == self.RASTER_ENGINE_NUMPY):
+			direction_positive = self.write_gcode_for_part_numpy(img, img_pos_mm, direction_positive)
+		else:
+			direction_positive = self.write_gcode_for_part_pixel(img, img_pos_mm, direction_positive)
+
+		self._append_gcode(";EndPart")
+		self._append_gcode("M3S0")
+		self.gc_ctx.s = 0
+		self.gc_ctx.laser_active = True
+		return direction_positive
+
+	def _use_worker_pool(self, imgArray):
+		if(self.workers <= 1 or len(imgArray) < 2):
+			return False
+		pixels = sum(p['i'].size[0] * p['i'].size[1] for p in imgArray)
+		if(pixels < self.parallel_min_pixels):
+			self.log.debug("%s pixels in %s parts, below parallel_min_pixels (%s). Converting serially.", pixels, len(imgArray), self.parallel_min_pixels)
+			return False
+		return True
+
+	def _write_gcode_for_parts_parallel(self, imgArray, part_positions, direction_positive):
+		"""
+		Converts the image parts in a pool of worker processes and writes the gcode chunks in the original order.
+		The direction of the first line of each part is calculated upfront from the number of lines of the preceding parts.
+		:returns: direction of the first line after the last part
+		"""
+		start = time.time()
+		tasks = []
+		for img_data, img_pos_mm in zip(imgArray, part_positions):
+			tasks.append((self, img_data, img_pos_mm, direction_positive))
+			if(self._count_lines_of_part(img_data['i'], img_pos_mm) % 2 == 1):
+				direction_positive = not direction_positive
+
+		workers = min(self.workers, len(tasks))
+		self.log.info("Converting %s parts with %s worker processes", len(tasks), workers)
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			for gcode in imap_cancellable(pool, _generate_gcode_for_part, tasks, self.is_job_cancelled):
+				self._gcode_writer.write(gcode)
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+		self.gc_ctx.s = 0
+		self.gc_ctx.f = None
+		self.gc_ctx.laser_active = True
+		self.log.debug("parallel conversion of %s parts took %s seconds", len(tasks), time.time() - start)
+		return direction_positive
 
-			# image part has its own pixel offset. Calc general absolute offset in MM
-			x_off = img_data['x']*self.beam + xMM # mm here, img_data['x'] is in pixels
-			y_off = hMM - img_data['y']*self.beam + yMM # mm here, but inverted for the y axis
-			#self.log.info("yPx: {}, yMM: {}, hMM: {} => y_final: {}".format(img_data['y'], yMM, hMM, y_off))
-			img_pos_mm = (x_off, y_off) # lower left corner of partial image in mm
+	def _count_lines_of_part(self, img, img_pos_mm):
+		"""
+		Returns the number of lines write_gcode_for_part_*() will engrave: rows with juicy pixels inside the working area.
+		"""
+		if(self.workingAreaHeight is None):
+			return 0
+		pix = self.get_pixel_array(img)
+		rows = numpy.flatnonzero((pix <= self.ignore_brighter_than).any(axis=1))
+		y = img_pos_mm[1] - (self.beam * rows)
+		return int(numpy.count_nonzero((y >= 0) & (y <= self.workingAreaHeight)))
+
+	def __getstate__(self):
+		# pickled to hand it over to worker processes: without logger, output and gcode context
+		state = self.__dict__.copy()
+		for key in ('log', 'output_filehandle', '_gcode_writer', 'gc_ctx', 'is_job_cancelled', 'profiler'):
+			del state[key]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.log = logging.getLogger("octoprint.plugins.mrbeam.img2gcode")
+		self.output_filehandle = None
+		self.is_job_cancelled = None
+		self.profiler = ConversionProfiler()
+		self._gcode_writer = GcodeWriter()
+		self.gc_ctx = GC_Context()
+		self.gc_ctx.s = 0
+		self.gc_ctx.laser_active = True
 
-			self._append_gcode("; Begin part {} @ pixel ({},{}) with dimensions {}x{}".format(img_data['id'], img_data['x'],img_data['y'], size[0], size[1]))
-			# iterate line by line
-			pix = img.load()
-			for row in range(height_px-1,-1,-1):
+	def write_gcode_for_part_pixel(self, img, img_pos_mm, direction_positive):
+		"""
+		Writes GCode for one image part by walking every pixel through the PIL pixel access object.
+		:param img: the PIL image of the part
+		:param img_pos_mm: lower left corner of the part in mm
+		:param direction_positive: direction of the first line
+		:returns: direction of the next line
+		"""
+		size = img.size
+		height_px = size[1]
 
-				line_info = self.get_pixelinfo_of_line(pix, size, row)
-				y = img_pos_mm[1] - (self.beam * line_info['row'])
+		# iterate line by line
+		pix = img.load()
+		for row in range(height_px-1,-1,-1):
+			self._check_cancelled()
 
-				if(line_info['left'] != None and y >= 0 and y <= self.workingAreaHeight):
+			line_info = self.get_pixelinfo_of_line(pix, size, row)
+			y = img_pos_mm[1] - (self.beam * line_info['row'])
 
-					# prepare line start
-					self.write_gcode_for_line_start(y, img_pos_mm, pix, line_info, direction_positive, debug=self.debug)
+			if(line_info['left'] != None and y >= 0 and y <= self.workingAreaHeight):
 
-					# do line
-					self.write_gcode_for_trimmed_line(img_pos_mm, pix, line_info, direction_positive, debug=self.debug)
+				# prepare line start
+				self.write_gcode_for_line_start(y, img_pos_mm, pix, line_info, direction_positive, debug=self.debug)
 
-					# after line
-					self.write_gcode_for_line_end(img_pos_mm, line_info, direction_positive, debug=self.debug)
+				# do line
+				self.write_gcode_for_trimmed_line(img_pos_mm, pix, line_info, direction_positive, debug=self.debug)
 
-					# flip direction after each line to go back and forth
-					direction_positive = not direction_positive
-				else:
-					if(line_info['left'] != None):
-						# skip line vertical out of working area
-						self._append_gcode("; ignoring line y={}, out of working area.".format(y))
+				# after line
+				self.write_gcode_for_line_end(img_pos_mm, line_info, direction_positive, debug=self.debug)
 
+				# flip direction after each line to go back and forth
+				direction_positive = not direction_positive
+			else:
+				if(line_info['left'] != None):
+					# skip line vertical out of working area
+					self._append_gcode("; ignoring line y={}, out of working area.".format(y))
 
-			self._append_gcode(";EndPart")
-			self._append_gcode("M3S0")
-			self.gc_ctx.s = 0
-			self.gc_ctx.laser_active = True
+		return direction_positive
 
-		self._append_gcode(";EndImage\nM5") # important for gcode preview!
-		self.gc_ctx.laser_active = False
-		return self._output_gcode
+	def write_gcode_for_part_numpy(self, img, img_pos_mm, direction_positive):
+		"""
+		Writes GCode for one image part. Same output as write_gcode_for_part_pixel(), but the part is converted
+		into a numpy array once and first/last juicy pixels and runs of equal pixels are found with array operations.
+		:param img: the PIL image of the part
+		:param img_pos_mm: lower left corner of the part in mm
+		:param direction_positive: direction of the first line
+		:returns: direction of the next line
+		"""
+		w_px, h_px = img.size
+		pix = self.get_pixel_array(img)
+
+		juicy = pix <= self.ignore_brighter_than
+		has_juicy = juicy.any(axis=1)
+		first_idx = juicy.argmax(axis=1)
+		last_idx = w_px - 1 - juicy[:, ::-1].argmax(axis=1)
+
+		for row in numpy.flatnonzero(has_juicy)[::-1].tolist():
+			self._check_cancelled()
+			line_info = {'left': int(first_idx[row]), 'right': int(last_idx[row]), 'row': row, 'img_w': w_px, 'img_h': h_px}
+			y = img_pos_mm[1] - (self.beam * row)
+
+			if(y >= 0 and y <= self.workingAreaHeight):
+				self.write_gcode_for_line_start(y, img_pos_mm, pix, line_info, direction_positive, debug=self.debug)
+				self.write_gcode_for_trimmed_line_numpy(img_pos_mm, pix[row], line_info, direction_positive, debug=self.debug)
+				self.write_gcode_for_line_end(img_pos_mm, line_info, direction_positive, debug=self.debug)
+				direction_positive = not direction_positive
+			else:
+				# skip line vertical out of working area
+				self._append_gcode("; ignoring line y={}, out of working area.".format(y))
+
+		return direction_positive
+
+	def _check_cancelled(self):
+		if(self.is_job_cancelled is not None):
+			self.is_job_cancelled()
 
+	def get_pixel_array(self, img):
+		"""
+		Returns the brightness values of a greyscale or b/w image as 2d uint8 numpy array (rows first).
+		b/w images (mode '1') are mapped to 0/255 like the PIL pixel access object does.
+		"""
+		if(img.mode != 'L'):
+			img = img.convert('L')
+		return numpy.asarray(img, dtype=numpy.uint8)
 
 	# helper methods for gcode generation
 	def _ignore_pixel_brightness(self, brightness):
@@ -544,6 +729,103 @@ class ImageProcessor():
 			pos = self.write_gcode_for_equal_pixels(brightness, end_of_line, debug=debug)
 
 
+	def write_gcode_for_trimmed_line_numpy(self, img_pos_mm, row_pixels, line_info, direction_positive, debug=False):
+		"""
+		Writes GCode for one line of juicy pixels given as numpy array.
+		Same output as write_gcode_for_trimmed_line() but runs of equal pixels are determined with array operations.
+		Preconditions:
+		- Laserhead is already moved to correct starting position with G0
+		- Laser is active (still active or switched on with M3S0)
+		"""
+		left = line_info['left']
+		right = line_info['right']
+		if(direction_positive):
+			line = row_pixels[left:right+1]
+		else:
+			line = row_pixels[right::-1] if left == 0 else row_pixels[right:left-1:-1]
+
+		# index (relative to the line start) of every pixel differing from its predecessor
+		run_ends = numpy.flatnonzero(line[1:] != line[:-1]) + 1
+		run_brightness = line[run_ends - 1].tolist()
+		if(direction_positive):
+			run_x = (img_pos_mm[0] + self.beam * (run_ends + (left - 1))).tolist()
+		else:
+			run_x = (img_pos_mm[0] + self.beam * (right - run_ends)).tolist() # backward lines need to be shifted by +1 beam diameter
+
+		brightness = int(line[-1])
+		if(not self._ignore_pixel_brightness(brightness) and self.get_intensity(brightness) > 0): # finish non-white line
+			run_brightness.append(brightness)
+			run_x.append(img_pos_mm[0] + (right if direction_positive else left) * self.beam)
+
+		self.write_gcode_for_runs(run_brightness, run_x, debug=debug)
+
+	def write_gcode_for_runs(self, run_brightness, run_x, debug=False):
+		"""
+		Writes gcode for all runs of equal pixels of one line in one go.
+		Same as calling write_gcode_for_equal_pixels() for every run, but with precompiled gcode words
+		and a single _append_gcode() call.
+		:param run_brightness: brightness of each run
+		:param run_x: target x position of each run in mm
+		"""
+		if(len(run_brightness) == 0):
+			return
+
+		ignore, intensities, feedrates, s_words, f_words = self._get_precompiled_words()
+		skip_words = self.skip_redundant_words
+		x_max = self.workingAreaWidth
+		pierce = self.pierce_time > 0
+		if(pierce):
+			gcode_g4 = self._get_gcode_g4(intensity=self.pierce_intensity, time=self.pierce_time)
+
+		ctx_s = self.gc_ctx.s
+		ctx_f = self.gc_ctx.f
+		lines = []
+		append = lines.append
+		for brightness, x in zip(run_brightness, run_x):
+			comment = "brightness: {}".format(brightness) if debug else None
+			fast = not debug and 0 <= x <= x_max # no comments needed
+
+			# fast skipping whitespace
+			if ignore[brightness]:
+				append("G0X%.2fS0" % x if fast else self._get_gcode_g0(x=x, comment=comment))
+				ctx_s = 0
+
+				# pierctime after skipping whitespace
+				if(pierce):
+					append(gcode_g4)
+					ctx_s = self.pierce_intensity
+			else:
+				intensity = intensities[brightness]
+				feedrate = feedrates[brightness]
+				skip_s = skip_words and intensity == ctx_s
+				skip_f = skip_words and feedrate == ctx_f
+				if(fast):
+					append("G1X%.2f%s%s" % (x, '' if skip_s else s_words[brightness], '' if skip_f else f_words[brightness]))
+				else:
+					append(self._get_gcode_g1(x=x, s=None if skip_s else intensity, f=None if skip_f else feedrate, comment=comment))
+				ctx_s = intensity
+				ctx_f = feedrate
+
+		self._append_gcode("\n".join(lines))
+		self.gc_ctx.s = ctx_s
+		self.gc_ctx.f = ctx_f
+		self.gc_ctx.x = run_x[-1]
+
+	def _get_precompiled_words(self):
+		"""
+		Returns lookup lists indexed by brightness (0..255):
+		(ignore pixel, intensity, feedrate, S word, F word)
+		"""
+		if(self._precompiled_words is None):
+			brightness_range = range(256)
+			ignore = [self._ignore_pixel_brightness(b) for b in brightness_range]
+			intensities = [self.get_intensity(b) for b in brightness_range]
+			feedrates = [self.get_feedrate(b) for b in brightness_range]
+			s_words = [self._get_gcode_literal("S", i) for i in intensities]
+			f_words = [self._get_gcode_literal("F", f) for f in feedrates]
+			self._precompiled_words = (ignore, intensities, feedrates, s_words, f_words)
+		return self._precompiled_words
+
 	def write_gcode_for_equal_pixels(self, brightness, target_x, comment=None, debug=False):
 		"""
 		Writes gcode for a sequence of equal pixels.
@@ -577,7 +859,10 @@ class ImageProcessor():
 			#	gcode = self._get_gcode_g0(x=target_x, comment="first_px")
 			#	self._append_gcode(gcode)
 
-			gcode = self._get_gcode_g1(x=target_x, s=intensity, f=feedrate, comment=comment)
+			# S and F are modal, no need to repeat them
+			s = None if self.skip_redundant_words and intensity == self.gc_ctx.s else intensity
+			f = None if self.skip_redundant_words and feedrate == self.gc_ctx.f else feedrate
+			gcode = self._get_gcode_g1(x=target_x, s=s, f=f, comment=comment)
 			self._append_gcode(gcode)
 			self.gc_ctx.s = intensity
 			self.gc_ctx.f = feedrate
@@ -663,8 +948,11 @@ class ImageProcessor():
 			commaidx = dataUrl.find(',')
 			base64str = "\n" + dataUrl[commaidx:]
 
+		start = time.time()
 		image_string = cStringIO.StringIO(base64.b64decode(base64str))
-		return Image.open(image_string)
+		img = Image.open(image_string)
+		self._profile("raster_load", start)
+		return img
 
 
 	def imgurl_to_gcode(self, url, w,h, x,y, file_id):
@@ -723,14 +1011,36 @@ class ImageProcessor():
 			return 0
 
 	def _append_gcode(self, gcode, add_new_line=True):
-		if(self.output_filehandle is not None):
-			self.output_filehandle.write(gcode)
-			if(add_new_line):
-				self.output_filehandle.write("\n")
+		if(add_new_line):
+			self._gcode_writer.write_line(gcode)
 		else:
-			self._output_gcode += gcode
-			if(add_new_line):
-				self._output_gcode += "\n"
+			self._gcode_writer.write(gcode)
+
+
+def imap_cancellable(pool, func, tasks, is_job_cancelled=None, ordered=True, poll_interval=0.5):
+	"""
+	Like pool.imap() (or pool.imap_unordered()), but calls is_job_cancelled() while waiting for the results,
+	so a cancelled conversion raises right away instead of after the last task. The caller terminates the pool.
+	"""
+	results = pool.imap(func, tasks) if ordered else pool.imap_unordered(func, tasks)
+	while True:
+		try:
+			result = results.next(timeout=poll_interval)
+		except multiprocessing.TimeoutError:
+			result = None
+		except StopIteration:
+			return
+		if(is_job_cancelled is not None):
+			is_job_cancelled()
+		if(result is not None):
+			yield result
+
+
+def _generate_gcode_for_part(task):
+	# runs in a worker process, see ImageProcessor._write_gcode_for_parts_parallel()
+	processor, img_data, img_pos_mm, direction_positive = task
+	processor._write_gcode_for_part(img_data, img_pos_mm, direction_positive)
+	return processor._gcode_writer.getvalue()
 
 
 class GC_Context():
@@ -768,6 +1078,7 @@ if __name__ == "__main__":
 	opts.add_option("", "--sharpening", type="float", help="image sharpening: 0.0 => blurred, 1.0 => unchanged, >1.0 => sharpened", default=1.0, dest="sharpening")
 	opts.add_option("", "--dithering", type="string", help="convert image to black and white pixels", default="false", dest="dithering")
 	opts.add_option("", "--no-headers", type="string", help="omits Mr Beam start and end sequences", default="false", dest="noheaders")
+	opts.add_option("", "--engine", type="choice", choices=[ImageProcessor.RASTER_ENGINE_NUMPY, ImageProcessor.RASTER_ENGINE_PIXEL], help="raster engine (numpy|pixel), default numpy", default=ImageProcessor.RASTER_ENGINE_DEFAULT, dest="engine")
 
 	(options, args) = opts.parse_args()
 	path = args[0]
@@ -816,7 +1127,8 @@ M2
 			dithering = boolDither,
 			engraving_mode=ImageProcessor.ENGRAVING_MODE_FAST,
 			pierce_time = options.pierce_time,
-			material = None
+			material = None,
+			raster_engine = options.engine
 		)
 
 		lh = logging.StreamHandler(sys.stdout)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+job_planner.py
+orders the vector parts of a job across colors and layers
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+The gcode of every path carries its own feedrate and intensity, so paths of different colors can be interleaved.
+Rules:
+ - all vector engravings before all cuts
+ - inner cuts before outer cuts: a cut whose bounding box lies within another cut's bounding box is done first,
+   so parts don't move or drop before all their holes are cut.
+Within these constraints the travel distance is minimized with path_ordering.
+"""
+
+import logging
+
+import path_ordering
+
+
+class JobPlanner():
+
+	DEFAULT_TRAVEL_SPEED = 5000 # mm/min, G0 speed of the machine
+
+	def __init__(self, start=(0.0, 0.0), two_opt=False, travel_speed=DEFAULT_TRAVEL_SPEED):
+		self._log = logging.getLogger("octoprint.plugins.mrbeam.job_planner")
+		self.start = start
+		self.two_opt = two_opt
+		self.travel_speed = travel_speed if travel_speed > 0 else self.DEFAULT_TRAVEL_SPEED
+		self.units = []
+		self.stats = None
+
+	def add(self, gcode, start, end, bbox, passes=1, engrave=False, comment=""):
+		"""
+		Adds the gcode of one path.
+		:param start: [x, y] first position of the path in mm, None if the gcode doesn't move the laser head
+		:param end: [x, y] last position of the path in mm
+		:param bbox: (x_min, y_min, x_max, y_max) in mm
+		:param engrave: True for vector engravings (done before all cuts)
+		:param comment: gcode comment written before the path
+		"""
+		self.units.append(dict(gcode=gcode, start=start, end=end, bbox=bbox, passes=passes, engrave=engrave, comment=comment))
+
+	def plan(self):
+		"""
+		Returns the added units in cutting order and sets self.stats.
+		"""
+		result = [u for u in self.units if u['start'] is None]
+		movable = [u for u in self.units if u['start'] is not None]
+		engravings = [u for u in movable if u['engrave']]
+		cuts = [u for u in movable if not u['engrave']]
+
+		pos = self.start
+		groups = [engravings] + self._get_nesting_levels(cuts)
+		for group in groups:
+			order, _ = path_ordering.order_paths([(u['start'], u['end']) for u in group], start=pos, two_opt=self.two_opt)
+			result += [group[i] for i in order]
+			if(len(order) > 0):
+				pos = group[order[-1]]['end']
+
+		items = [(u['start'], u['end']) for u in movable]
+		before = path_ordering.travel_distance(items, None, self.start)
+		after = path_ordering.travel_distance([(u['start'], u['end']) for u in result if u['start'] is not None], None, self.start)
+		saved = before - after
+		self.stats = dict(paths=len(self.units),
+		                  engravings=len(engravings),
+		                  cuts=len(cuts),
+		                  nesting_levels=len(groups) - 1,
+		                  before=before,
+		                  after=after,
+		                  saved=saved,
+		                  time_saved=saved / self.travel_speed * 60)
+		return result
+
+	def _get_nesting_levels(self, cuts):
+		"""
+		Splits cuts into nesting levels: level 0 contains no other cut, level n only contains cuts of levels < n.
+		"""
+		if(len(cuts) == 0):
+			return []
+		levels = path_ordering.get_nesting_levels([u['bbox'] for u in cuts])
+		groups = [[] for _ in range(max(levels) + 1)]
+		for i, u in enumerate(cuts):
+			groups[levels[i]].append(u)
+		return groups
+
+	def pp(self):
+		if(self.stats is None):
+			return "JobPlanner: not planned"
+		return "JobPlanner: {paths} paths ({engravings} engravings, {cuts} cuts in {nesting_levels} nesting levels), " \
+		       "travel {before:.1f}mm -> {after:.1f}mm, saved {saved:.1f}mm, estimated {time_saved:.1f}s".format(**self.stats)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+path_ordering.py
+ordering of paths to reduce the travel (G0) distance in between
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+Paths are given as (start_point, end_point) tuples and are never reversed, only reordered.
+A nearest neighbour tour is built with a grid index for the start points,
+optionally refined by a 2-opt pass.
+Cuts have to keep the inner before outer order, get_nesting_levels() groups them accordingly.
+"""
+
+import math
+
+import numpy
+
+
+def distance(p1, p2):
+	return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
+
+
+def travel_distance(items, order=None, start=(0.0, 0.0)):
+	"""
+	Returns the sum of all travel moves: from start to the first path and from the end of each path to the start of the next.
+	:param items: list of (start_point, end_point)
+	:param order: list of indices into items. Default: document order
+	"""
+	if order is None:
+		order = range(len(items))
+	total = 0.0
+	pos = start
+	for i in order:
+		total += distance(pos, items[i][0])
+		pos = items[i][1]
+	return total
+
+
+def order_paths(items, start=(0.0, 0.0), two_opt=False):
+	"""
+	Orders paths to reduce travel distance.
+	:param items: list of (start_point, end_point)
+	:param start: current position of the laser head
+	:param two_opt: refine the nearest neighbour tour with 2-opt
+	:returns: (order, stats) - list of indices into items and a dict with travel distances before/after in the units of the points
+	"""
+	order = order_nearest_neighbour(items, start)
+	if two_opt:
+		order = refine_two_opt(items, order, start)
+	before = travel_distance(items, None, start)
+	after = travel_distance(items, order, start)
+	if after > before:
+		# document order was better already
+		order = range(len(items))
+		after = before
+	return order, dict(count=len(items), before=before, after=after, saved=before - after)
+
+
+def get_nesting_levels(bboxes):
+	"""
+	Nesting levels of paths by their bounding boxes: level 0 contains no other path, level n only contains paths of
+	levels < n. Cutting the levels in ascending order cuts inner paths first, so parts don't move or drop before all
+	their holes are cut.
+	:param bboxes: list of (x_min, y_min, x_max, y_max)
+	:returns: list of levels, one per bbox
+	"""
+	if len(bboxes) == 0:
+		return []
+	bboxes = numpy.array(bboxes, dtype=float)
+	x0, y0, x1, y1 = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
+	area = (x1 - x0) * (y1 - y0)
+	levels = numpy.zeros(len(bboxes), dtype=int)
+	# inner paths have smaller areas, so their level is known when the outer one is processed
+	for i in numpy.argsort(area, kind='mergesort'):
+		inner = (x0 >= x0[i]) & (y0 >= y0[i]) & (x1 <= x1[i]) & (y1 <= y1[i]) & (area < area[i])
+		if inner.any():
+			levels[i] = levels[inner].max() + 1
+	return levels.tolist()
+
+
+def order_nearest_neighbour(items, start=(0.0, 0.0)):
+	"""
+	Greedy tour: always continues with the path starting closest to the end of the current one.
+	:returns: list of indices into items
+	"""
+	if len(items) == 0:
+		return []
+	index = _GridIndex([it[0] for it in items])
+	order = []
+	pos = start
+	while len(index) > 0:
+		i = index.pop_nearest(pos)
+		order.append(i)
+		pos = items[i][1]
+	return order
+
+
+def refine_two_opt(items, order, start=(0.0, 0.0), window=50, max_sweeps=5):
+	"""
+	2-opt refinement of a tour: reverses the order of consecutive paths if this shortens the travel.
+	Paths keep their direction, so costs are asymmetric. The cost of a reversed section is evaluated in O(1) with
+	prefix sums of the forward and backward travel distances.
+	:param window: max length of a reversed section
+	:param max_sweeps: max number of passes over the whole tour
+	:returns: list of indices into items
+	"""
+	order = list(order)
+	n = len(order)
+	if n < 3:
+		return order
+
+	def prefix_sums():
+		fwd = [0.0]
+		bwd = [0.0]
+		for k in xrange(n - 1):
+			a = items[order[k]]
+			b = items[order[k + 1]]
+			fwd.append(fwd[-1] + distance(a[1], b[0]))
+			bwd.append(bwd[-1] + distance(b[1], a[0]))
+		return fwd, bwd
+
+	fwd, bwd = prefix_sums()
+	for sweep in xrange(max_sweeps):
+		improved = False
+		for i in xrange(n - 1):
+			prev_end = start if i == 0 else items[order[i - 1]][1]
+			start_i = items[order[i]][0]
+			end_i = items[order[i]][1]
+			d_in = distance(prev_end, start_i)
+			for j in xrange(i + 1, min(n, i + window + 1)):
+				item_j = items[order[j]]
+				if j < n - 1:
+					next_start = items[order[j + 1]][0]
+					d_out = distance(item_j[1], next_start)
+					d_out_new = distance(end_i, next_start)
+				else:
+					d_out = d_out_new = 0.0
+				delta = distance(prev_end, item_j[0]) + d_out_new + (bwd[j] - bwd[i]) - d_in - d_out - (fwd[j] - fwd[i])
+				if delta < -1e-9:
+					order[i:j + 1] = order[i:j + 1][::-1]
+					fwd, bwd = prefix_sums()
+					start_i = items[order[i]][0]
+					end_i = items[order[i]][1]
+					d_in = distance(prev_end, start_i)
+					improved = True
+		if not improved:
+			break
+	return order
+
+
+class _GridIndex():
+	"""
+	Uniform grid over points supporting nearest neighbour queries with removal.
+	The grid is rebuilt with a coarser cell size when most points are removed to keep ring searches short.
+	"""
+
+	def __init__(self, points, ids=None):
+		self._points = points
+		self._build(range(len(points)) if ids is None else ids)
+
+	def __len__(self):
+		return self._count
+
+	def _build(self, ids):
+		self._count = len(ids)
+		self._built_count = max(1, self._count)
+		self._cells = dict()
+		if self._count == 0:
+			return
+		xs = [self._points[i][0] for i in ids]
+		ys = [self._points[i][1] for i in ids]
+		self._x0 = min(xs)
+		self._y0 = min(ys)
+		extent = max(max(xs) - self._x0, max(ys) - self._y0)
+		self._cell = max(extent / math.sqrt(self._count), 1e-6)
+		self._max_ring = int(extent / self._cell) + 2
+		for i in ids:
+			key = self._key(self._points[i])
+			if key in self._cells:
+				self._cells[key].append(i)
+			else:
+				self._cells[key] = [i]
+
+	def _key(self, p):
+		return (int(math.floor((p[0] - self._x0) / self._cell)), int(math.floor((p[1] - self._y0) / self._cell)))
+
+	def pop_nearest(self, pos):
+		"""
+		Removes and returns the id of the point closest to pos.
+		"""
+		if self._count == 0:
+			raise IndexError("pop from empty index")
+		if self._count * 4 < self._built_count and self._count > 16:
+			self._build([i for cell in self._cells.itervalues() for i in cell])
+
+		cx, cy = self._key(pos)
+		m = self._max_ring
+		# pos might be outside of the grid: start with the first ring touching it
+		r = max(0, -cx, cx - m, -cy, cy - m)
+		r_max = max(abs(cx), abs(cx - m), abs(cy), abs(cy - m))
+		best = None
+		best_d = None
+		while True:
+			for key in self._ring(cx, cy, r):
+				cell = self._cells.get(key)
+				if cell is None:
+					continue
+				for i in cell:
+					d = distance(pos, self._points[i])
+					if best_d is None or d < best_d:
+						best = i
+						best_d = d
+			# points in rings > r are at least r * cell away
+			if best is not None and best_d <= r * self._cell:
+				break
+			if r >= r_max:
+				break
+			r += 1
+
+		cell_key = self._key(self._points[best])
+		self._cells[cell_key].remove(best)
+		if len(self._cells[cell_key]) == 0:
+			del self._cells[cell_key]
+		self._count -= 1
+		return best
+
+	def _ring(self, cx, cy, r):
+		# cells with chebyshev distance r to (cx, cy), limited to the grid
+		m = self._max_ring
+		if r == 0:
+			return [(cx, cy)]
+		keys = []
+		for x in xrange(max(cx - r, 0), min(cx + r, m) + 1):
+			if cy - r >= 0:
+				keys.append((x, cy - r))
+			if cy + r <= m:
+				keys.append((x, cy + r))
+		for y in xrange(max(cy - r + 1, 0), min(cy + r - 1, m) + 1):
+			if cx - r >= 0:
+				keys.append((cx - r, y))
+			if cx + r <= m:
+				keys.append((cx + r, y))
+		return keys
@@ -115,14 +115,16 @@ def applyTransformToPath(mat,path):
             for pt in ctl:
                 applyTransformToPoint(mat,pt)
 
-def fuseTransform(node):
+def fuseTransform(node, m=None):
+    # m: already parsed transform of the node
     if node.get('d')==None:
         #FIXME: how do you raise errors?
         raise AssertionError, 'can not fuse "transform" of elements that have no "d" attribute'
     t = node.get("transform")
     if t == None:
         return
-    m = parseTransform(t)
+    if m == None:
+        m = parseTransform(t)
     d = node.get('d')
     p = cubicsuperpath.parsePath(d)
     applyTransformToPath(m,p)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+svg_style.py
+resolves stroke and fill of svg elements from attributes, inline styles and css classes
+
+Copyright (C) 2018 Mr Beam Lasers GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+"""
+
+import re
+from collections import namedtuple
+
+import simplestyle
+from svg_util import _add_ns
+
+
+class _ItemAccess(object):
+	# allows stroke['color'] as well as stroke.color
+	__slots__ = ()
+
+	def __getitem__(self, key):
+		if isinstance(key, basestring):
+			return getattr(self, key)
+		return tuple.__getitem__(self, key)
+
+
+class Stroke(_ItemAccess, namedtuple('Stroke', 'color width width_unit opacity visible')):
+	__slots__ = ()
+
+
+class Fill(_ItemAccess, namedtuple('Fill', 'color opacity visible')):
+	__slots__ = ()
+
+
+class ResolvedStyle(_ItemAccess, namedtuple('ResolvedStyle', 'stroke fill unresolved_classes')):
+	"""
+	unresolved_classes: the element has a class attribute but no matching css rule was found in the document
+	"""
+	__slots__ = ()
+
+
+class StyleResolver():
+	"""
+	Resolves the style of svg elements. Elements with identical style attributes share one cached ResolvedStyle.
+	"""
+
+	STYLE_ATTRIBUTES = ('style', 'class', 'stroke', 'stroke-width', 'stroke-opacity', 'fill', 'fill-opacity', 'opacity')
+
+	_REGEX_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+	_REGEX_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+	_REGEX_CLASS_SELECTOR = re.compile(r"^[a-zA-Z]*\.([\w-]+)$")
+
+	def __init__(self, root=None):
+		self.class_styles = self._parse_stylesheets(root) if root is not None else dict()
+		self._cache = dict()
+		self.hits = 0
+		self.misses = 0
+
+	def resolve(self, node):
+		key = tuple([node.get(a) for a in self.STYLE_ATTRIBUTES])
+		style = self._cache.get(key)
+		if style is None:
+			self.misses += 1
+			attrs = dict([(a, v) for a, v in zip(self.STYLE_ATTRIBUTES, key) if v is not None])
+			styles, unresolved = self._get_class_styles(attrs.get('class'))
+			# inline styles override css classes
+			styles.update(simplestyle.parseStyle(attrs.get('style')))
+			style = ResolvedStyle(self._resolve_stroke(attrs, styles), self._resolve_fill(attrs, styles), unresolved)
+			self._cache[key] = style
+		else:
+			self.hits += 1
+		return style
+
+	def _get_class_styles(self, classes):
+		styles = dict()
+		if classes is None:
+			return styles, False
+		found = False
+		for c in classes.split():
+			if c in self.class_styles:
+				styles.update(self.class_styles[c])
+				found = True
+		return styles, not found
+
+	def _parse_stylesheets(self, root):
+		# only simple class selectors like .cls-1 or path.cls-1 are supported
+		class_styles = dict()
+		for tag in (_add_ns('style', 'svg'), 'style'):
+			for style_node in root.iter(tag):
+				css = self._REGEX_CSS_COMMENT.sub('', style_node.text or '')
+				for selectors, declarations in self._REGEX_CSS_RULE.findall(css):
+					styles = simplestyle.parseStyle(declarations)
+					for selector in selectors.split(','):
+						m = self._REGEX_CLASS_SELECTOR.match(selector.strip())
+						if m:
+							class_styles.setdefault(m.group(1), dict()).update(styles)
+		return class_styles
+
+	def _resolve_stroke(self, attrs, styles):
+		color = 'unset'
+		width = 1
+		#"stroke", "stroke-width", "stroke-opacity", "opacity"
+		c = attrs.get('stroke', None)
+		if(c is None):
+			if("stroke" in styles):
+				c = styles["stroke"]
+		if(c != None and c != 'none' and c != ''):
+			color = c
+
+		w = attrs.get('stroke-width', '')
+		if(w is ''):
+			if("stroke-width" in styles):
+				w = styles["stroke-width"]
+		if(w != 'none' and w != ''):
+			try:
+				width = float(re.sub(r'[^\d.]+', '', w))
+				# todo: unit
+			except ValueError:
+				pass
+
+		stroke_opacity = attrs.get('stroke-opacity', 1)
+		if(stroke_opacity is 1):
+			if ("stroke-opacity" in styles):
+				try:
+					stroke_opacity = float(styles["stroke-opacity"])
+				except ValueError:
+					pass
+
+		opacity = self._get_opacity(attrs, styles)
+		opacity = min(opacity, stroke_opacity)
+		visible = color is not None and opacity > 0 and width > 0
+		return Stroke(color=color, width=width, width_unit="px", opacity=opacity, visible=visible)
+
+	def _resolve_fill(self, attrs, styles):
+		color = 'unset'
+		#"fill", "fill-opacity", "opacity"
+		c = attrs.get('fill', None)
+		if(c is None):
+			if("fill" in styles):
+				c = styles["fill"]
+		if(c != None and c != 'none' and c != ''):
+			color = c
+
+		fill_opacity = attrs.get('fill-opacity', 1)
+		if(fill_opacity is 1):
+			if ("fill-opacity" in styles):
+				try:
+					fill_opacity = float(styles["fill-opacity"])
+				except ValueError:
+					pass
+
+		opacity = self._get_opacity(attrs, styles)
+		opacity = min(opacity, fill_opacity)
+		visible = color is not None and opacity > 0
+		return Fill(color=color, opacity=opacity, visible=visible)
+
+	def _get_opacity(self, attrs, styles):
+		opacity = attrs.get('opacity', 1)
+		if(opacity is 1):
+			if ("opacity" in styles):
+				try:
+					opacity = float(styles["opacity"])
+				except ValueError:
+					pass
+		return opacity
+
+	def pp(self):
+		return "StyleResolver: {} distinct styles, {} hits, {} css classes".format(len(self._cache), self.hits, len(self.class_styles))
@@ -1247,59 +1247,61 @@ $(function(){
 					var pixPerMM = 1/self.beamDiameter();
 //					snap.select('#userContent').embed_gc(); // hack
 					self.workingArea.getCompositionSVG(self.do_engrave(), pixPerMM, self.engrave_outlines(), function(composition){
-						self.svg = composition;
-						var filename = self.gcodeFilename();
-						var gcodeFilename = self._sanitize(filename) + '.gco';
-
-						var multicolor_data = self.get_current_multicolor_settings();
-						var engraving_data = self.get_current_engraving_settings();
-						var colorStr = '<!--COLOR_PARAMS_START' +JSON.stringify(multicolor_data) + 'COLOR_PARAMS_END-->';
-						var data = {
-							command: "convert",
-							engrave: self.do_engrave(),
-							vector : multicolor_data,
-							raster : engraving_data,
-							slicer: "svgtogcode",
-							gcode: gcodeFilename
-						};
-
-						if(self.svg !== undefined){
-							// TODO place comment within initial <svg > tag.
-							data.svg = colorStr +"\n"+ self.svg;
-						} else {
-							data.svg = colorStr +"\n"+ '<svg height="0" version="1.1" width="0" xmlns="http://www.w3.org/2000/svg"><defs/></svg>';
-						}
-						if(self.gcodeFilesToAppend !== undefined){
-							data.gcodeFilesToAppend = self.gcodeFilesToAppend;
-						}
-						var json = JSON.stringify(data);
-						var length = json.length;
-						console.log("Conversion: " + length + " bytes have to be converted.");
-						$.ajax({
-							url: "plugin/mrbeam/convert",
-							type: "POST",
-							dataType: "json",
-							contentType: "application/json; charset=UTF-8",
-							data: json,
-							success: function (response) {
-								console.log("Conversion started.", response);
-							},
-							error: function ( jqXHR, textStatus, errorThrown) {
-								console.error("Conversion failed with status " + jqXHR.status, textStatus, errorThrown);
-								if(length > 10000000){
-									console.error("JSON size " + length + "Bytes may be over the request maximum.");
-								}
-								self.slicing_in_progress(false);
-								new PNotify({
-								    title: gettext("Conversion failed"),
-									text: gettext("Unable to start the conversion in the backend. Content length was " + length + " bytes."),
-									type: "error",
-									tag: "conversion_error",
-									hide: false
-								});
+						self._uploadEmbeddedImages(composition, function(composition){
+							self.svg = composition;
+							var filename = self.gcodeFilename();
+							var gcodeFilename = self._sanitize(filename) + '.gco';
+
+							var multicolor_data = self.get_current_multicolor_settings();
+							var engraving_data = self.get_current_engraving_settings();
+							var colorStr = '<!--COLOR_PARAMS_START' +JSON.stringify(multicolor_data) + 'COLOR_PARAMS_END-->';
+							var data = {
+								command: "convert",
+								engrave: self.do_engrave(),
+								vector : multicolor_data,
+								raster : engraving_data,
+								slicer: "svgtogcode",
+								gcode: gcodeFilename
+							};
+
+							if(self.svg !== undefined){
+								// TODO place comment within initial <svg > tag.
+								data.svg = colorStr +"\n"+ self.svg;
+							} else {
+								data.svg = colorStr +"\n"+ '<svg height="0" version="1.1" width="0" xmlns="http://www.w3.org/2000/svg"><defs/></svg>';
 							}
-						});
+							if(self.gcodeFilesToAppend !== undefined){
+								data.gcodeFilesToAppend = self.gcodeFilesToAppend;
+							}
+							var json = JSON.stringify(data);
+							var length = json.length;
+							console.log("Conversion: " + length + " bytes have to be converted.");
+							$.ajax({
+								url: "plugin/mrbeam/convert",
+								type: "POST",
+								dataType: "json",
+								contentType: "application/json; charset=UTF-8",
+								data: json,
+								success: function (response) {
+									console.log("Conversion started.", response);
+								},
+								error: function ( jqXHR, textStatus, errorThrown) {
+									console.error("Conversion failed with status " + jqXHR.status, textStatus, errorThrown);
+									if(length > 10000000){
+										console.error("JSON size " + length + "Bytes may be over the request maximum.");
+									}
+									self.slicing_in_progress(false);
+									new PNotify({
+									    title: gettext("Conversion failed"),
+										text: gettext("Unable to start the conversion in the backend. Content length was " + length + " bytes."),
+										type: "error",
+										tag: "conversion_error",
+										hide: false
+									});
+								}
+							});
 
+						});
 					});
 				} else {
 					console.log('Conversion parameter missing');
@@ -1313,6 +1315,61 @@ $(function(){
 			}
 		};
 
+		self._uploadEmbeddedImages = function(svg, callback){
+			// images are uploaded as binary files and referenced by id, which avoids the base64 overhead in the convert request
+			if(typeof svg !== 'string'){
+				callback(svg);
+				return;
+			}
+			var re = /(xlink:href|href)="(data:image\/[^";,]+;base64,[^"]+)"/g;
+			var dataUrls = [];
+			var match;
+			while((match = re.exec(svg)) !== null){
+				if(dataUrls.indexOf(match[2]) < 0){
+					dataUrls.push(match[2]);
+				}
+			}
+			if(dataUrls.length === 0){
+				callback(svg);
+				return;
+			}
+
+			var uploads = dataUrls.map(function(dataUrl){
+				var formData = new FormData();
+				formData.append('file', self._dataUrlToBlob(dataUrl), 'image');
+				return $.ajax({
+					url: "plugin/mrbeam/images",
+					type: "POST",
+					data: formData,
+					processData: false,
+					contentType: false,
+					dataType: "json"
+				});
+			});
+			$.when.apply($, uploads).done(function(){
+				svg = svg.replace(re, function(all, attr, dataUrl){
+					var image = uploads[dataUrls.indexOf(dataUrl)].responseJSON;
+					return attr + '="' + image.url + '" mb:image_id="' + image.id + '"';
+				});
+				console.log("Uploaded " + dataUrls.length + " images for conversion.");
+				callback(svg);
+			}).fail(function(jqXHR, textStatus, errorThrown){
+				console.warn("Image upload failed, images stay embedded in the svg.", textStatus, errorThrown);
+				callback(svg);
+			});
+		};
+
+		self._dataUrlToBlob = function(dataUrl){
+			var commaIdx = dataUrl.indexOf(',');
+			var mime = dataUrl.substring(5, dataUrl.indexOf(';'));
+			var binary = atob(dataUrl.substring(commaIdx + 1));
+			var bytes = new Uint8Array(binary.length);
+			for(var i = 0; i < binary.length; i++){
+				bytes[i] = binary.charCodeAt(i);
+			}
+			return new Blob([bytes], {type: mime});
+		};
+
 		self.do_engrave = function(){
 			const assigned_images = $('#engrave_job .assigned_colors').children().length;
 			return (assigned_images > 0 && self.show_image_parameters() && self.has_engraving_proposal());
@@ -0,0 +1,401 @@
+# coding=utf-8
+"""
+Emulates a Mr Beam grbl 0.9g on a pseudo terminal, for benchmarks and tests of MachineCom without a machine.
+
+MachineCom connects to it like to the real serial port, either by using its port as serial port or
+by registering serial_factory() as octoprint.comm.transport.serial.factory hook.
+
+Modeled:
+- the serial line: received characters reach grbl at the given baud rate (8N1, 10 bits per character)
+- the 127 byte RX buffer: characters beyond it are lost, like in grbl's serial ring buffer
+- the planner with 16 blocks: a motion line is taken from the RX buffer and acknowledged once there is a free block
+- block execution time from distance and feed rate (G0 at $110 max rate), without acceleration
+- G4 dwells, which keep grbl from reading further lines until the planner ran empty and the dwell is over
+- real time commands ? ! ~ and ctrl-x, status reports and 'ok:<free RX bytes>' for grbl versions which support it
+- $$ settings, $N=value, $H homing and the alarm lock after a reset
+"""
+
+import collections
+import os
+import pty
+import re
+import select
+import threading
+import time
+import tty
+
+import serial
+
+from octoprint_mrbeam.mrb_logger import mrb_logger
+
+
+class GrblEmulator(object):
+
+	RX_BUFFER_SIZE = 127
+	PLANNER_SIZE = 16  # BLOCK_BUFFER_SIZE of grbl 0.9 on the atmega328p
+	POLL_INTERVAL = 0.01
+	LINE_INTERVAL = 0.001  # transfer interval while characters are on the serial line
+
+	VERSION_DEFAULT = '0.9g_20181116_a437781'
+	VERSIONS_LEGACY_STATUS = ('0.9g_22270fa',)  # no limits in status reports
+	VERSIONS_NO_RX_REPORTING = ('0.9g_22270fa', '0.9g_20180223_61638c5')
+
+	STATE_IDLE = 'Idle'
+	STATE_RUN = 'Run'
+	STATE_QUEUE = 'Queue'
+	STATE_ALARM = 'Alarm'
+
+	pattern_word = re.compile("([A-Z])([-+]?[0-9]*\.?[0-9]*)")
+	pattern_setting = re.compile("^\$(\d+)=(\S+)$")
+
+	def __init__(self, version=VERSION_DEFAULT, settings=None, homing_lock=True, speed=1.0, baudrate=115200):
+		"""
+		:param version: grbl version in the startup message, decides about status report format and ok:<rx>
+		:param settings: dict of grbl settings returned by $$, e.g. the 'grbl' 'settings' of the laser cutter profile
+		:param homing_lock: start in alarm lock after a reset, like grbl with homing cycle enabled
+		:param speed: factor to run jobs faster than real time
+		:param baudrate: of the emulated serial line, 0 transfers characters immediately
+		"""
+		self._logger = mrb_logger("octoprint.plugins.mrbeam.grbl_emulator")
+		self.version = version
+		self.settings = dict(settings or {110: 5000.0, 111: 5000.0})
+		self.homing_lock = homing_lock
+		self.speed = float(speed)
+		self.baudrate = baudrate
+		self.port = None
+
+		self._master = None
+		self._slave = None
+		self._thread = None
+		self._running = False
+		self._write_lock = threading.Lock()
+		self._line = bytearray()  # characters on the serial line
+		self._line_ts = None
+		self.stats = dict()
+		self.reset_stats()
+		self._planner_pos = (0.0, 0.0)  # position after the last planned block
+		self._reset()
+
+	def start(self):
+		self._master, self._slave = pty.openpty()
+		tty.setraw(self._slave)
+		self.port = os.ttyname(self._slave)
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name="GrblEmulator")
+		self._thread.daemon = True
+		self._thread.start()
+		self._startup_message()
+		self._logger.info("Grbl emulator %s listening on %s", self.version, self.port)
+		return self.port
+
+	def stop(self):
+		self._running = False
+		if self._thread is not None:
+			self._thread.join()
+		for fd in (self._master, self._slave):
+			if fd is not None:
+				os.close(fd)
+		self._master = self._slave = None
+
+	def serial_factory(self, comm, port, baudrate, read_timeout):
+		"""
+		Same signature as an octoprint.comm.transport.serial.factory hook, connects to the emulator
+		"""
+		return serial.Serial(self.port, 115200, timeout=read_timeout, writeTimeout=10000)
+
+	def reset_stats(self):
+		"""
+		starved: seconds the planner ran empty between two blocks, i.e. grbl was waiting for data
+		"""
+		self.stats.update(lines=0, blocks=0, bytes=0, status_requests=0, rx_overflows=0, errors=0,
+		                  starved=0.0, busy=0.0, rx_max=0)
+
+	def get_stats(self):
+		return dict(self.stats)
+
+	def is_idle(self):
+		"""
+		:returns: True if all received lines are executed
+		"""
+		return not self._planner and not self._rx and not self._line and self._busy_until is None
+
+	def get_position(self):
+		return self._get_position(time.time())
+
+	def _reset(self):
+		self._rx = bytearray()
+		self._planner = collections.deque()  # blocks: [duration, x0, y0, x1, y1, intensity]
+		self._block_end = None
+		self._empty_since = None
+		self._held_at = None
+		self._busy_until = None  # end of a dwell, its ok is sent afterwards
+		self._alarm = self.homing_lock
+		self._absolute = True
+		self._motion = 0
+		self._feedrate = 0.0
+		self._intensity = 0
+		self._laser = False
+
+	def _run(self):
+		while self._running:
+			now = time.time()
+			timeout = self.POLL_INTERVAL
+			if self._block_end is not None and self._held_at is None:
+				timeout = max(0, min(timeout, self._block_end - now))
+			if self._busy_until is not None:
+				timeout = max(0, min(timeout, self._busy_until - now))
+			if self._line:
+				timeout = min(timeout, self.LINE_INTERVAL)
+			try:
+				readable, _, _ = select.select([self._master], [], [], timeout)
+				if readable:
+					self._line += os.read(self._master, 4096)
+			except (OSError, select.error):
+				pass
+			now = time.time()
+			self._execute(now)
+			self._receive(self._transfer(now), now)
+			self._protocol(now)
+
+	def _transfer(self, now):
+		"""
+		:returns: the characters which made it over the serial line since the last call
+		"""
+		if not self.baudrate:
+			data, self._line = self._line, bytearray()
+			return str(data)
+		if not self._line:
+			return ''
+		if self._line_ts is None:
+			self._line_ts = now
+		count = int((now - self._line_ts) * self.baudrate / 10)
+		if count <= 0:
+			return ''
+		self._line_ts += count * 10.0 / self.baudrate
+		data = self._line[:count]
+		del self._line[:count]
+		if not self._line:
+			self._line_ts = None
+		return str(data)
+
+	def _write(self, msg):
+		with self._write_lock:
+			os.write(self._master, msg + "\r\n")
+
+	def _startup_message(self):
+		self._write("Grbl {} ['$' for help]".format(self.version))
+		if self._alarm:
+			self._write("['$H'|'$X' to unlock]")
+
+	def _receive(self, data, now):
+		for c in data:
+			if c == '?':
+				self.stats['status_requests'] += 1
+				self._write(self._status_report(now))
+			elif c == '!':
+				if self._held_at is None:
+					self._held_at = now
+			elif c == '~':
+				if self._held_at is not None:
+					if self._block_end is not None:
+						self._block_end += now - self._held_at
+					self._held_at = None
+			elif c == '\x18':
+				if self._planner and self._held_at is None:
+					self._write("ALARM: Abort during cycle")
+				self._planner_pos = self._get_position(now)
+				self._reset()
+				self._startup_message()
+			elif len(self._rx) < self.RX_BUFFER_SIZE:
+				self._rx.append(c)
+				self.stats['bytes'] += 1
+			else:
+				self.stats['rx_overflows'] += 1
+		self.stats['rx_max'] = max(self.stats['rx_max'], len(self._rx))
+
+	def _execute(self, now):
+		if self._held_at is not None:
+			return
+		while self._planner and now >= self._block_end:
+			self._planner.popleft()
+			if self._planner:
+				self._block_end += self._planner[0][0]
+			else:
+				self._empty_since = self._block_end
+				self._block_end = None
+		if self._busy_until is not None and now >= self._busy_until:
+			self._busy_until = None
+			self._empty_since = now  # waiting for a dwell is no starvation
+			self._respond()
+
+	def _protocol(self, now):
+		while self._busy_until is None:
+			end = self._rx.find('\n')
+			if end < 0:
+				return
+			line = str(self._rx[:end]).strip().upper().replace(' ', '')
+			if line and not line.startswith('$') and not self._alarm:
+				words = self.pattern_word.findall(line)
+				motion = self._get_motion(words)
+				if motion == 'dwell' and self._planner:
+					return  # grbl synchronizes before a dwell
+				if motion == 'move' and len(self._planner) >= self.PLANNER_SIZE:
+					return  # wait for a free planner block
+			del self._rx[:end + 1]
+			self.stats['lines'] += 1
+			self._process_line(line, now)
+
+	def _respond(self, error=None):
+		if error is not None:
+			self.stats['errors'] += 1
+			self._write("error: {}".format(error))
+		elif self.version in self.VERSIONS_NO_RX_REPORTING:
+			self._write("ok")
+		else:
+			self._write("ok:{}".format(self.RX_BUFFER_SIZE - len(self._rx)))
+
+	def _process_line(self, line, now):
+		if not line:
+			self._respond()
+		elif line.startswith('$'):
+			self._process_system_command(line, now)
+		elif self._alarm:
+			self._respond("Alarm lock")
+		else:
+			error = self._process_gcode(self.pattern_word.findall(line), now)
+			if self._busy_until is None:
+				self._respond(error)
+
+	def _process_system_command(self, line, now):
+		match = self.pattern_setting.match(line)
+		if line == '$$':
+			for id, value in sorted(self.settings.items()):
+				self._write("${}={} (setting {})".format(id, "{:.3f}".format(value) if isinstance(value, float) else value, id))
+		elif match:
+			value = match.group(2)
+			self.settings[int(match.group(1))] = float(value) if '.' in value else int(value)
+		elif line == '$H':
+			# home is the back right corner
+			self._planner_pos = (self.settings.get(130, 0.0) - self.settings.get(27, 0.0),
+			                                 self.settings.get(131, 0.0) - self.settings.get(27, 0.0))
+			self._alarm = False
+		elif line == '$X':
+			if self._alarm:
+				self._write("[Caution: Unlocked]")
+			self._alarm = False
+		self._respond()
+
+	def _get_motion(self, words):
+		for letter, value in words:
+			if letter == 'G':
+				if value in ('4', '04'):
+					return 'dwell'
+			elif letter in 'XY':
+				return 'move'
+		return None
+
+	def _process_gcode(self, words, now):
+		"""
+		:returns: error message or None
+		"""
+		x, y = self._planner_pos
+		target = None
+		dwell = None
+		for letter, value in words:
+			try:
+				number = float(value)
+			except ValueError:
+				return "Bad number format"
+			if letter == 'G':
+				if number in (0, 1, 2, 3):
+					self._motion = int(number)
+				elif number == 4:
+					dwell = 0.0
+				elif number == 90:
+					self._absolute = True
+				elif number == 91:
+					self._absolute = False
+			elif letter == 'M':
+				if number in (3, 4):
+					self._laser = True
+				elif number in (2, 5, 30):
+					self._laser = False
+			elif letter == 'F':
+				self._feedrate = number
+			elif letter == 'S':
+				self._intensity = int(number)
+			elif letter == 'P' and dwell is not None:
+				dwell = number
+			elif letter in 'XY':
+				if target is None:
+					target = [x, y]
+				i = 0 if letter == 'X' else 1
+				target[i] = number if self._absolute else target[i] + number
+
+		if dwell is not None:
+			self._busy_until = now + dwell / self.speed
+			self._empty_since = None
+			return None
+		if target is not None:
+			if self._motion == 0:
+				rate = self.settings.get(110, 5000.0)
+			else:
+				if self._feedrate <= 0:
+					return "Undefined feed rate"
+				rate = min(self._feedrate, self.settings.get(110, 5000.0))
+			# arcs (G2, G3) are approximated by their chord
+			distance = ((target[0] - x) ** 2 + (target[1] - y) ** 2) ** 0.5
+			duration = distance / rate * 60.0 / self.speed
+			intensity = self._intensity if self._laser and self._motion != 0 else 0
+			self._add_block([duration, x, y, target[0], target[1], intensity], now)
+			self._planner_pos = tuple(target)
+		return None
+
+	def _add_block(self, block, now):
+		if not self._planner:
+			self._block_end = now + block[0]
+			if self._empty_since is not None:
+				self.stats['starved'] += now - self._empty_since
+				self._empty_since = None
+		self._planner.append(block)
+		self.stats['blocks'] += 1
+		self.stats['busy'] += block[0]
+
+	def _get_position(self, now):
+		if not self._planner:
+			return self._planner_pos
+		duration, x0, y0, x1, y1, _ = self._planner[0]
+		if self._held_at is not None:
+			now = self._held_at
+		done = 1.0 if duration <= 0 else max(0.0, min(1.0, 1 - (self._block_end - now) / duration))
+		return (x0 + (x1 - x0) * done, y0 + (y1 - y0) * done)
+
+	def _get_state(self):
+		if self._alarm:
+			return self.STATE_ALARM
+		if not self._planner:
+			return self.STATE_IDLE
+		if self._held_at is not None:
+			return self.STATE_QUEUE
+		return self.STATE_RUN
+
+	def _status_report(self, now):
+		x, y = self._get_position(now)
+		intensity = self._planner[0][5] if self._planner and self._held_at is None else 0
+		pos = "{:.3f},{:.3f},0.000".format(x, y)
+		limits = "" if self.version in self.VERSIONS_LEGACY_STATUS else "limits:,"
+		return "<{state},MPos:{pos},WPos:{pos},RX:{rx},{limits}laser {laser}:{intensity}>".format(
+			state=self._get_state(), pos=pos, rx=len(self._rx), limits=limits,
+			laser='on' if intensity > 0 else 'off', intensity=intensity)
+
+
+if __name__ == "__main__":
+	import logging
+	logging.basicConfig(level=logging.INFO)
+	emulator = GrblEmulator()
+	print("Grbl emulator on {}, set it as serial port. Ctrl-C to stop.".format(emulator.start()))
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		emulator.stop()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measurement harness for conversions while lasering.
+MachineCom streams a raster job to the grbl emulator (octoprint_mrbeam/util/grbl_emulator.py), which runs in its
+own process so the conversion load does not slow down the emulated machine. Reports the streaming throughput,
+the time grbl's planner ran empty because no data arrived in time, the machine efficiency and MachineCom's
+RxBufferStats for three runs: without conversion, converting in a thread of the streaming process
+(how do_slice converts) and converting with a BackgroundConversion.
+
+usage: benchmark_background_conversion.py [options] svg
+"""
+
+import __builtin__
+import multiprocessing
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import octoprint.plugin
+from octoprint.settings import settings
+
+from benchmark_comm_streaming import Callback, StatusReportTimer, stream, write_raster_job
+
+PARAMS = {'vector': [{'color': '#000000', 'intensity': '500', 'feedrate': '1000', 'passes': '1', 'pierce_time': '0'}],
+          'raster': {'intensity_white': 0, 'intensity_black': 500, 'speed_white': 1500, 'speed_black': 250,
+                     'contrast': 1.0, 'sharpening': 1.0, 'dithering': False, 'beam_diameter': 0.2, 'pierce_time': 0,
+                     'intensity_black_user': 50, 'intensity_white_user': 0,
+                     'engraving_mode': 'precise'},
+          'engrave': True, 'noheaders': 'true'}
+
+
+class EmulatorProcess(object):
+	"""
+	Runs a GrblEmulator in a child process. Offers the methods of GrblEmulator used by stream().
+	MachineCom connects to the emulator's pseudo terminal in this process like to a serial port.
+	"""
+
+	def __init__(self, **kwargs):
+		self._conn, child_conn = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(target=self._serve, args=(child_conn, kwargs))
+		self._process.daemon = True
+		self._process.start()
+		self.port = self._conn.recv()
+
+	@staticmethod
+	def _serve(conn, kwargs):
+		from octoprint_mrbeam.util.grbl_emulator import GrblEmulator
+		emulator = GrblEmulator(**kwargs)
+		conn.send(emulator.start())
+		while True:
+			name = conn.recv()
+			conn.send(getattr(emulator, name)())
+			if name == 'stop':
+				return
+
+	def _call(self, name):
+		self._conn.send(name)
+		return self._conn.recv()
+
+	def reset_stats(self):
+		self._call('reset_stats')
+
+	def get_stats(self):
+		return self._call('get_stats')
+
+	def is_idle(self):
+		return self._call('is_idle')
+
+	def stop(self):
+		self._call('stop')
+		self._process.join()
+
+
+class Stopped(Exception):
+	pass
+
+
+def convert_repeatedly(svg, stop, background, cpu_budget, counter):
+	from octoprint_mrbeam.gcodegenerator.converter import Converter
+	from octoprint_mrbeam.gcodegenerator.background_conversion import BackgroundConversion
+
+	def is_job_cancelled():
+		if stop.is_set():
+			raise Stopped()
+
+	directory = tempfile.mkdtemp()
+	try:
+		while True:
+			params = dict(PARAMS, directory=directory, file="benchmark.gco")
+			converter = Converter(params, svg, workingAreaWidth=500, workingAreaHeight=390)
+			if background:
+				BackgroundConversion(converter, cpu_budget=cpu_budget).convert(is_job_cancelled)
+			else:
+				converter.convert(is_job_cancelled)
+			counter.append(1)
+	except Stopped:
+		pass
+	finally:
+		shutil.rmtree(directory)
+
+
+def run(comm, callback, emulator, status_timer, path, options, svg=None, background=False):
+	stop = threading.Event()
+	conversions = []
+	load = None
+	if svg is not None:
+		load = threading.Thread(target=convert_repeatedly, args=(svg, stop, background, options.cpu_budget, conversions))
+		load.daemon = True
+		load.start()
+		time.sleep(0.5) # let the conversion start
+
+	try:
+		r = stream(comm, callback, emulator, status_timer, path)
+	finally:
+		stop.set()
+		if load is not None:
+			load.join()
+	r.update(conversions=len(conversions), rx_avg=comm._rx_stats.get_avg(), rx_min=comm._rx_stats.get_min(),
+	         rx_stats=comm._rx_stats.pp(print_time=r['duration']))
+	return r
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options] svg")
+	opts.add_option("-r", "--raster-size", type="float", default=20, help="edge length of the streamed raster job in mm, default 20", dest="raster_size")
+	opts.add_option("-s", "--speed", type="float", default=1.0, help="emulated machine runs jobs this many times faster than real time, default 1.0", dest="speed")
+	opts.add_option("-b", "--cpu-budget", type="float", default=0.5, help="cpu budget of the background conversion, default 0.5", dest="cpu_budget")
+	(options, args) = opts.parse_args()
+	if len(args) != 1:
+		opts.error("svg file to convert required")
+
+	basedir = tempfile.mkdtemp()
+	try:
+		settings(init=True, basedir=basedir)
+		octoprint.plugin.plugin_manager(init=True, plugin_folders=[], plugin_entry_points=[], plugin_disabled_list=[])
+		from octoprint_mrbeam.comm_acc2 import MachineCom
+		from octoprint_mrbeam.profile import laserCutterProfileManager
+		__builtin__._mrbeam_plugin_implementation = mock.MagicMock()
+
+		path = os.path.join(basedir, "raster.gco")
+		write_raster_job(path, options.raster_size, options.raster_size, 0.1)
+
+		emulator = EmulatorProcess(settings=laserCutterProfileManager().get_current_or_default()['grbl']['settings'],
+		                           homing_lock=False, speed=options.speed)
+		callback = Callback()
+		comm = MachineCom(port=emulator.port, baudrate=115200, callbackObject=callback)
+		status_timer = StatusReportTimer(comm)
+		callback.wait_for_state(MachineCom.STATE_LOCKED)
+		comm.sendCommand('$H')
+		callback.wait_for_state(MachineCom.STATE_OPERATIONAL)
+
+		for name, svg, background in (("idle", None, False), ("thread", args[0], False), ("background", args[0], True)):
+			r = run(comm, callback, emulator, status_timer, path, options, svg=svg, background=background)
+			print("{:<10} {lines_per_sec:8.1f} lines/s  planner starved {starved:6.2f}s  efficiency {efficiency:6.1%}  RX avg {rx_avg:3d} min {rx_min:3d}  conversions {conversions}".format(name, **r))
+			print("           " + r['rx_stats'])
+			if r['rx_overflows'] or r['errors']:
+				print("           RX buffer overflows: {rx_overflows}, errors: {errors}".format(**r))
+
+		comm.close()
+		comm._status_polling_timer.cancel()
+		comm.sending_thread.join(5)
+		comm.monitoring_thread.join(5)
+		emulator.stop()
+	finally:
+		shutil.rmtree(basedir)
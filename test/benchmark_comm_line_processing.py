@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per line CPU cost of the line processing in MachineCom, compared with the former implementation:
+- process: process_gcode_line, as applied to each line of a job when it is compiled (comment stripping and
+  whitespace removal)
+- phases: _process_command_phase "sending" and "sent" for each processed line, as in _sendCommand
+  (gcode word parsing, handler lookup, feedrate and intensity replacement)
+
+Without gcode files a raster like job of --lines lines is generated.
+
+usage: benchmark_comm_line_processing.py [options] [<gcode file> ...]
+"""
+
+import __builtin__
+import optparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from octoprint_mrbeam.comm_acc2 import MachineCom, process_gcode_line
+
+
+def legacy_strip_comment(line):
+	if not ";" in line:
+		# shortcut
+		return line
+
+	escaped = False
+	result = []
+	for c in line:
+		if c == ";" and not escaped:
+			break
+		result += c
+		escaped = (c == "\\") and not escaped
+	return "".join(result)
+
+
+def legacy_process_gcode_line(line):
+	line = legacy_strip_comment(line).strip()
+	line = line.replace(" ", "")
+	if not len(line):
+		return None
+	return line
+
+
+legacy_regex_command = re.compile("^\s*\$?([GM]\d+|[THFSX])")
+
+
+def legacy_gcode_command_for_cmd(comm, cmd):
+	if not cmd:
+		return None
+
+	if cmd == comm.COMMAND_HOLD: return 'Hold'
+	if cmd == comm.COMMAND_RESUME: return 'Resume'
+
+	gcode = legacy_regex_command.search(cmd)
+	if not gcode:
+		return None
+
+	return gcode.group(1)
+
+
+def legacy_process_command_phase(comm, phase, command, command_type=None, gcode=None):
+	if phase not in ("queuing", "queued", "sending", "sent"):
+		return command, command_type, gcode
+
+	if gcode is None:
+		gcode = legacy_gcode_command_for_cmd(comm, command)
+
+	if gcode is not None:
+		gcodeHandler = "_gcode_" + gcode + "_" + phase
+		if hasattr(comm, gcodeHandler):
+			handler_result = getattr(comm, gcodeHandler)(command, cmd_type=command_type)
+			command, command_type, gcode = comm._handle_command_handler_result(command, command_type, gcode, handler_result)
+			# the handler result used to be parsed again in any case
+			gcode = legacy_gcode_command_for_cmd(comm, command)
+
+	return command, command_type, gcode
+
+
+def legacy_phases(comm, lines):
+	for line in lines:
+		cmd, _, _ = legacy_process_command_phase(comm, "sending", line)
+		legacy_process_command_phase(comm, "sent", cmd)
+
+
+def phases(comm, lines):
+	for line in lines:
+		cmd, _, gcode = comm._process_command_phase("sending", line)
+		comm._process_command_phase("sent", cmd, gcode=gcode)
+
+
+def get_comm():
+	# just what the command handlers need, without a serial connection
+	comm = MachineCom.__new__(MachineCom)
+	comm._regex_feedrate = re.compile("F\d+", re.IGNORECASE)
+	comm._regex_intensity = re.compile("S\d+", re.IGNORECASE)
+	comm._feedrate_factor = 1
+	comm._feedrate_dict = {}
+	comm._intensity_factor = 1
+	comm._intensity_dict = {}
+	comm._laserCutterProfile = dict(laser=dict(intensity_limit=1300))
+	comm._command_handlers = comm._get_command_handlers()
+	return comm
+
+
+def write_raster_job(path, count, row_length=500):
+	with open(path, 'w') as fh:
+		fh.write("; raster job\nG90\nG21\nM3S0\n")
+		for i in range(count):
+			if i % row_length == 0:
+				fh.write("; row {}\nG0X0.00Y{:.2f}\nF1500\n".format(i // row_length, 10 + i // row_length * 0.1))
+			fh.write("G1X{:.2f}S{}\n".format((i % row_length) * 0.1, (i * 7) % 500))
+		fh.write("M5\n")
+
+
+def cpu_time(func, *args):
+	start = time.clock()
+	result = func(*args)
+	return time.clock() - start, result
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options] [<gcode file> ...]")
+	opts.add_option("-n", "--lines", type="int", default=1000000, help="number of lines of the generated raster job, default 1000000", dest="lines")
+	(options, args) = opts.parse_args()
+
+	__builtin__._mrbeam_plugin_implementation = mock.MagicMock()
+
+	basedir = tempfile.mkdtemp()
+	try:
+		files = args
+		if not files:
+			files = [os.path.join(basedir, "raster.gco")]
+			write_raster_job(files[0], options.lines)
+
+		comm = get_comm()
+		print("{:<24} {:>8} {:>8} {:>14} {:>14} {:>8}".format("file", "lines", "impl.", "process us/l", "phases us/l", "total s"))
+		for path in files:
+			with open(path, 'r') as fh:
+				lines = fh.readlines()
+			for name, process, run_phases in (("legacy", legacy_process_gcode_line, legacy_phases), ("current", process_gcode_line, phases)):
+				process_time, processed = cpu_time(lambda: [l for l in (process(line) for line in lines) if l is not None])
+				phases_time, _ = cpu_time(run_phases, comm, processed)
+				print("{:<24} {:8d} {:>8} {:14.2f} {:14.2f} {:8.2f}".format(os.path.basename(path)[:24], len(lines), name,
+					process_time / len(lines) * 1e6, phases_time / len(processed) * 1e6, process_time + phases_time))
+	finally:
+		shutil.rmtree(basedir)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measurement harness for the RX buffer accounting of the character counting protocol in MachineCom.
+Compares AccLineBuffer (deque with a running character count) with the former list based accounting
+(sum over all unacknowledged lines per send attempt, del [0] per ok):
+- accounting only: send/acknowledge cycles with the send window kept full, as in _sendCommand and _readline
+- streaming: raster like gcode streamed to the simulated grbl of benchmark_background_conversion.py
+  (127 byte RX buffer, planner executing one line per --line-time), reports lines/s and planner starvation
+
+usage: benchmark_comm_rx_accounting.py [options]
+"""
+
+import __builtin__
+import multiprocessing
+import optparse
+import os
+import socket
+import sys
+import threading
+import time
+import timeit
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from octoprint_mrbeam.comm_acc2 import AccLineBuffer
+from benchmark_background_conversion import simulated_grbl, Streamer, get_gcode_lines, WORKING_RX_BUFFER_SIZE
+
+
+class ListLineBuffer():
+	"""
+	The accounting MachineCom used before AccLineBuffer, with the AccLineBuffer interface.
+	"""
+
+	def __init__(self, size):
+		self.size = size
+		self._lines = []
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._lines)
+
+	def fits(self, length):
+		return sum([len(x) for x in self._lines]) + length < self.size
+
+	def append(self, line):
+		with self._lock:
+			self._lines.append(line)
+
+	def acknowledge(self):
+		with self._lock:
+			if len(self._lines) > 0:
+				line = self._lines[0]
+				del self._lines[0]
+				return line
+
+
+def accounting_cycles(buffer_class, lines):
+	acc_line_buffer = buffer_class(WORKING_RX_BUFFER_SIZE)
+	for line in lines:
+		while not acc_line_buffer.fits(len(line)):
+			acc_line_buffer.acknowledge()
+		acc_line_buffer.append(line)
+
+
+def stream(buffer_class, options):
+	sock, grbl_sock = socket.socketpair()
+	result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+	grbl = multiprocessing.Process(target=simulated_grbl, args=(grbl_sock, options.line_time / 1000.0, result_writer))
+	grbl.start()
+	streamer = Streamer(sock, acc_line_buffer=buffer_class(WORKING_RX_BUFFER_SIZE))
+	duration = streamer.stream(get_gcode_lines(options.lines))
+	sock.shutdown(socket.SHUT_WR)
+	grbl_result = result_reader.recv()
+	grbl.join()
+	return dict(lines_per_sec=options.lines / duration, starved=grbl_result['starved'], rx_avg=streamer.rx_stats.get_avg())
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options]")
+	opts.add_option("-n", "--lines", type="int", default=5000, help="number of gcode lines to stream, default 5000", dest="lines")
+	opts.add_option("-t", "--line-time", type="float", default=0.5, help="ms the simulated planner needs per line, default 0.5", dest="line_time")
+	opts.add_option("-c", "--cycles", type="int", default=200000, help="number of lines for the accounting only run, default 200000", dest="cycles")
+	(options, args) = opts.parse_args()
+
+	__builtin__._mrbeam_plugin_implementation = mock.MagicMock()
+
+	lines = [l + '\n' for l in get_gcode_lines(options.cycles)]
+	for name, buffer_class in (("list", ListLineBuffer), ("deque", AccLineBuffer)):
+		duration = min(timeit.repeat(lambda: accounting_cycles(buffer_class, lines), number=1, repeat=3))
+		print("{:<6} accounting {:9.0f} lines/s ({:.2f}us per line)".format(name, options.cycles / duration, duration / options.cycles * 1e6))
+	for name, buffer_class in (("list", ListLineBuffer), ("deque", AccLineBuffer)):
+		print("{:<6} streaming  {lines_per_sec:9.1f} lines/s  planner starved {starved:6.2f}s  RX avg {rx_avg:3d}".format(name, **stream(buffer_class, options)))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end streaming benchmark of MachineCom against the grbl emulator (octoprint_mrbeam/util/grbl_emulator.py).
+MachineCom connects to the emulator's pseudo terminal through its regular _openSerial, homes and streams each
+gcode file as a job. Reported per file:
+- lines/s: streamed lines per second of job time
+- starved: seconds grbl's planner ran empty between two blocks because no data arrived in time
+- efficiency: time the emulated machine was moving / job time (until the planner ran empty)
+- status polls: number of status reports, the share of the serial line they took and the time the monitoring
+  thread spent in _handle_status_report
+
+Without gcode files a raster and a vector reference job are generated with the gcode generator.
+
+usage: benchmark_comm_streaming.py [options] [<gcode file> ...]
+"""
+
+import __builtin__
+import math
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'octoprint_mrbeam', 'gcodegenerator'))
+
+import octoprint.plugin
+from octoprint.settings import settings
+
+
+class Callback(object):
+	"""
+	MachineComPrintCallback recording state changes and the end of the job
+	"""
+
+	def __init__(self):
+		self.state = None
+		self.state_changed = threading.Event()
+		self.job_done = threading.Event()
+
+	def __getattr__(self, name):
+		if name.startswith('on_comm_'):
+			return lambda *args, **kwargs: None
+		raise AttributeError(name)
+
+	def on_comm_state_change(self, state):
+		self.state = state
+		self.state_changed.set()
+
+	def on_comm_print_job_done(self):
+		self.job_done.set()
+
+	def wait_for_state(self, state, timeout=10):
+		end = time.time() + timeout
+		while self.state != state:
+			if time.time() > end:
+				raise Exception("Timeout waiting for state {}, state is {}".format(state, self.state))
+			self.state_changed.wait(0.1)
+			self.state_changed.clear()
+
+
+class StatusReportTimer(object):
+	"""
+	Wraps MachineCom._handle_status_report to measure the time spent handling status reports
+	"""
+
+	def __init__(self, comm):
+		self.count = 0
+		self.duration = 0.0
+		self.bytes = 0
+		self._handle_status_report = comm._handle_status_report
+		comm._handle_status_report = self
+
+	def __call__(self, line):
+		start = time.time()
+		self._handle_status_report(line)
+		self.duration += time.time() - start
+		self.count += 1
+		self.bytes += len(line)
+
+	def reset(self):
+		self.count = 0
+		self.duration = 0.0
+		self.bytes = 0
+
+
+def write_raster_job(path, width, height, beam_diameter):
+	import numpy
+	from PIL import Image
+	from img2gcode import ImageProcessor
+	from gcode_writer import GcodeWriter
+
+	xx, yy = numpy.meshgrid(numpy.linspace(0, 4 * numpy.pi, int(width / beam_diameter)), numpy.linspace(0, 3 * numpy.pi, int(height / beam_diameter)))
+	img = Image.fromarray(numpy.clip(127 + 120 * numpy.sin(xx) * numpy.cos(yy), 0, 255).astype(numpy.uint8))
+	with open(path, 'w') as fh:
+		writer = GcodeWriter(fh)
+		ip = ImageProcessor(output_filehandle=writer, workingAreaWidth=500, workingAreaHeight=390, beam_diameter=beam_diameter,
+		                    intensity_black=1000, intensity_white=0, speed_black=500, speed_white=3000)
+		ip.generate_gcode(ip.img_prepare(img, width, height), 10, 10, width, height, "raster")
+		writer.close()
+
+
+def write_vector_job(path, count, segments):
+	# closed polygons, cut like the converter does: move, laser on, pierce, path, laser off
+	with open(path, 'w') as fh:
+		fh.write("G90\nG21\n")
+		for i in range(count):
+			cx = 20 + (i % 20) * 22
+			cy = 20 + (i // 20) * 22
+			r = 10
+			fh.write("G0X{:.2f}Y{:.2f}\nM3S500\nG4P0.1\n".format(cx + r, cy))
+			for s in range(1, segments + 1):
+				a = 2 * math.pi * s / segments
+				fh.write("G1X{:.2f}Y{:.2f}F1500\n".format(cx + r * math.cos(a), cy + r * math.sin(a)))
+			fh.write("M5\n")
+
+
+def count_lines(path):
+	with open(path, 'r') as fh:
+		return sum(1 for line in fh if line.strip())
+
+
+def stream(comm, callback, emulator, status_timer, path):
+	emulator.reset_stats()
+	status_timer.reset()
+	callback.job_done.clear()
+	comm.selectFile(path, False)
+	start = time.time()
+	comm.startPrint()
+	if not callback.job_done.wait(3600):
+		raise Exception("Job did not finish")
+	# the job is done once grbl acknowledged all lines, the machine is done when the planner ran empty
+	while not emulator.is_idle():
+		time.sleep(0.01)
+	duration = time.time() - start
+	stats = emulator.get_stats()
+	lines = count_lines(path)
+	return dict(lines=lines, duration=duration, lines_per_sec=lines / duration, starved=stats['starved'],
+	            efficiency=stats['busy'] / duration, status_polls=stats['status_requests'],
+	            status_share=float(status_timer.bytes) / (status_timer.bytes + stats['bytes']) if stats['bytes'] else 0,
+	            status_ms=status_timer.duration * 1000, rx_overflows=stats['rx_overflows'], errors=stats['errors'])
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options] [<gcode file> ...]")
+	opts.add_option("-s", "--speed", type="float", default=1.0, help="emulated machine runs jobs this many times faster than real time, default 1.0", dest="speed")
+	opts.add_option("-b", "--baudrate", type="int", default=115200, help="baud rate of the emulated serial line, 0 for unlimited, default 115200", dest="baudrate")
+	opts.add_option("-r", "--raster-size", type="float", default=20, help="edge length of the generated raster job in mm, default 20", dest="raster_size")
+	opts.add_option("-v", "--vector-count", type="int", default=40, help="number of polygons in the generated vector job, default 40", dest="vector_count")
+	(options, args) = opts.parse_args()
+
+	basedir = tempfile.mkdtemp()
+	try:
+		settings(init=True, basedir=basedir)
+		octoprint.plugin.plugin_manager(init=True, plugin_folders=[], plugin_entry_points=[], plugin_disabled_list=[])
+		from octoprint_mrbeam.comm_acc2 import MachineCom
+		from octoprint_mrbeam.profile import laserCutterProfileManager
+		from octoprint_mrbeam.util.grbl_emulator import GrblEmulator
+		__builtin__._mrbeam_plugin_implementation = mock.MagicMock()
+
+		files = args
+		if not files:
+			files = [os.path.join(basedir, "raster.gco"), os.path.join(basedir, "vector.gco")]
+			write_raster_job(files[0], options.raster_size, options.raster_size, 0.1)
+			write_vector_job(files[1], options.vector_count, 64)
+
+		emulator = GrblEmulator(settings=laserCutterProfileManager().get_current_or_default()['grbl']['settings'],
+		                        homing_lock=False, speed=options.speed, baudrate=options.baudrate)
+		emulator.start()
+		callback = Callback()
+		comm = MachineCom(port=emulator.port, baudrate=115200, callbackObject=callback)
+		status_timer = StatusReportTimer(comm)
+		callback.wait_for_state(MachineCom.STATE_LOCKED)
+		comm.sendCommand('$H')
+		callback.wait_for_state(MachineCom.STATE_OPERATIONAL)
+
+		print("{:<24} {:>8} {:>9} {:>10} {:>9} {:>7} {:>13} {:>10}".format(
+			"file", "lines", "job time", "lines/s", "starved", "effic.", "status polls", "status ms"))
+		for path in files:
+			r = stream(comm, callback, emulator, status_timer, path)
+			print("{name:<24} {lines:8d} {duration:8.2f}s {lines_per_sec:10.1f} {starved:8.2f}s {efficiency:7.1%} {status_polls:5d} ({status_share:5.1%}) {status_ms:9.1f}".format(
+				name=os.path.basename(path)[:24], **r))
+			if r['rx_overflows'] or r['errors']:
+				print("  RX buffer overflows: {rx_overflows}, errors: {errors}".format(**r))
+
+		comm.close()
+		comm._status_polling_timer.cancel()
+		comm.sending_thread.join(5)
+		comm.monitoring_thread.join(5)
+		emulator.stop()
+	finally:
+		shutil.rmtree(basedir)
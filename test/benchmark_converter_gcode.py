@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro benchmark for the vector gcode emission of Converter._generate_gcode.
+Compares the former string concatenating implementation ("before") with the line generator ("after")
+on a synthetic curve of lines and arcs.
+
+usage: benchmark_converter_gcode.py [options]
+"""
+
+import __builtin__
+import math
+import optparse
+import os
+import random
+import sys
+import time
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'octoprint_mrbeam', 'gcodegenerator'))
+import machine_settings
+from point import Point
+from converter import Converter
+
+
+def get_curve(segments, seed=0):
+	# subpaths of 50 segments, mixed lines and arcs
+	rnd = random.Random(seed)
+	curve = []
+	x, y = 10.0, 10.0
+	for i in range(segments):
+		if i % 50 == 0:
+			if i > 0:
+				curve.append([[x, y], 'end', 0, 0])
+			x, y = rnd.uniform(0, 500), rnd.uniform(0, 390)
+			curve.append([[x, y], 'move', 0, 0])
+		if rnd.random() < 0.5:
+			curve.append([[x, y], 'line', 0, 0])
+			x, y = x + rnd.uniform(-2, 2), y + rnd.uniform(-2, 2)
+		else:
+			r = rnd.uniform(0.1, 5)
+			a = rnd.uniform(0, 2 * math.pi)
+			curve.append([[x, y], 'arc', [x + r * math.cos(a), y + r * math.sin(a)], rnd.choice([-1, 1]) * rnd.uniform(0.1, 1)])
+			x, y = x + rnd.uniform(-1, 1), y + rnd.uniform(-1, 1)
+	curve.append([[x, y], 'end', 0, 0])
+	return curve
+
+
+def legacy_generate_gcode(curve, settings, color='#000000'):
+	def c(c):
+		c = [c[i] if i < len(c) else None for i in range(6)]
+		if c[5] == 0: c[5] = None
+		s = [" X", " Y", " Z", " I", " J", " K"]
+		r = ''
+		for i in range(6):
+			if c[i] != None:
+				r += s[i] + ("%.4f" % (round(c[i], 4)))
+		return r
+
+	if len(curve) == 0: return ""
+
+	str(curve) # was logged at debug level
+	g = ""
+
+	lg = 'G00'
+	f = "F%s;%s" % (settings['feedrate'], color)
+	for i in range(1, len(curve)):
+		s = curve[i - 1]
+		si = curve[i]
+		feed = f if lg not in ['G01', 'G02', 'G03'] else ''
+		if s[1] == 'move':
+			g += "G0" + c(si[0]) + "\n" + machine_settings.gcode_before_path_color(color, settings['intensity']) + "\n"
+			pt = int(settings['pierce_time'])
+			if pt > 0:
+				g += "G4P%.3f\n" % (round(pt / 1000.0, 4))
+			lg = 'G00'
+		elif s[1] == 'end':
+			g += machine_settings.gcode_after_path() + "\n"
+			lg = 'G00'
+		elif s[1] == 'line':
+			if lg == "G00": g += "G01 " + feed + "\n"
+			g += "G01 " + c(si[0]) + "\n"
+			lg = 'G01'
+		elif s[1] == 'arc':
+			r = [(s[2][0] - s[0][0]), (s[2][1] - s[0][1])]
+			if lg == "G00": g += "G01" + feed + "\n"
+			if (r[0] ** 2 + r[1] ** 2) > .1:
+				r1, r2 = (Point(s[0]) - Point(s[2])), (Point(si[0]) - Point(s[2]))
+				if abs(r1.mag() - r2.mag()) < 0.001:
+					g += ("G02" if s[3] < 0 else "G03") + c(
+						si[0] + [None, (s[2][0] - s[0][0]), (s[2][1] - s[0][1])]) + "\n"
+				else:
+					r = (r1.mag() + r2.mag()) / 2
+					g += ("G02" if s[3] < 0 else "G03") + c(si[0]) + " R%f" % (r) + "\n"
+				lg = 'G02'
+			else:
+				g += "G01" + c(si[0]) + feed + "\n"
+				lg = 'G01'
+	if si[1] == 'end':
+		g += machine_settings.gcode_after_path() + "\n"
+	return g
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options]")
+	opts.add_option("-n", "--segments", type="int", default=100000, help="number of curve segments, default 100000", dest="segments")
+	opts.add_option("", "--pierce-time", type="int", default=0, help="pierce time in ms, default 0", dest="pierce_time")
+	(options, args) = opts.parse_args()
+
+	__builtin__._mrbeam_plugin_implementation = mock.MagicMock()
+	converter = Converter({}, None)
+	settings = {'intensity': 500, 'feedrate': 1000, 'passes': 1, 'pierce_time': options.pierce_time}
+	curve = get_curve(options.segments)
+
+	start = time.time()
+	before = legacy_generate_gcode(curve, settings)
+	t_before = time.time() - start
+
+	start = time.time()
+	after = converter._generate_gcode(curve, settings)
+	t_after = time.time() - start
+
+	lines = after.count("\n")
+	print("before  %8.3fs %10.0f lines/s" % (t_before, lines / t_before))
+	print("after   %8.3fs %10.0f lines/s" % (t_after, lines / t_after))
+	print("identical output: %s, %d segments, %d lines, speedup %.2fx" % (before == after, options.segments, lines, t_before / t_after))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for the raster gcode generation of img2gcode.
+Compares the per-pixel engine with full G1 words ("before") to the numpy engine with
+run-length emission and modal S/F words ("after").
+
+usage: benchmark_img2gcode.py [options] [<imagefile>]
+If no image file is given, a synthetic photo-like image is used.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+import numpy
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'octoprint_mrbeam', 'gcodegenerator'))
+from img2gcode import ImageProcessor
+from gcode_writer import GcodeWriter
+
+
+def get_synthetic_image(w_px, h_px, seed=0):
+	# smooth gradients with some noise and white gaps, roughly like a photo with background
+	rnd = numpy.random.RandomState(seed)
+	xx, yy = numpy.meshgrid(numpy.linspace(0, 4 * numpy.pi, w_px), numpy.linspace(0, 3 * numpy.pi, h_px))
+	img = 127 + 100 * numpy.sin(xx) * numpy.cos(yy) + rnd.normal(0, 6, (h_px, w_px))
+	img[(numpy.sin(xx / 2) > 0.8)] = 255
+	return Image.fromarray(numpy.clip(img, 0, 255).astype(numpy.uint8))
+
+
+def run(img, w_mm, h_mm, engine, skip_redundant_words, options):
+	writer = GcodeWriter(open(os.devnull, 'w'))
+	ip = ImageProcessor(output_filehandle=writer,
+	                    workingAreaWidth=500,
+	                    workingAreaHeight=390,
+	                    beam_diameter=options.beam_diameter,
+	                    intensity_black=1000,
+	                    intensity_white=0,
+	                    speed_black=500,
+	                    speed_white=3000,
+	                    dithering=options.dithering,
+	                    engraving_mode=options.engraving_mode,
+	                    raster_engine=engine,
+	                    skip_redundant_words=skip_redundant_words)
+	ip.debug = False
+	ip.debugPreprocessing = False
+	parts = ip.img_prepare(img, w_mm, h_mm)
+
+	start = time.time()
+	ip.generate_gcode(parts, 0, 0, w_mm, h_mm, "benchmark")
+	duration = time.time() - start
+	writer.close()
+
+	juicy_px = 0
+	for p in parts:
+		juicy_px += int((ip.get_pixel_array(p['i']) <= ip.ignore_brighter_than).sum())
+	engraved_mm2 = juicy_px * ip.beam * ip.beam
+
+	stats = writer.get_stats()
+	return dict(duration=duration,
+	            lines=stats['lines'],
+	            bytes=stats['bytes'],
+	            lines_per_sec=stats['lines'] / duration if duration > 0 else 0,
+	            bytes_per_mm2=stats['bytes'] / engraved_mm2 if engraved_mm2 > 0 else 0)
+
+
+if __name__ == "__main__":
+	opts = optparse.OptionParser(usage="usage: %prog [options] [<imagefile>]")
+	opts.add_option("-w", "--width", type="float", default=100, help="width of the image in mm, default 100", dest="width")
+	opts.add_option("", "--height", type="float", default=70, help="height of the image in mm, default 70", dest="height")
+	opts.add_option("", "--beam-diameter", type="float", default=0.1, help="laser beam diameter, default 0.1mm", dest="beam_diameter")
+	opts.add_option("", "--dithering", action="store_true", default=False, help="convert image to black and white pixels", dest="dithering")
+	opts.add_option("", "--engraving-mode", type="string", default=ImageProcessor.ENGRAVING_MODE_BASIC, help="basic|precise|fast, default basic", dest="engraving_mode")
+	(options, args) = opts.parse_args()
+
+	if len(args) > 0:
+		img = Image.open(args[0])
+	else:
+		img = get_synthetic_image(int(options.width / options.beam_diameter), int(options.height / options.beam_diameter))
+
+	results = [
+		("before", run(img, options.width, options.height, ImageProcessor.RASTER_ENGINE_PIXEL, False, options)),
+		("after", run(img, options.width, options.height, ImageProcessor.RASTER_ENGINE_NUMPY, True, options)),
+	]
+	for name, r in results:
+		print("{:<7} {duration:8.2f}s {lines:9d} lines {bytes:10d} bytes {lines_per_sec:10.0f} lines/s {bytes_per_mm2:8.2f} bytes/mm2".format(name, **r))
+	print("speedup: {:.2f}x, size: {:.1f}%".format(results[0][1]['duration'] / results[1][1]['duration'], 100.0 * results[1][1]['bytes'] / results[0][1]['bytes']))
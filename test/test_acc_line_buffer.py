@@ -0,0 +1,25 @@
+import unittest
+
+from octoprint_mrbeam.comm_acc2 import AccLineBuffer
+
+
+class AccLineBufferTestCase(unittest.TestCase):
+
+	def test_send_window(self):
+		acc_line_buffer = AccLineBuffer(20)
+		acc_line_buffer.append("G1X10.5S200\n")
+		self.assertEqual((len(acc_line_buffer), acc_line_buffer.get_char_count(), acc_line_buffer.get_free()), (1, 12, 8))
+		self.assertTrue(acc_line_buffer.fits(7))
+		self.assertFalse(acc_line_buffer.fits(8))
+		acc_line_buffer.append("G0Y1\n")
+		self.assertEqual(acc_line_buffer.acknowledge(), "G1X10.5S200\n")
+		self.assertEqual(acc_line_buffer.get_char_count(), 5)
+		self.assertEqual(acc_line_buffer.acknowledge(), "G0Y1\n")
+		self.assertIsNone(acc_line_buffer.acknowledge())
+		self.assertEqual(acc_line_buffer.get_char_count(), 0)
+
+	def test_reset(self):
+		acc_line_buffer = AccLineBuffer(20)
+		acc_line_buffer.append("G0Y1\n")
+		acc_line_buffer.reset()
+		self.assertEqual((len(acc_line_buffer), acc_line_buffer.get_char_count()), (0, 0))
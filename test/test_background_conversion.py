@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from octoprint_mrbeam.gcodegenerator.background_conversion import BackgroundConversion
+from octoprint_mrbeam.gcodegenerator.converter import OutOfSpaceException
+
+
+class FakeConverter():
+
+	def __init__(self, output, error=None, duration=0):
+		self.output = output
+		self.error = error
+		self.duration = duration
+
+	def convert(self, is_job_cancelled, on_progress=None, on_progress_args=None, on_progress_kwargs=None):
+		on_progress(_progress=0.5)
+		time.sleep(self.duration)
+		if self.error is not None:
+			raise self.error
+		with open(self.output, 'w') as fh:
+			fh.write("G0X1\n")
+		on_progress(_progress=1.0)
+
+	def get_profile(self):
+		return dict(total=self.duration)
+
+
+class Cancelled(Exception):
+	pass
+
+
+class BackgroundConversionTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.output = os.path.join(self._dir, "out.gco")
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def test_convert(self):
+		progress = []
+		conversion = BackgroundConversion(FakeConverter(self.output))
+		conversion.convert(None, lambda _progress: progress.append(_progress))
+		with open(self.output, 'r') as fh:
+			self.assertEqual(fh.read(), "G0X1\n")
+		self.assertEqual(progress, [0.5, 1.0])
+		self.assertEqual(conversion.get_profile()['total'], 0)
+
+	def test_errors(self):
+		with self.assertRaises(OutOfSpaceException):
+			BackgroundConversion(FakeConverter(self.output, error=OutOfSpaceException("full"))).convert(None)
+		with self.assertRaises(Exception):
+			BackgroundConversion(FakeConverter(self.output, error=ValueError("broken"))).convert(None)
+
+	def test_cancel(self):
+		start = time.time()
+
+		def is_job_cancelled():
+			if time.time() - start > 0.2:
+				raise Cancelled()
+
+		with self.assertRaises(Cancelled):
+			BackgroundConversion(FakeConverter(self.output, duration=10)).convert(is_job_cancelled)
+		self.assertLess(time.time() - start, 5)
+		self.assertFalse(os.path.exists(self.output))
@@ -0,0 +1,55 @@
+import random
+import unittest
+
+import ddt
+
+from octoprint_mrbeam.gcodegenerator import biarc
+
+
+@ddt.ddt
+class BiarcSegmentsTestCase(unittest.TestCase):
+
+	def _get_segments(self, kind, count=60, seed=1):
+		rnd = random.Random(seed)
+		segments = []
+		for _ in range(count):
+			p = [[rnd.uniform(0, 100), rnd.uniform(0, 100)] for _ in range(4)]
+			if kind == 'zero_start_tangent':
+				p[1] = p[0][:]
+			elif kind == 'zero_end_tangent':
+				p[2] = p[3][:]
+			elif kind == 'closed':
+				p[3] = p[0][:]
+			elif kind == 'straight':
+				p = [[0, 0], [1, 1], [2, 2], [3, 3]]
+			elif kind == 'small':
+				p = [[x * 0.05 for x in q] for q in p]
+			segments.append(([p[0], p[0], p[1]], [p[2], p[3], p[3]]))
+		return segments
+
+	def _flatten(self, entry):
+		values = list(entry[0]) + list(entry[4])
+		if entry[1] == 'arc':
+			values += list(entry[2]) + [entry[3]]
+		return values
+
+	@ddt.data('curve', 'zero_start_tangent', 'zero_end_tangent', 'closed', 'straight', 'small')
+	def test_same_as_biarc(self, kind):
+		segments = self._get_segments(kind)
+		batch = biarc.biarc_segments(segments, max_depth=biarc.BIARC_SPLIT_DEPTH)
+		self.assertEqual(len(batch), len(segments))
+		for (sp1, sp2), entries in zip(segments, batch):
+			expected = biarc.biarc(sp1, sp2, 0, 0)
+			self.assertEqual([e[1] for e in entries], [e[1] for e in expected])
+			for e, x in zip(entries, expected):
+				for a, b in zip(self._flatten(e), self._flatten(x)):
+					self.assertAlmostEqual(a, b, places=6)
+
+	def test_tolerance(self):
+		segments = self._get_segments('curve', count=20)
+		coarse = sum(len(e) for e in biarc.biarc_segments(segments, tolerance=5))
+		fine = sum(len(e) for e in biarc.biarc_segments(segments, tolerance=0.01))
+		self.assertGreater(fine, coarse)
+
+	def test_empty(self):
+		self.assertEqual(biarc.biarc_segments([]), [])
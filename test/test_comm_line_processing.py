@@ -0,0 +1,39 @@
+import unittest
+
+from octoprint_mrbeam.comm_acc2 import MachineCom, process_gcode_line, strip_comment
+
+
+class CommLineProcessingTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.comm = MachineCom.__new__(MachineCom)
+		self.comm._command_handlers = self.comm._get_command_handlers()
+
+	def test_strip_comment(self):
+		self.assertEqual(strip_comment("G1X10"), "G1X10")
+		self.assertEqual(strip_comment("G1X10 ; move"), "G1X10 ")
+		self.assertEqual(strip_comment(";G1X10"), "")
+		self.assertEqual(strip_comment("M117 a\;b ; msg"), "M117 a\;b ")
+		self.assertEqual(strip_comment("M117 a\\\;b"), "M117 a\\\\")
+		self.assertEqual(strip_comment("M117 a\\"), "M117 a\\")
+
+	def test_process_gcode_line(self):
+		self.assertEqual(process_gcode_line(" G1 X10.5 S200 ; move\n"), "G1X10.5S200")
+		self.assertEqual(process_gcode_line("G0X1Y2\r\n"), "G0X1Y2")
+		self.assertIsNone(process_gcode_line("; comment\n"))
+		self.assertIsNone(process_gcode_line(" \n"))
+
+	def test_gcode_command_for_cmd(self):
+		for cmd, gcode in (("G1X10S200", "G1"), ("G01X10", "G01"), ("G10L2", "G10"), ("M3S300", "M3"),
+		                   ("  G0X1", "G0"), ("$H", "H"), ("$X", "X"), ("$$", None), ("$10=1", None),
+		                   ("S300", "S"), ("F1000", "F"), ("!", "Hold"), ("~", "Resume"), ("?", None), ("", None)):
+			self.assertEqual(self.comm._gcode_command_for_cmd(cmd), gcode, cmd)
+
+	def test_command_handlers(self):
+		handlers = self.comm._command_handlers
+		self.assertEqual(sorted(handlers), sorted(MachineCom.COMMAND_PHASES))
+		self.assertEqual(handlers['sending']['G01'], self.comm._gcode_G01_sending)
+		self.assertEqual(handlers['sent']['Hold'], self.comm._gcode_Hold_sent)
+		self.assertNotIn('G1', handlers['sent'])
+		self.assertEqual(self.comm._process_command_phase("sent", "G1X10"), ("G1X10", None, "G1"))
+		self.assertEqual(self.comm._process_command_phase("unknown", "G1X10"), ("G1X10", None, None))
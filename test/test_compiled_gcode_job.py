@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from octoprint_mrbeam.comm_acc2 import PrintingGcodeFileInformation, CompiledGcodeJob
+
+
+class CompiledGcodeJobTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.path = os.path.join(self._dir, "job.gco")
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def _write(self, content):
+		with open(self.path, 'w') as fh:
+			fh.write(content)
+
+	def _read_all(self, file_info):
+		lines = []
+		line = file_info.getNext()
+		while line is not None:
+			lines.append(line)
+			line = file_info.getNext()
+		return lines
+
+	def test_chunks(self):
+		count = CompiledGcodeJob.CHUNK_SIZE * 3 + 7
+		self._write("".join("G1 X{}\n".format(i) for i in range(count)))
+		job = CompiledGcodeJob(self.path)
+		self.assertIsNone(job.get(count)[0])
+		chunk = job.get_chunk(count - 2, 10)
+		self.assertEqual([command for command, _, _ in chunk], ["G1X{}".format(count - 2), "G1X{}".format(count - 1)])
+		self.assertEqual(job.get_chunk(count, 10), [(None, os.path.getsize(self.path), 0)])
+		for index in (5, CompiledGcodeJob.CHUNK_SIZE * 2 + 1, 0, CompiledGcodeJob.CHUNK_SIZE):
+			self.assertEqual(job.get(index)[0], "G1X{}".format(index))
+		job.release()
+
+	def test_spool_file_removed(self):
+		self._write("G1 X1\nG1 X2\n")
+		job = CompiledGcodeJob(self.path)
+		self.assertEqual(job.get(1)[0], "G1X2")
+		self.assertEqual(os.listdir(self._dir), ["job.gco"])
+		job.release()
+
+	def test_release(self):
+		count = CompiledGcodeJob.CHUNK_SIZE * 200
+		self._write("G1 X1\n" * count)
+		job = CompiledGcodeJob(self.path)
+		job.release()
+		self.assertTrue(job.is_done())
+		self.assertLess(job.get_count(), count)
+		self.assertRaises(ValueError, job.get, 0)
+
+	def test_resume_state(self):
+		content = "G90\nM3S0\nG0X10Y20\nG1X11S300F1000\nG1X12\nG4P0.1\nG1Y21S400\nM5\n"
+		self._write(content)
+		for chunk_size in (1, 2, 3, 1024):
+			with mock.patch.object(CompiledGcodeJob, 'CHUNK_SIZE', chunk_size):
+				job = CompiledGcodeJob(self.path)
+				self.assertEqual(job.get_resume_commands(0), ["M5"])
+				self.assertEqual(job.get_resume_commands(2), ["M5", "M3S0"])
+				self.assertEqual(job.get_resume_commands(6), ["M5", "G90", "G0X12Y20", "F1000", "M3S300"])
+				self.assertEqual(job.get_resume_commands(8), ["M5", "G90", "G0X12Y21", "F1000", "S400"])
+				self.assertEqual(job.get_resume_commands(3), ["M5", "G90", "G0X10Y20", "M3S0"])
+				job.release()
+
+	def test_resume_relative(self):
+		self._write("G90\nG0X10Y20\nG91\nG1X1.5F1000\nG1Y-2\nG1X0.25Y0.5\nG90\nG1X5\n")
+		for chunk_size in (2, 1024):
+			with mock.patch.object(CompiledGcodeJob, 'CHUNK_SIZE', chunk_size):
+				job = CompiledGcodeJob(self.path)
+				self.assertEqual(job.get_resume_commands(3), ["M5", "G90", "G0X10Y20", "G91"])
+				self.assertEqual(job.get_resume_commands(5), ["M5", "G90", "G0X11.5Y18", "G91", "F1000"])
+				self.assertEqual(job.get_resume_commands(7), ["M5", "G90", "G0X11.75Y18.5", "F1000"])
+				self.assertEqual(job.get_resume_commands(8), ["M5", "G90", "G0X5Y18.5", "F1000"])
+				job.release()
+
+	def test_seek(self):
+		content = "G90\nM3S0\nG0X10Y20\nG1X11S300F1000\nG1X12\nG1Y21S400\nM5\n"
+		self._write(content)
+		file_info = PrintingGcodeFileInformation(self.path)
+		file_info.start()
+		resume_commands = file_info.seek(content.index("G1Y21"))
+		self.assertEqual(resume_commands, ["M5", "G90", "G0X12Y20", "F1000", "M3S300"])
+		self.assertEqual(self._read_all(file_info), ["G1Y21S400", "M5"])
+
+	def test_seek_reported_position(self):
+		self._write("; header\n" + "".join("G1 X{}\n\n; comment {}\n".format(i, i) for i in range(20)))
+		for chunk_size in (3, 1024):
+			with mock.patch.object(CompiledGcodeJob, 'CHUNK_SIZE', chunk_size):
+				file_info = PrintingGcodeFileInformation(self.path)
+				file_info.start()
+				for i in range(12):
+					file_info.getNext()
+				pos = file_info.getFilepos()
+				self.assertEqual(file_info.seek(pos), ["M5", "G90", "G0X11"])
+				self.assertEqual(file_info.getNext(), "G1X12")
+				file_info.release()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint_mrbeam.gcodegenerator.conversion_cache import ConversionCache
+
+
+class ConversionCacheTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.cache = ConversionCache(os.path.join(self._dir, "cache"))
+		self.svg = self._write("design.svg", "<svg/>")
+		self.params = {'directory': '/tmp', 'file': 'a.gco', 'vector': [{'color': '#000000', 'intensity': 10}]}
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def _write(self, name, content):
+		path = os.path.join(self._dir, name)
+		with open(path, 'w') as fh:
+			fh.write(content)
+		return path
+
+	def _read(self, path):
+		with open(path, 'r') as fh:
+			return fh.read()
+
+	def test_key(self):
+		key = self.cache.get_key(self.svg, self.params, version="0.1.0")
+		other_file = dict(self.params, directory='/home', file='b.gco')
+		self.assertEqual(key, self.cache.get_key(self.svg, other_file, version="0.1.0"))
+		self.assertNotEqual(key, self.cache.get_key(self.svg, self.params, version="0.1.1"))
+		self.assertNotEqual(key, self.cache.get_key(self.svg, dict(self.params, vector=[]), version="0.1.0"))
+		self.assertNotEqual(key, self.cache.get_key(self._write("other.svg", "<svg></svg>"), self.params, version="0.1.0"))
+
+	def test_hit_and_miss(self):
+		key = self.cache.get_key(self.svg, self.params)
+		destination = os.path.join(self._dir, "out.gco")
+		self.assertFalse(self.cache.get(key, destination))
+		self.cache.put(key, self._write("converted.gco", "G0 X1\n"))
+		self.assertTrue(self.cache.get(key, destination))
+		self.assertEqual(self._read(destination), "G0 X1\n")
+		stats = self.cache.get_stats()
+		self.assertEqual((stats['hits'], stats['misses'], stats['stores'], stats['entries']), (1, 1, 1, 1))
+
+	def test_lru_eviction(self):
+		for i, key in enumerate(['a', 'b', 'c']):
+			self.cache.put(key, self._write(key + ".gco", "x" * 10))
+			os.utime(self.cache._get_path(key), (1000 + i, 1000 + i))
+		# 'a' was used recently, so 'b' is the least recently used entry
+		os.utime(self.cache._get_path('a'), (2000, 2000))
+		self.cache.max_size = 25
+		self.cache.evict()
+		self.assertFalse(os.path.exists(self.cache._get_path('b')))
+		self.assertTrue(os.path.exists(self.cache._get_path('a')))
+		self.assertTrue(os.path.exists(self.cache._get_path('c')))
+		self.assertEqual(self.cache.get_size(), 20)
+
+	def test_min_free_space(self):
+		self.cache.put('a', self._write("a.gco", "x"))
+		self.cache.min_free_space = float('inf')
+		self.cache.evict()
+		self.assertEqual(self.cache.get_stats()['entries'], 0)
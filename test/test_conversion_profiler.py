@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint_mrbeam.gcodegenerator.conversion_profiler import ConversionProfiler
+
+
+class ConversionProfilerTestCase(unittest.TestCase):
+
+	def test_stages(self):
+		profiler = ConversionProfiler()
+		for _ in range(3):
+			with profiler.stage('biarc'):
+				pass
+		profiler.merge(dict(raster_dither=dict(time=1.5, count=2)))
+		profiler.merge(dict(raster_dither=dict(time=0.5, count=1)))
+		stages = profiler.get_data()['stages']
+		self.assertEqual(list(stages.keys()), ['biarc', 'raster_dither'])
+		self.assertEqual(stages['biarc']['count'], 3)
+		self.assertEqual(stages['raster_dither'], dict(time=2.0, count=3))
+
+	def test_memory(self):
+		profiler = ConversionProfiler()
+		with profiler.stage('parse'):
+			profiler.track_memory(100)
+			with profiler.stage('transform'):
+				profiler.track_memory(300)
+			profiler.track_memory(200)
+		self.assertEqual(profiler.memory, dict(peak=300, peak_stage='transform'))
+
+	def test_write(self):
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "out.gco.profile.json")
+			profiler = ConversionProfiler()
+			profiler.add('export', 0.25)
+			profiler.write(path)
+			with open(path, 'r') as fh:
+				data = json.load(fh)
+			self.assertEqual(data['stages']['export'], dict(time=0.25, count=1))
+		finally:
+			shutil.rmtree(directory)
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from octoprint_mrbeam.conversion_queue import ConversionQueue, ConversionJob
+
+
+class ConversionQueueTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.queue = ConversionQueue()
+		self.order = []
+		# the first job blocks the worker until released, so the following ones pile up in the queue
+		self.release = threading.Event()
+
+	def tearDown(self):
+		self.release.set()
+		self.queue.shutdown()
+
+	def _blocking_job(self, job):
+		self.order.append(job.name)
+		while not self.release.wait(0.01):
+			if job.is_cancelled():
+				return
+
+	def _submit_blocker(self, name):
+		job = self.queue.submit(self._blocking_job, name=name)
+		for _ in range(500):
+			if job.state == ConversionJob.STATE_RUNNING:
+				break
+			time.sleep(0.01)
+		return job
+
+	def _job(self, job):
+		self.order.append(job.name)
+
+	def test_priorities(self):
+		blocker = self._submit_blocker('blocker')
+		low = self.queue.submit(self._job, priority=0, name='low')
+		high = self.queue.submit(self._job, priority=5, name='high')
+		low_2 = self.queue.submit(self._job, priority=0, name='low_2')
+		self.assertEqual(self.queue.get_depth(), 3)
+		self.release.set()
+		for job in (blocker, low, high, low_2):
+			self.assertTrue(job.wait(5))
+		self.assertEqual(self.order, ['blocker', 'high', 'low', 'low_2'])
+		stats = self.queue.get_stats()
+		self.assertEqual((stats['submitted'], stats['done'], stats['max_depth'], stats['depth']), (4, 4, 3, 0))
+		self.assertGreater(stats['wait_time_max'], 0)
+
+	def test_supersede(self):
+		running = self._submit_blocker('running')
+		queued = self.queue.submit(self._job, name='queued')
+		corrected = self.queue.submit(self._job, name='corrected', supersede=True)
+		self.assertTrue(corrected.wait(5))
+		self.assertTrue(running.token.is_cancelled())
+		self.assertEqual(running.state, ConversionJob.STATE_CANCELLED)
+		self.assertEqual(queued.state, ConversionJob.STATE_CANCELLED)
+		self.assertEqual(corrected.state, ConversionJob.STATE_DONE)
+		self.assertEqual(self.order, ['running', 'corrected'])
+
+	def test_cancel_and_failure(self):
+		blocker = self._submit_blocker('blocker')
+		failing = self.queue.submit(lambda job: 1 / 0, name='failing')
+		self.assertTrue(self.queue.cancel(blocker.id))
+		self.assertFalse(self.queue.cancel('unknown'))
+		self.assertTrue(failing.wait(5))
+		self.assertEqual(failing.state, ConversionJob.STATE_FAILED)
+		self.assertEqual(self.queue.get_job(blocker.id).state, ConversionJob.STATE_CANCELLED)
+		self.assertEqual(self.queue.get_stats()['failed'], 1)
+
+	def test_on_done(self):
+		done = []
+		event = threading.Event()
+
+		def on_done(job):
+			done.append((job.name, job.state))
+			if len(done) == 2:
+				event.set()
+
+		blocker = self.queue.submit(self._blocking_job, name='blocker', on_done=on_done)
+		queued = self.queue.submit(self._job, name='queued', on_done=on_done)
+		self.queue.cancel(queued.id)
+		self.release.set()
+		self.assertTrue(event.wait(5))
+		self.assertEqual(sorted(done), [('blocker', ConversionJob.STATE_DONE), ('queued', ConversionJob.STATE_CANCELLED)])
+		self.assertNotIn('queued', self.order)
+
+	def test_attach(self):
+		job = ConversionJob(self._job, name='attached')
+		self.assertTrue(job.attach())
+		self.assertTrue(job.wait_attached(0))
+		self.assertTrue(job.is_active())
+
+	def test_not_attached(self):
+		# the queue worker waits for the converting thread, which never comes
+		job = self.queue.submit(lambda job: job.wait_attached(0.05) and job.wait(5), name='lost')
+		self.assertTrue(job.wait(5))
+		self.assertEqual(job.state, ConversionJob.STATE_FAILED)
+		self.assertIn("not started", job.error)
+		self.assertFalse(job.attach())
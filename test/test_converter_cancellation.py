@@ -0,0 +1,106 @@
+import __builtin__
+import base64
+import cStringIO
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+import unittest
+
+import mock
+from PIL import Image
+
+from octoprint_mrbeam.conversion_queue import ConversionQueue, ConversionJob
+from octoprint_mrbeam.gcodegenerator.converter import Converter
+
+
+class Cancelled(Exception):
+	pass
+
+
+class ConverterCancellationTestCase(unittest.TestCase):
+
+	PATHS = 20
+	RASTER = dict(intensity_black=500, intensity_white=0, intensity_black_user=50, intensity_white_user=0, speed_black=500, speed_white=3000,
+	              contrast=1.0, sharpening=1.0, dithering=False, beam_diameter=0.1, pierce_time=0, engraving_mode='basic')
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		plugin_mock._settings.get.return_value = False
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self._dir = tempfile.mkdtemp()
+		self.queue = ConversionQueue()
+
+	def tearDown(self):
+		self.queue.shutdown()
+		self._plugin_patcher.stop()
+		shutil.rmtree(self._dir)
+
+	def _get_svg(self):
+		img = Image.new('L', (100, 100), 'white')
+		pix = img.load()
+		for y in range(100):
+			for x in range(100):
+				pix[x, y] = (x * 2 + y) % 200
+		buf = cStringIO.StringIO()
+		img.save(buf, 'PNG')
+		paths = "".join('<path stroke="#000000" d="M{0},0 L{0},50"/>'.format(i) for i in range(self.PATHS))
+		return """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="100mm" height="100mm" viewBox="0 0 100 100">
+			{}<image x="50" y="50" width="10" height="10" xlink:href="data:image/png;base64,{}"/></svg>""".format(paths, base64.b64encode(buf.getvalue()))
+
+	def _run(self, cancel_after):
+		"""
+		Converts the svg in the conversion queue and cancels the job through the queue after cancel_after token checks.
+		:returns: the job, names of the functions the cancellation was raised through, number of checks
+		"""
+		svg = os.path.join(self._dir, "test.svg")
+		with open(svg, 'w') as fh:
+			fh.write(self._get_svg())
+		params = {'directory': self._dir + "/", 'file': "test.gco", 'noheaders': "true", 'engrave': True, 'raster': self.RASTER,
+		          'vector': [{'color': '#000000', 'intensity': 10, 'feedrate': 1000, 'passes': 1, 'pierce_time': 0}]}
+		result = dict(checks=0, stack=[])
+
+		def run(job):
+			def is_job_cancelled():
+				result['checks'] += 1
+				if result['checks'] == cancel_after:
+					self.queue.cancel(job.id)
+				if job.is_cancelled():
+					raise Cancelled()
+
+			converter = Converter(params, svg, workingAreaWidth=500, workingAreaHeight=390)
+			converter._tempfile = os.path.join(self._dir, "out.tmp")
+			try:
+				converter.convert(is_job_cancelled)
+			except Cancelled:
+				result['stack'] = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+
+		job = self.queue.submit(run, name='test')
+		self.assertTrue(job.wait(30))
+		return job, result['stack'], result['checks']
+
+	def test_full_conversion(self):
+		job, stack, checks = self._run(cancel_after=0)
+		self.assertEqual(job.state, ConversionJob.STATE_DONE)
+		self.assertTrue(os.path.exists(os.path.join(self._dir, "test.gco")))
+		# after parsing, every image row and every path
+		self.assertGreater(checks, self.PATHS + 50)
+
+	def test_cancel_in_image_rows(self):
+		# images are converted first
+		job, stack, checks = self._run(cancel_after=5)
+		self.assertEqual(job.state, ConversionJob.STATE_CANCELLED)
+		self.assertEqual(checks, 5)
+		self.assertEqual(stack[-2:], ['_check_cancelled', 'is_job_cancelled'])
+		self.assertFalse(os.path.exists(os.path.join(self._dir, "test.gco")))
+
+	def test_cancel_in_path_loop(self):
+		_, _, checks = self._run(cancel_after=0)
+		os.remove(os.path.join(self._dir, "test.gco"))
+
+		job, stack, _ = self._run(cancel_after=checks - self.PATHS / 2)
+		self.assertEqual(job.state, ConversionJob.STATE_CANCELLED)
+		self.assertEqual(stack[-2:], ['_convert', 'is_job_cancelled'])
+		self.assertFalse(os.path.exists(os.path.join(self._dir, "test.gco")))
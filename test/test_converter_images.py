@@ -0,0 +1,138 @@
+import __builtin__
+import base64
+import cStringIO
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import mock
+from PIL import Image
+
+from octoprint_mrbeam.gcodegenerator.converter import Converter, UnknownImageException
+from octoprint_mrbeam.gcodegenerator.fragment_cache import FragmentCache
+from octoprint_mrbeam.gcodegenerator.gcode_writer import GcodeWriter
+from octoprint_mrbeam.gcodegenerator.image_store import ImageStore
+
+
+PARAMS = dict(workingAreaWidth=500, workingAreaHeight=390, beam_diameter=0.1,
+              intensity_black=1000, intensity_white=0, speed_black=500, speed_white=3000)
+
+
+class ConverterImagesTestCase(unittest.TestCase):
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		plugin_mock._settings.get.return_value = False
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self._dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+		shutil.rmtree(self._dir)
+
+	def _get_data_url(self, w, h, seed):
+		img = Image.new('L', (w, h), 'white')
+		pix = img.load()
+		for y in range(h):
+			for x in range(w):
+				if (x + y + seed) % 5:
+					pix[x, y] = (x * 255 // w + seed * 40) % 256
+		buf = cStringIO.StringIO()
+		img.save(buf, 'PNG')
+		return "data:image/png;base64," + base64.b64encode(buf.getvalue())
+
+	def _get_image_jobs(self):
+		# largest image first, so the pool finishes the images out of order
+		jobs = []
+		for i, (w, h) in enumerate([(240, 160), (30, 20), (80, 60), (10, 40), (50, 50)]):
+			jobs.append(dict(params=dict(PARAMS), data=self._get_data_url(w, h, i), path=None, image_id=None,
+			                 w=w * 0.1, h=h * 0.1, x=10.0 * i, y=20.0, file_id="image_{}".format(i)))
+		return jobs
+
+	def _convert(self, image_jobs, workers, fragment_cache=None):
+		converter = Converter({}, None, workers=workers, fragment_cache=fragment_cache)
+		converter._tempfile = os.path.join(self._dir, "out.tmp")
+		converter._is_job_cancelled = lambda: None
+		writer = GcodeWriter()
+		progress = sum(1 for _ in converter._convert_images(image_jobs, writer))
+		self.assertEqual(progress, len(image_jobs))
+		self.assertEqual(os.listdir(self._dir), ['fragments'] if fragment_cache is not None else [])
+		return writer.getvalue()
+
+	def _get_image_positions(self, gcode):
+		return re.findall(r"^; Image: \S+ @ ([\d.]+),", gcode, re.MULTILINE)
+
+	def test_parallel_matches_serial(self):
+		image_jobs = self._get_image_jobs()
+		serial = self._convert(image_jobs, 1)
+		self.assertEqual(self._get_image_positions(serial), ["{:.2f}".format(j['x']) for j in image_jobs])
+		for workers in (2, 3, 8):
+			self.assertEqual(self._convert(image_jobs, workers), serial)
+
+	def test_parallel_cached_matches_serial(self):
+		image_jobs = self._get_image_jobs()
+		serial = self._convert(image_jobs, 1)
+		cache = FragmentCache(os.path.join(self._dir, "fragments"))
+		self.assertEqual(self._convert(image_jobs, 3, fragment_cache=cache), serial)
+		# second run: all fragments from the cache
+		self.assertEqual(self._convert(image_jobs, 3, fragment_cache=cache), serial)
+		self.assertEqual(cache.hits, len(image_jobs))
+
+	def test_copy_from(self):
+		writer = GcodeWriter(buffer_size=1024)
+		writer.write_line("G0X0Y0")
+		source = "".join("G1X{}Y{}\n".format(i, i) for i in range(100))
+		writer.copy_from(cStringIO.StringIO(source), block_size=7)
+		writer.write_line("M5")
+		stats = writer.get_stats()
+		gcode = writer.getvalue()
+		self.assertEqual(gcode, "G0X0Y0\n" + source + "M5\n")
+		self.assertEqual(stats['bytes'], len(gcode))
+		self.assertEqual(stats['lines'], 102)
+
+
+class ConverterImageStoreTestCase(unittest.TestCase):
+
+	SVG = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:mb="http://www.mr-beam.org/mbns" width="100mm" height="100mm" viewBox="0 0 100 100">
+	<path stroke="#000000" d="M0,0 L10,10"/>
+	<image x="20" y="20" width="10" height="10" mb:image_id="{}"/>
+</svg>"""
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		plugin_mock._settings.get.return_value = False
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self._dir = tempfile.mkdtemp()
+		self.store = ImageStore(os.path.join(self._dir, "images"))
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+		shutil.rmtree(self._dir)
+
+	def _convert(self, image_id):
+		svg = os.path.join(self._dir, "test.svg")
+		with open(svg, 'w') as fh:
+			fh.write(self.SVG.format(image_id))
+		params = {'directory': self._dir + "/", 'file': "test.gco", 'noheaders': "true", 'engrave': True,
+		          'vector': [{'color': '#000000', 'intensity': 10, 'feedrate': 1000, 'passes': 1, 'pierce_time': 0}],
+		          'raster': dict(PARAMS, intensity_black_user=50, intensity_white_user=0, contrast=1.0, sharpening=1.0,
+		                         dithering=False, pierce_time=0, engraving_mode='basic')}
+		converter = Converter(params, svg, workingAreaWidth=500, workingAreaHeight=390, image_store=self.store)
+		converter._tempfile = os.path.join(self._dir, "out.tmp")
+		converter.convert(None)
+		with open(os.path.join(self._dir, "test.gco"), 'r') as fh:
+			return fh.read()
+
+	def test_stored_image(self):
+		buf = cStringIO.StringIO()
+		Image.new('L', (20, 20), 0).save(buf, 'PNG')
+		gcode = self._convert(self.store.add_data(buf.getvalue()))
+		self.assertIn("; Image: 10.00x10.00 @ 20.00,", gcode)
+
+	def test_unknown_image_id(self):
+		with self.assertRaises(UnknownImageException):
+			self._convert("0" * 64)
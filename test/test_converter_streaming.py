@@ -0,0 +1,68 @@
+import __builtin__
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from octoprint_mrbeam.gcodegenerator.converter import Converter, SpooledDataUrl
+
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="100mm" height="100mm" viewBox="0 0 100 100">
+	<metadata><description>lots of metadata</description></metadata>
+	<g transform="translate(10,0)">
+		<path id="p1" stroke="#000000" d="M0,0 L10,10"/>
+		<image id="i1" x="0" y="0" width="10" height="10" xlink:href="data:image/png;base64,aGVsbG8="/>
+	</g>
+	<image id="i2" x="0" y="0" width="10" height="10" href="http://localhost/image.png"/>
+</svg>"""
+
+
+class ConverterStreamingParseTestCase(unittest.TestCase):
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self._dir = tempfile.mkdtemp()
+		self._svg = os.path.join(self._dir, "test.svg")
+		with open(self._svg, 'w') as fh:
+			fh.write(SVG)
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+		shutil.rmtree(self._dir)
+
+	def _get_converter(self, streaming):
+		params = {'vector': [{'color': '#000000', 'intensity': 10, 'feedrate': 1000, 'passes': 1, 'pierce_time': 0}]}
+		converter = Converter(params, self._svg, streaming=streaming)
+		converter._tempfile = os.path.join(self._dir, "out.tmp")
+		converter.parse()
+		converter.collect_paths()
+		return converter
+
+	def test_streaming_collects_same_elements(self):
+		default = self._get_converter(False)
+		streaming = self._get_converter(True)
+		for attr in ('paths', 'images'):
+			self.assertEqual([[e.get('id') for e in v] for v in getattr(default, attr).values()],
+			                 [[e.get('id') for e in v] for v in getattr(streaming, attr).values()])
+
+	def test_image_data_is_spooled(self):
+		converter = self._get_converter(True)
+		self.assertEqual(len(converter._image_data), 1)
+		node, data = converter._image_data.items()[0]
+		self.assertEqual(node.get('id'), 'i1')
+		self.assertIsNone(node.get('{http://www.w3.org/1999/xlink}href'))
+		self.assertTrue(data.startswith("data:"))
+		self.assertEqual(data.read(), "data:image/png;base64,aGVsbG8=")
+		data.remove()
+		self.assertFalse(os.path.exists(data.path))
+
+	def test_spooled_data_url(self):
+		data = SpooledDataUrl("data:image/png;base64,AAAA", self._dir)
+		self.assertEqual(data.prefix, "data:image/png;base64,")
+		self.assertEqual(data.length, 26)
+		self.assertFalse(data.startswith("http://"))
+		data.remove()
@@ -0,0 +1,142 @@
+import __builtin__
+import copy
+import unittest
+
+import mock
+import numpy
+from lxml import etree
+
+from octoprint_mrbeam.gcodegenerator import cubicsuperpath, simpletransform
+from octoprint_mrbeam.gcodegenerator.converter import Converter
+
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="100mm" viewBox="0 0 100 100">
+	<g id="g1" transform="translate(10,5) rotate(30)">
+		<g id="g2" transform="scale(2,0.5)">
+			<path id="p1" stroke="#000000" transform="matrix(0.9,0.1,-0.3,1.2,4,-7)" d="M0,0 C10,0 10,10 0,10 L-5,3 M20,20 L30,25 Q35,40 20,30 Z"/>
+		</g>
+	</g>
+</svg>"""
+
+# layer matrix with shear and offset, [[a,b,c],[d,e,f],[0,0,1]]
+LAYER_MATRIX = [[0.5, 0.1, 3.0], [-0.2, 0.7, -4.0], [0.0, 0.0, 1.0]]
+
+
+class ConverterTransformCspTestCase(unittest.TestCase):
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self.converter = Converter({}, None)
+		self.converter.document = etree.ElementTree(etree.fromstring(SVG))
+		self.root = self.converter.document.getroot()
+		self.converter.layers = [self.root]
+		self.converter.transform_matrix[self.root] = LAYER_MATRIX
+		self.converter.transform_matrix_reverse[self.root] = numpy.linalg.inv(LAYER_MATRIX).tolist()
+		self.path = self.root.find('.//{http://www.w3.org/2000/svg}path')
+		self.csp = cubicsuperpath.parsePath(self.path.get('d'))
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+
+	def _transform_csp_per_point(self, csp_, layer, reverse=False, transform=None):
+		# the implementation before the points were transformed in one matrix multiplication
+		csp_ = copy.deepcopy(csp_)
+		if transform is not None:
+			simpletransform.applyTransformToPath(transform, csp_)
+		csp = [[[csp_[i][j][0][:], csp_[i][j][1][:], csp_[i][j][2][:]] for j in range(len(csp_[i]))] for i in range(len(csp_))]
+		for i in xrange(len(csp)):
+			for j in xrange(len(csp[i])):
+				for k in xrange(len(csp[i][j])):
+					csp[i][j][k] = self.converter._transform(csp[i][j][k], layer, reverse)
+		return csp
+
+	def _assert_csp_equal(self, expected, actual):
+		self.assertEqual([len(sp) for sp in expected], [len(sp) for sp in actual])
+		numpy.testing.assert_allclose(numpy.array([pt for sp in actual for node in sp for pt in node]),
+		                              numpy.array([pt for sp in expected for node in sp for pt in node]), rtol=1e-12, atol=1e-9)
+
+	def test_layer_transform(self):
+		self._assert_csp_equal(self._transform_csp_per_point(self.csp, self.root),
+		                       self.converter._transform_csp(self.csp, self.root))
+
+	def test_layer_transform_reverse(self):
+		self._assert_csp_equal(self._transform_csp_per_point(self.csp, self.root, reverse=True),
+		                       self.converter._transform_csp(self.csp, self.root, reverse=True))
+
+	def test_nested_svg_transform(self):
+		transform = self.converter._get_svg_transforms(self.path)
+		self.assertIsNotNone(transform)
+		for reverse in (False, True):
+			self._assert_csp_equal(self._transform_csp_per_point(self.csp, self.root, reverse=reverse, transform=transform),
+			                       self.converter._transform_csp(self.csp, self.root, reverse=reverse, transform=transform))
+
+	def test_input_unchanged(self):
+		before = copy.deepcopy(self.csp)
+		self.converter._transform_csp(self.csp, self.root, transform=self.converter._get_svg_transforms(self.path))
+		self.assertEqual(before, self.csp)
+
+
+class ConverterTransformCacheTestCase(unittest.TestCase):
+
+	SVG = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="100mm" height="100mm" viewBox="0 0 100 100">
+	<g id="g1" transform="translate(10,5) rotate(30)">
+		<g id="g2" transform="scale(2,0.5)">
+			<path id="p1" stroke="#000000" transform="matrix(0.9,0.1,-0.3,1.2,4,-7)" d="M0,0 C10,0 10,10 0,10 L-5,3"/>
+			<path id="p2" stroke="#000000" d="M1,1 L5,9"/>
+			<image id="i1" x="0" y="0" width="10" height="10" transform="skewX(15)" xlink:href="data:image/png;base64,aGVsbG8="/>
+		</g>
+		<g id="g3">
+			<path id="p3" stroke="#000000" transform="translate(-3,2)" d="M2,2 L8,1 L4,4 Z"/>
+		</g>
+	</g>
+	<path id="p4" stroke="#000000" transform="rotate(-10,50,50)" d="M60,60 L70,70"/>
+</svg>"""
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+
+	def _get_converter(self):
+		params = {'vector': [{'color': '#000000', 'intensity': 10, 'feedrate': 1000, 'passes': 1, 'pierce_time': 0}]}
+		converter = Converter(params, None)
+		converter.document = etree.ElementTree(etree.fromstring(self.SVG))
+		return converter
+
+	def _get_elements(self, converter):
+		return dict((e.get('id'), e) for e in converter.document.getroot().iter() if e.get('id'))
+
+	def test_cached_transforms_match_uncached(self):
+		cached = self._get_converter()
+		cached.collect_paths()
+		self.assertEqual(len(cached.paths.values()[0]), 4)
+
+		# the former way: fuse with a freshly parsed transform, walk up to the root for every lookup
+		uncached = self._get_converter()
+		for e in uncached.document.getroot().iter('{http://www.w3.org/2000/svg}path'):
+			simpletransform.fuseTransform(e)
+
+		cached_elements = self._get_elements(cached)
+		uncached_elements = self._get_elements(uncached)
+		self.assertEqual(sorted(cached_elements), ['g1', 'g2', 'g3', 'i1', 'p1', 'p2', 'p3', 'p4'])
+		for id, e in cached_elements.items():
+			self.assertIn(e, cached._transforms, id)
+			self.assertEqual(e.get('d'), uncached_elements[id].get('d'), id)
+			self.assertEqual(e.get('transform'), uncached_elements[id].get('transform'), id)
+			numpy.testing.assert_allclose(cached._get_transforms(e), uncached._get_transforms(uncached_elements[id]), rtol=1e-12, atol=1e-12, err_msg=id)
+
+	def test_fuse_transform_with_parsed_matrix(self):
+		t = "translate(10,5) rotate(30) scale(2,0.5)"
+		d = "M0,0 C10,0 10,10 0,10 L-5,3 Z"
+		old = etree.Element('path', d=d, transform=t)
+		new = etree.Element('path', d=d, transform=t)
+		simpletransform.fuseTransform(old)
+		simpletransform.fuseTransform(new, simpletransform.parseTransform(t))
+		self.assertIsNone(new.get('transform'))
+		self.assertEqual(old.get('d'), new.get('d'))
+		self.assertNotEqual(new.get('d'), d)
@@ -0,0 +1,48 @@
+import math
+import unittest
+
+from octoprint_mrbeam.gcodegenerator import curve_simplification
+
+
+class CurveSimplificationTestCase(unittest.TestCase):
+
+	def _polyline(self, points):
+		curve = [[points[0], 'move', 0, 0]]
+		for p in points[:-1]:
+			curve.append([p, 'line', 0, 0])
+		curve.append([points[-1], 'end', 0, 0])
+		return curve
+
+	def test_collinear_lines_are_merged(self):
+		curve = self._polyline([[0.0, 0.0], [1.0, 0.0], [2.0, 0.005], [3.0, 0.0], [3.0, 4.0]])
+		result, stats = curve_simplification.simplify_curve(curve, 0.01)
+		self.assertEqual(stats['segments_before'], 4)
+		self.assertEqual(stats['segments_after'], 2)
+		self.assertEqual([e[0] for e in result], [[0.0, 0.0], [0.0, 0.0], [3.0, 0.0], [3.0, 4.0]])
+		self.assertAlmostEqual(stats['length_after'], 7.0)
+
+	def test_deviation_above_tolerance_is_kept(self):
+		curve = self._polyline([[0.0, 0.0], [1.0, 0.5], [2.0, 0.0]])
+		result, stats = curve_simplification.simplify_curve(curve, 0.1)
+		self.assertEqual(stats['segments_after'], 2)
+		self.assertEqual([e[0] for e in result], [e[0] for e in curve])
+
+	def test_cocircular_arcs_are_merged(self):
+		r = 10.0
+		points = [[r * math.cos(a), r * math.sin(a)] for a in (0, math.pi / 4, math.pi / 2)]
+		curve = [[points[0], 'move', 0, 0],
+		         [points[0], 'arc', [0.0, 0.0], math.pi / 4],
+		         [points[1], 'arc', [0.0, 0.0], math.pi / 4],
+		         [points[2], 'end', 0, 0]]
+		result, stats = curve_simplification.simplify_curve(curve, 0.01)
+		self.assertEqual(stats['segments_after'], 1)
+		self.assertAlmostEqual(result[1][3], math.pi / 2)
+		self.assertAlmostEqual(stats['length_before'], stats['length_after'])
+
+	def test_opposite_arcs_are_not_merged(self):
+		curve = [[[10.0, 0.0], 'move', 0, 0],
+		         [[10.0, 0.0], 'arc', [0.0, 0.0], math.pi / 4],
+		         [[10 * math.cos(math.pi / 4), 10 * math.sin(math.pi / 4)], 'arc', [0.0, 0.0], -math.pi / 4],
+		         [[10.0, 0.0], 'end', 0, 0]]
+		result, stats = curve_simplification.simplify_curve(curve, 0.01)
+		self.assertEqual(stats['segments_after'], 2)
@@ -0,0 +1,90 @@
+import __builtin__
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from lxml import etree
+
+from octoprint_mrbeam.gcodegenerator.converter import Converter
+from octoprint_mrbeam.gcodegenerator.fragment_cache import FragmentCache
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.cache = FragmentCache(os.path.join(self._dir, "fragments"), namespace="0.1.0")
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def test_key(self):
+		key = self.cache.get_fragment_key('path', "M0 0 L1 1", [[1, 0, 0], [0, 1, 0]], {'intensity': 10})
+		self.assertEqual(key, self.cache.get_fragment_key('path', "M0 0 L1 1", [[1, 0, 0], [0, 1, 0]], {'intensity': 10}))
+		self.assertNotEqual(key, self.cache.get_fragment_key('path', "M0 0 L1 1", [[1, 0, 5], [0, 1, 0]], {'intensity': 10}))
+		self.assertNotEqual(key, self.cache.get_fragment_key('path', "M0 0 L1 1", [[1, 0, 0], [0, 1, 0]], {'intensity': 20}))
+		other_version = FragmentCache(self.cache.directory, namespace="0.1.1")
+		self.assertNotEqual(key, other_version.get_fragment_key('path', "M0 0 L1 1", [[1, 0, 0], [0, 1, 0]], {'intensity': 10}))
+
+	def test_vector_fragment(self):
+		self.assertIsNone(self.cache.load('a'))
+		fragment = dict(result=("G1 X1\n", [0, 0], [1, 1], (0, 0, 1, 1)), travel_stats=dict(subpaths=1))
+		self.cache.store('a', fragment)
+		self.assertEqual(self.cache.load('a'), fragment)
+		self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+	def test_raster_fragment(self):
+		self.assertIsNone(self.cache.get_file('img'))
+		source = os.path.join(self._dir, "chunk.gco")
+		with open(source, 'w') as fh:
+			fh.write("; Image\nG1 X1 S100\n")
+		self.cache.put_file('img', source)
+		with open(self.cache.get_file('img'), 'r') as fh:
+			self.assertEqual(fh.read(), "; Image\nG1 X1 S100\n")
+
+	def test_entries_are_only_evicted_on_demand(self):
+		self.cache.max_size = 1
+		self.cache.store('a', dict(result="G0 X1"))
+		self.assertIsNotNone(self.cache.load('a'))
+		self.cache.evict()
+		self.assertIsNone(self.cache.load('a'))
+
+
+class ConverterPathFragmentTestCase(unittest.TestCase):
+
+	SVG = """<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="100mm" viewBox="0 0 100 100">
+	<path id="p1" stroke="#000000" d="M0,0 L1,1 M50,50 L51,50 M2,2 L3,2 M48,49 L47,47 M10,80 L12,81"/>
+</svg>"""
+	SETTINGS = {'intensity': 500, 'feedrate': 1000, 'passes': 1, 'pierce_time': 0}
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+		self._dir = tempfile.mkdtemp()
+		self.cache = FragmentCache(os.path.join(self._dir, "fragments"))
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+		shutil.rmtree(self._dir)
+
+	def _get_path_gcode(self, **kwargs):
+		converter = Converter({}, None, fragment_cache=self.cache, **kwargs)
+		converter.document = etree.ElementTree(etree.fromstring(self.SVG))
+		root = converter.document.getroot()
+		converter.layers = [root]
+		converter.transform_matrix[root] = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+		converter.transform_matrix_reverse[root] = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+		path = root.find('{http://www.w3.org/2000/svg}path')
+		gcode = converter._get_path_gcode(path, root, '#000000', self.SETTINGS)[0]
+		return gcode, converter._fragment_stats['paths_reused']
+
+	def test_options_are_part_of_the_key(self):
+		gcode, reused = self._get_path_gcode()
+		self.assertEqual(reused, 0)
+		self.assertEqual(self._get_path_gcode(), (gcode, 1))
+		for kwargs in (dict(two_opt=True), dict(simplify_tolerance=0.1)):
+			self.assertEqual(self._get_path_gcode(**kwargs)[1], 0, kwargs)
+			self.assertEqual(self._get_path_gcode(**kwargs)[1], 1, kwargs)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint_mrbeam.comm_acc2 import PrintingGcodeFileInformation, GcodePrefetcher
+
+
+class GcodePrefetcherTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.path = os.path.join(self._dir, "job.gco")
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def _write(self, content):
+		with open(self.path, 'w') as fh:
+			fh.write(content)
+
+	def _read_all(self, file_info):
+		lines = []
+		line = file_info.getNext()
+		while line is not None:
+			lines.append(line)
+			line = file_info.getNext()
+		return lines
+
+	def test_get_next(self):
+		self._write("; header\nG0 X1 Y2\n\nG1X3 ; comment\n;footer\n")
+		file_info = PrintingGcodeFileInformation(self.path)
+		file_info.start()
+		self.assertEqual(file_info.getNext(), "G0X1Y2")
+		self.assertEqual(file_info.getFilepos(), len("G0 X1 Y2\n"))
+		self.assertEqual(file_info.getNext(), "G1X3")
+		self.assertIsNone(file_info.getNext())
+		self.assertEqual(file_info.getProgress(), 1.0)
+		with self.assertRaises(ValueError):
+			file_info.getNext()
+
+		file_info.resetToBeginning()
+		self.assertEqual(file_info.getProgress(), 0.0)
+		self.assertEqual(self._read_all(file_info), ["G0X1Y2", "G1X3"])
+
+	def test_chunks(self):
+		count = GcodePrefetcher.CHUNK_SIZE_MAX * 3 + 7
+		self._write("".join("G1X{}\n".format(i) for i in range(count)))
+		file_info = PrintingGcodeFileInformation(self.path)
+		file_info.start()
+		lines = self._read_all(file_info)
+		self.assertEqual(len(lines), count)
+		self.assertEqual(lines[-1], "G1X{}".format(count - 1))
+
+	def test_close_while_prefetching(self):
+		self._write("G1X1\n" * GcodePrefetcher.CHUNK_SIZE_MAX * (GcodePrefetcher.QUEUE_SIZE + 4))
+		file_info = PrintingGcodeFileInformation(self.path)
+		file_info.start()
+		reader = file_info._reader
+		self.assertEqual(file_info.getNext(), "G1X1")
+		file_info.close()
+		reader._thread.join(2)
+		self.assertFalse(reader._thread.is_alive())
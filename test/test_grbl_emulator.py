@@ -0,0 +1,47 @@
+import time
+import unittest
+
+import serial
+
+from octoprint_mrbeam.comm_acc2 import MachineCom
+from octoprint_mrbeam.util.grbl_emulator import GrblEmulator
+
+
+class GrblEmulatorTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.emulator = GrblEmulator(speed=10, baudrate=0)
+		self.serial = serial.Serial(self.emulator.start(), 115200, timeout=2)
+
+	def tearDown(self):
+		self.serial.close()
+		self.emulator.stop()
+
+	def _send(self, line):
+		self.serial.write(line)
+		return self.serial.readline().strip()
+
+	def test_alarm_lock(self):
+		self.assertTrue(self._send("\x18").startswith("Grbl 0.9g_20181116_a437781"))
+		self.assertEqual(self.serial.readline().strip(), "['$H'|'$X' to unlock]")
+		self.assertEqual(self._send("G0X10\n"), "error: Alarm lock")
+		self.assertEqual(self._send("$X\n"), "[Caution: Unlocked]")
+		self.assertEqual(self.serial.readline().strip(), "ok:127")
+		self.assertEqual(self._send("G0X10\n"), "ok:127")
+
+	def test_planner_timing_and_status(self):
+		self._send("$X\n")
+		self.serial.readline()
+		start = time.time()
+		# 10mm at 600mm/min take 1s, 0.1s at speed 10
+		self.assertEqual(self._send("G1X10F600S300M3\n"), "ok:127")
+		status = self._send("?")
+		match = MachineCom.pattern_grbl_status.match(status)
+		self.assertIsNotNone(match, status)
+		self.assertEqual((match.group('status'), match.group('laser_state')), ('Run', 'on'))
+		while not self.emulator.is_idle():
+			time.sleep(0.005)
+		self.assertAlmostEqual(time.time() - start, 0.1, delta=0.05)
+		match = MachineCom.pattern_grbl_status.match(self._send("?"))
+		self.assertEqual((match.group('status'), match.group('pos_x')), ('Idle', '10.000'))
+		self.assertEqual(self.emulator.get_stats()['blocks'], 1)
@@ -0,0 +1,70 @@
+import cStringIO
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from octoprint_mrbeam.gcodegenerator.image_store import ImageStore
+
+
+class ImageStoreTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self._dir = tempfile.mkdtemp()
+		self.store = ImageStore(os.path.join(self._dir, "images"))
+
+	def tearDown(self):
+		shutil.rmtree(self._dir)
+
+	def _get_png(self, color=128):
+		buf = cStringIO.StringIO()
+		Image.new('L', (20, 10), color).save(buf, 'PNG')
+		return buf.getvalue()
+
+	def test_add_data(self):
+		png = self._get_png()
+		image_id = self.store.add_data(png)
+		self.assertEqual(image_id, hashlib.sha256(png).hexdigest())
+		self.assertEqual(self.store.add_data(png), image_id)
+		self.assertEqual(self.store.get_stats()['entries'], 1)
+		path = self.store.get_image_path(image_id)
+		self.assertEqual(Image.open(path).size, (20, 10))
+		self.assertEqual(self.store.get_mimetype(path), 'image/png')
+
+	def test_add_uploaded_file(self):
+		upload = os.path.join(self._dir, "upload.tmp")
+		with open(upload, 'wb') as fh:
+			fh.write(self._get_png(0))
+		image_id = self.store.add_file(upload, move=True)
+		self.assertFalse(os.path.exists(upload))
+		self.assertIsNotNone(self.store.get_image_path(image_id))
+
+	def test_invalid_images_and_ids(self):
+		self.assertIsNone(self.store.add_data("<svg/>"))
+		self.assertEqual(self.store.get_stats()['entries'], 0)
+		self.assertIsNone(self.store.get_image_path("../../etc/passwd"))
+		self.assertIsNone(self.store.get_image_path("0" * 64))
+
+	def test_get_image_ids(self):
+		a, b = "a" * 64, "0123456789abcdef" * 4
+		svg = '<svg><image mb:image_id="{}"/><image mb:image_id = \'{}\'/><image mb:image_id="{}"/><image mb:image_id="x"/></svg>'.format(a, b, a)
+		self.assertEqual(self.store.get_image_ids(svg), set([a, b]))
+
+	def test_pinned_images_are_not_evicted(self):
+		first = self.store.add_data(self._get_png(0))
+		second = self.store.add_data(self._get_png(255))
+		self.store.pin([first])
+		self.store.pin([first])
+		self.store.max_size = 1
+		self.store.evict()
+		self.assertIsNotNone(self.store.get_image_path(first))
+		self.assertIsNone(self.store.get_image_path(second))
+		self.store.unpin([first])
+		self.store.evict()
+		self.assertIsNotNone(self.store.get_image_path(first))
+		self.store.unpin([first])
+		self.store.evict()
+		self.assertIsNone(self.store.get_image_path(first))
@@ -0,0 +1,125 @@
+import __builtin__
+import cStringIO
+import random
+import re
+import unittest
+
+import ddt
+import mock
+from PIL import Image
+
+from octoprint_mrbeam.gcodegenerator.img2gcode import ImageProcessor
+from octoprint_mrbeam.gcodegenerator.gcode_writer import GcodeWriter
+
+
+@ddt.ddt
+class ImageProcessorRasterEngineTestCase(unittest.TestCase):
+
+	def setUp(self):
+		plugin_mock = mock.MagicMock(name="_mrbeam_plugin_implementation")
+		plugin_mock._settings.get.return_value = False
+		self._plugin_patcher = mock.patch.object(__builtin__, '_mrbeam_plugin_implementation', plugin_mock, create=True)
+		self._plugin_patcher.start()
+
+	def tearDown(self):
+		self._plugin_patcher.stop()
+
+	def _get_test_image(self, w=120, h=80, seed=42):
+		# gradient with white gaps, noise and some fully white rows
+		rnd = random.Random(seed)
+		img = Image.new('L', (w, h), 'white')
+		pix = img.load()
+		for y in range(h):
+			if y % 17 == 0:
+				continue
+			for x in range(w):
+				if (x // 13) % 3 == 2:
+					continue
+				pix[x, y] = min(255, (x * 255) // w + rnd.randint(-20, 20)) if x % 7 else rnd.randint(0, 255)
+		return img
+
+	def _convert(self, engine, img, **kwargs):
+		params = dict(workingAreaWidth=500, workingAreaHeight=390, beam_diameter=0.1,
+		              intensity_black=1000, intensity_white=0, speed_black=500, speed_white=3000)
+		params.update(kwargs)
+		ip = ImageProcessor(raster_engine=engine, **params)
+		ip.debugPreprocessing = False
+		parts = ip.img_prepare(img, img.size[0] * ip.beam, img.size[1] * ip.beam)
+		return ip.generate_gcode(parts, 10.0, 20.0, img.size[0] * ip.beam, img.size[1] * ip.beam, "test")
+
+	@ddt.data(
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_PRECISE),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_FAST),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC, dithering=True),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC, pierce_time=10),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC, intensity_black=0, intensity_white=800),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC, overshoot_distance=1),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC, skip_redundant_words=False),
+		dict(engraving_mode=ImageProcessor.ENGRAVING_MODE_PRECISE, pierce_time=10, skip_redundant_words=False),
+	)
+	def test_numpy_engine_parity(self, kwargs):
+		img = self._get_test_image()
+		gc_pixel = self._convert(ImageProcessor.RASTER_ENGINE_PIXEL, img, **kwargs)
+		gc_numpy = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, **kwargs)
+		self.assertIn("G1", gc_pixel)
+		self.assertEqual(gc_pixel, gc_numpy)
+
+	def test_numpy_engine_parity_out_of_working_area(self):
+		img = self._get_test_image(w=40, h=40)
+		gc_pixel = self._convert(ImageProcessor.RASTER_ENGINE_PIXEL, img, workingAreaHeight=22, engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC)
+		gc_numpy = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, workingAreaHeight=22, engraving_mode=ImageProcessor.ENGRAVING_MODE_BASIC)
+		self.assertIn("out of working area", gc_pixel)
+		self.assertEqual(gc_pixel, gc_numpy)
+
+	def test_default_engine(self):
+		ip = ImageProcessor()
+		self.assertEqual(ip.raster_engine, ImageProcessor.RASTER_ENGINE_NUMPY)
+
+	def test_output_filehandle_and_writer(self):
+		img = self._get_test_image()
+		gc_string = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img)
+
+		fh = cStringIO.StringIO()
+		self.assertEqual(self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, output_filehandle=fh), "")
+		self.assertEqual(fh.getvalue(), gc_string)
+
+		writer = GcodeWriter(cStringIO.StringIO(), buffer_size=512)
+		self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, output_filehandle=writer)
+		writer.close()
+		self.assertEqual(writer.output_filehandle.getvalue(), gc_string)
+		self.assertEqual(writer.bytes_written, len(gc_string))
+		self.assertEqual(writer.lines_emitted, gc_string.count("\n"))
+		self.assertGreater(writer.flushes, 1)
+
+	def test_skip_redundant_words(self):
+		img = self._get_test_image()
+		gc_full = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, skip_redundant_words=False, pierce_time=10)
+		gc_compact = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, skip_redundant_words=True, pierce_time=10)
+		self.assertLess(len(gc_compact), len(gc_full))
+		self.assertEqual(self._get_modal_moves(gc_full), self._get_modal_moves(gc_compact))
+
+	def _get_modal_moves(self, gcode):
+		# (command, x, y, s, f) of every move with modal S and F resolved
+		moves = []
+		state = dict(X=None, Y=None, S=None, F=None)
+		regex = re.compile("([GXYSFMP])([0-9.-]+)")
+		for line in gcode.splitlines():
+			words = regex.findall(line.split(';')[0])
+			if len(words) == 0:
+				continue
+			for letter, value in words[1:]:
+				state[letter] = value
+			if words[0] == ('M', '3'):
+				state['S'] = words[1][1]
+			if words[0][0] == 'G':
+				moves.append((words[0][1], state['X'], state['Y'], state['S'], state['F']))
+		return moves
+
+	@ddt.data(ImageProcessor.ENGRAVING_MODE_PRECISE, ImageProcessor.ENGRAVING_MODE_FAST)
+	def test_parallel_parts_parity(self, engraving_mode):
+		img = self._get_test_image()
+		gc_serial = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, engraving_mode=engraving_mode)
+		gc_parallel = self._convert(ImageProcessor.RASTER_ENGINE_NUMPY, img, engraving_mode=engraving_mode, workers=3, parallel_min_pixels=0)
+		self.assertGreater(gc_serial.count("; Begin part"), 2)
+		self.assertEqual(gc_serial, gc_parallel)
@@ -0,0 +1,40 @@
+import unittest
+
+from octoprint_mrbeam.gcodegenerator.job_planner import JobPlanner
+
+
+class JobPlannerTestCase(unittest.TestCase):
+
+	def _add_rect(self, planner, name, x0, y0, x1, y1, engrave=False):
+		planner.add(name, [x0, y0], [x0, y0], (x0, y0, x1, y1), engrave=engrave, comment=name)
+
+	def test_engrave_before_cut_and_inner_before_outer(self):
+		planner = JobPlanner()
+		self._add_rect(planner, "outer", 0, 0, 100, 100)
+		self._add_rect(planner, "hole", 40, 40, 60, 60)
+		self._add_rect(planner, "hole_in_hole", 45, 45, 50, 50)
+		self._add_rect(planner, "engraving", 90, 90, 95, 95, engrave=True)
+		self._add_rect(planner, "other_part", 200, 0, 250, 50)
+		order = [u['gcode'] for u in planner.plan()]
+
+		self.assertEqual(order[0], "engraving")
+		self.assertLess(order.index("hole_in_hole"), order.index("hole"))
+		self.assertLess(order.index("hole"), order.index("outer"))
+		self.assertEqual(planner.stats['nesting_levels'], 3)
+		self.assertEqual(planner.stats['paths'], 5)
+
+	def test_travel_stats(self):
+		planner = JobPlanner(travel_speed=6000)
+		for i in range(20):
+			x = (i * 7 % 20) * 10.0
+			self._add_rect(planner, str(i), x, 0, x + 5, 5)
+		planner.plan()
+		self.assertGreater(planner.stats['saved'], 0)
+		self.assertAlmostEqual(planner.stats['time_saved'], planner.stats['saved'] / 100.0)
+		self.assertIn("saved", planner.pp())
+
+	def test_paths_without_coordinates_first(self):
+		planner = JobPlanner()
+		self._add_rect(planner, "rect", 10, 10, 20, 20)
+		planner.add("nothing", None, None, None)
+		self.assertEqual([u['gcode'] for u in planner.plan()], ["nothing", "rect"])
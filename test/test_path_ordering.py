@@ -0,0 +1,75 @@
+import random
+import unittest
+
+from octoprint_mrbeam.gcodegenerator import path_ordering
+
+
+class PathOrderingTestCase(unittest.TestCase):
+
+	def _get_items(self, count, seed=7):
+		rnd = random.Random(seed)
+		items = []
+		for i in range(count):
+			start = [rnd.uniform(0, 500), rnd.uniform(0, 390)]
+			if i % 3 == 0:
+				end = start # closed path
+			else:
+				end = [start[0] + rnd.uniform(-20, 20), start[1] + rnd.uniform(-20, 20)]
+			items.append((start, end))
+		return items
+
+	def _brute_force_nearest_neighbour(self, items, start):
+		left = range(len(items))
+		order = []
+		pos = start
+		while left:
+			i = min(left, key=lambda k: path_ordering.distance(pos, items[k][0]))
+			order.append(i)
+			left.remove(i)
+			pos = items[i][1]
+		return order
+
+	def test_nearest_neighbour_matches_brute_force(self):
+		items = self._get_items(400)
+		self.assertEqual(path_ordering.order_nearest_neighbour(items, (0, 0)),
+		                 self._brute_force_nearest_neighbour(items, (0, 0)))
+
+	def test_start_outside_of_points(self):
+		items = self._get_items(50)
+		self.assertEqual(path_ordering.order_nearest_neighbour(items, (-1000, 2000)),
+		                 self._brute_force_nearest_neighbour(items, (-1000, 2000)))
+
+	def test_order_paths(self):
+		items = self._get_items(300)
+		for two_opt in (False, True):
+			order, stats = path_ordering.order_paths(items, two_opt=two_opt)
+			self.assertEqual(sorted(order), range(len(items)))
+			self.assertEqual(stats['count'], len(items))
+			self.assertAlmostEqual(stats['after'], path_ordering.travel_distance(items, order))
+			self.assertLess(stats['after'], stats['before'] / 4)
+
+	def test_two_opt_does_not_increase_travel(self):
+		items = self._get_items(300, seed=3)
+		order = path_ordering.order_nearest_neighbour(items)
+		refined = path_ordering.refine_two_opt(items, order)
+		self.assertEqual(sorted(refined), range(len(items)))
+		self.assertLessEqual(path_ordering.travel_distance(items, refined), path_ordering.travel_distance(items, order))
+
+	def test_empty_and_duplicates(self):
+		self.assertEqual(path_ordering.order_paths([])[0], [])
+		items = [([1, 1], [2, 2])] * 5
+		self.assertEqual(sorted(path_ordering.order_paths(items)[0]), range(5))
+
+	def test_identical_points_far_away(self):
+		items = [([100.0, 100.0], [100.0, 100.0])] * 20
+		order, stats = path_ordering.order_paths(items, start=(-1e6, 1e6))
+		self.assertEqual(sorted(order), range(20))
+
+	def test_nesting_levels(self):
+		bboxes = [(0, 0, 100, 100),  # outer
+		          (10, 10, 20, 20),  # hole in outer
+		          (30, 30, 80, 80),  # part in outer with a hole
+		          (40, 40, 50, 50),  # hole in part
+		          (200, 0, 210, 10)]  # separate
+		self.assertEqual(path_ordering.get_nesting_levels(bboxes), [2, 0, 1, 0, 0])
+		self.assertEqual(path_ordering.get_nesting_levels([]), [])
@@ -0,0 +1,54 @@
+import unittest
+
+from lxml import etree
+
+from octoprint_mrbeam.gcodegenerator.svg_style import StyleResolver
+
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg">
+<defs><style>/* exported */ .cls-1{fill:none;stroke:#ff0000;stroke-width:0.5px} .cls-2, path.hidden{stroke:none;fill:none}</style></defs>
+<path id="css" class="cls-1" d="M0,0 L1,1"/>
+<path id="css_hidden" class="hidden" d="M0,0 L1,1"/>
+<path id="css_inline" class="cls-1" style="stroke:#00ff00" d="M0,0 L1,1"/>
+<path id="unknown_class" class="foo" d="M0,0 L1,1"/>
+<path id="attr" stroke="#0000ff" stroke-width="2" opacity="0.5" d="M0,0 L1,1"/>
+<path id="attr2" stroke="#0000ff" stroke-width="2" opacity="0.5" d="M1,1 L2,2"/>
+<path id="transparent" style="stroke:#000000;stroke-opacity:0" d="M0,0 L1,1"/>
+</svg>"""
+
+
+class StyleResolverTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.root = etree.fromstring(SVG)
+		self.resolver = StyleResolver(self.root)
+
+	def _resolve(self, id):
+		return self.resolver.resolve(self.root.find(".//*[@id='%s']" % id))
+
+	def test_css_classes(self):
+		style = self._resolve("css")
+		self.assertEqual(style.stroke['color'], "#ff0000")
+		self.assertEqual(style.stroke.width, 0.5)
+		self.assertEqual(style.fill.color, 'unset')
+		self.assertFalse(style.unresolved_classes)
+
+		hidden = self._resolve("css_hidden")
+		self.assertEqual(hidden.stroke.color, 'unset')
+		self.assertEqual(hidden.fill.color, 'unset')
+
+		self.assertEqual(self._resolve("css_inline").stroke.color, "#00ff00")
+		self.assertTrue(self._resolve("unknown_class").unresolved_classes)
+
+	def test_attributes(self):
+		style = self._resolve("attr")
+		self.assertEqual(style.stroke.color, "#0000ff")
+		self.assertEqual(style.stroke.width, 2.0)
+		self.assertTrue(style.stroke.visible)
+		self.assertFalse(self._resolve("transparent").stroke.visible)
+
+	def test_cache(self):
+		self.assertIs(self._resolve("attr"), self._resolve("attr2"))
+		self.assertEqual(self.resolver.hits, 1)
+		with self.assertRaises(AttributeError):
+			self._resolve("attr").stroke.color = "#000000"